@@ -3,10 +3,11 @@ from types import MethodType
 
 from calibre.constants import __version__
 
-from .lib.utils import uid, traceback_error
+from .lib.utils import traceback_error
 from .lib.config import get_config
 from .lib.encodings import encoding_list
-from .lib.cache import Paragraph, get_cache
+from .lib.cache import Paragraph, get_cache, cache_uid
+from .lib.memory import get_memory
 from .lib.translation import get_engine_class, get_translator, get_translation
 from .lib.element import get_element_handler
 from .lib.conversion import extract_item, extra_formats
@@ -98,10 +99,9 @@ class PreparationWorker(QObject):
         encoding = ''
         if self.ebook.encoding.lower() != 'utf-8':
             encoding = self.ebook.encoding.lower()
-        cache_id = uid(
-            input_path + self.engine_class.name + self.ebook.target_lang
-            + merge_length + encoding)
-        cache = get_cache(cache_id)
+        cache = get_cache(*cache_uid(
+            input_path, self.engine_class.name, self.ebook.target_lang,
+            merge_length, encoding))
 
         if cache.is_fresh() or not cache.is_persistence():
             self.progress_detail.emit(
@@ -147,10 +147,11 @@ class PreparationWorker(QObject):
                 return
             # --------------------------
             self.progress_message.emit(_('Preparing user interface...'))
-            cache.save(original_group)
+            rows = cache.save(original_group)
             self.progress.emit(100)
             d = time.time()
-            self.progress_detail.emit('cache timing: %s' % (d - c))
+            self.progress_detail.emit('cache timing: %s (%d rows/s)' % (
+                d - c, rows / max(d - c, 1e-6)))
             if self.canceled:
                 self.clean_cache(cache)
                 return
@@ -159,7 +160,7 @@ class PreparationWorker(QObject):
                 'Loading data from cache and preparing user interface...')
             time.sleep(0.1)
 
-        self.finished.emit(cache_id)
+        self.finished.emit(cache.identity)
         self.on_working = False
 
 
@@ -172,6 +173,7 @@ class TranslationWorker(QObject):
     # error = pyqtSignal(str, str, str)
     streaming = pyqtSignal(object)
     callback = pyqtSignal(object)
+    checkpoint = pyqtSignal(object)
 
     def __init__(self, engine_class, ebook):
         QObject.__init__(self)
@@ -217,8 +219,12 @@ class TranslationWorker(QObject):
             lambda text, error=False: self.logging.emit(text, error))
         translation.set_streaming(self.streaming.emit)
         translation.set_callback(self.callback.emit)
+        translation.set_checkpoint(self.checkpoint.emit)
         translation.set_cancel_request(self.cancel_request)
-        translation.handle(paragraphs)
+        try:
+            translation.handle(paragraphs)
+        finally:
+            translation.close()
         self.on_working = False
         self.finished.emit()
         if self.need_close:
@@ -334,6 +340,9 @@ class AdvancedTranslation(QDialog):
         # self.error = JobError(self)
         self.current_engine = get_engine_class()
         self.cache = None
+        self.memory = None
+        if self.config.get('memory_enabled'):
+            self.memory = get_memory()
         self.merge_enabled = False
 
         self.prgress_step = 0
@@ -377,6 +386,7 @@ class AdvancedTranslation(QDialog):
             if error else self.logging_text.appendPlainText(text))
 
         def working_finished():
+            self.cache.flush()
             if self.translate_all and not self.trans_worker.cancel_request():
                 failures = len(self.table.get_selected_paragraphs(True, True))
                 if failures > 0:
@@ -953,14 +963,39 @@ class AdvancedTranslation(QDialog):
         save_status = QLabel()
         save_button = QPushButton(_('&Save'))
         save_button.setDisabled(True)
+        suggestion_button = QPushButton()
+        suggestion_button.setVisible(False)
 
         status_indicator = TranslationStatus()
 
         control_layout.addWidget(status_indicator)
         control_layout.addStretch(1)
         control_layout.addWidget(save_status)
+        control_layout.addWidget(suggestion_button)
         control_layout.addWidget(save_button)
 
+        suggestion = []
+
+        def suggest_translation(paragraph):
+            """Offer the translation of the most similar original in the
+            translation memory for the paragraph not translated yet."""
+            suggestion_button.setVisible(False)
+            if self.memory is None or paragraph.translation:
+                return
+            match = self.memory.search(
+                self.current_engine.name, self.trans_worker.source_lang,
+                self.trans_worker.target_lang, paragraph.original,
+                self.config.get('memory_suggest_score'))
+            if match is None:
+                return
+            suggestion[:] = [match[2]]
+            suggestion_button.setText(
+                _('Use translation memory ({:.0%} similar)').format(match[0]))
+            suggestion_button.setVisible(True)
+        self.paragraph_sig.connect(suggest_translation)
+        suggestion_button.clicked.connect(
+            lambda: translation_text.setPlainText(suggestion[0]))
+
         layout.addWidget(splitter)
         layout.addWidget(control)
 
@@ -999,6 +1034,8 @@ class AdvancedTranslation(QDialog):
             self.cache.update_paragraph(paragraph)
             self.progress_bar.emit()
         self.trans_worker.callback.connect(translation_callback)
+        self.trans_worker.checkpoint.connect(
+            lambda paragraph: self.cache.checkpoint_paragraph(paragraph))
 
         def streaming_translation(data):
             if data == '':
@@ -1031,6 +1068,7 @@ class AdvancedTranslation(QDialog):
             paragraph.target_lang = self.ebook.target_lang
             self.table.row.emit(paragraph.row)
             self.cache.update_paragraph(paragraph)
+            self.cache.flush()
             translation_text.setFocus(Qt.OtherFocusReason)
             self.editor_worker.start[str].emit(
                 _('Your changes have been saved.'))
@@ -1139,4 +1177,6 @@ class AdvancedTranslation(QDialog):
                 self.cache.close()
             elif result == 0:
                 self.cache.destroy()
+        if self.memory is not None:
+            self.memory.close()
         QDialog.done(self, result)
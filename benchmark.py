@@ -0,0 +1,19 @@
+import sys
+from pkgutil import iter_modules
+from importlib import import_module
+
+
+def get_benchmarks(names=[]):
+    for module in iter_modules(['benchmarks']):
+        if not module.name.startswith('bench_'):
+            continue
+        if names and module.name[6:] not in names:
+            continue
+        yield import_module(
+            'calibre_plugins.ebook_translator.benchmarks.%s' % module.name)
+
+
+if __name__ == '__main__':
+    # Usage: calibre-customize -b .; calibre-debug benchmark.py [pool ...]
+    for benchmark in get_benchmarks(sys.argv[1:]):
+        benchmark.run()
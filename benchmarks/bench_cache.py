@@ -0,0 +1,75 @@
+"""Measure the loading of a cache of 50,000 paragraphs in rows per second,
+then the updates of the translations per second, committing each of them
+as before, with and without the write-ahead log, and writing them behind in
+batches.
+
+Usage: BENCHMARK_ROWS=50000 calibre-debug benchmark.py cache
+
+The other option is BENCHMARK_UPDATES, the updates measured in each mode.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+from ..lib.utils import sep, uid
+from ..lib.cache import TranslationCache, Paragraph
+
+from .bench_throughput import env_option
+
+
+def create_cache(directory, name, rows):
+    """Return the cache loaded with the rows and the rows per second."""
+    cache_class = type('BenchmarkCache', (TranslationCache,), {
+        'dir_path': directory,
+        'cache_path': os.path.join(directory, 'cache'),
+        'temp_path': os.path.join(directory, 'temp')})
+    cache = cache_class(name)
+    originals = [
+        (id, uid(str(id)), '<p>Paragraph %d</p>' % id, 'Paragraph %d' % id,
+         False, None, 'page%d.xhtml' % (id // 100))
+        for id in range(rows)]
+    start = time.time()
+    cache.save(originals)
+    return cache, rows / (time.time() - start)
+
+
+def measure(cache, updates, rows):
+    # Spread the updates over the whole cache.
+    step = max(1, rows // updates)
+    paragraphs = [Paragraph(id, None, None, None)
+                  for id in range(0, rows, step)[:updates]]
+    start = time.time()
+    for paragraph in paragraphs:
+        paragraph.translation = 'Translation of paragraph %d' % paragraph.id
+        paragraph.engine_name = 'DeepL'
+        paragraph.target_lang = 'German'
+        cache.update_paragraph(paragraph)
+    cache.done()
+    return len(paragraphs) / (time.time() - start)
+
+
+def run(rows=env_option('rows', 50000), updates=env_option('updates', 5000)):
+    directory = tempfile.mkdtemp()
+    try:
+        print(sep())
+        print('Cache: %s rows, %s updates' % (rows, updates))
+        print(sep('┈'))
+        cache, rate = create_cache(directory, 'load', rows)
+        print('%-31s %10.1f rows/s' % ('load:', rate))
+        cache.close()
+        for name, journal_mode, synchronous, flush_size in (
+                ('commit each, rollback journal', 'DELETE', 'FULL', 1),
+                ('commit each, write-ahead log', 'WAL', 'NORMAL', 1),
+                ('write-behind, write-ahead log', 'WAL', 'NORMAL', None)):
+            cache, _rate = create_cache(directory, str(flush_size), rows)
+            cache.cursor.execute('PRAGMA journal_mode=%s' % journal_mode)
+            cache.cursor.execute('PRAGMA synchronous=%s' % synchronous)
+            if flush_size is not None:
+                cache.flush_size = flush_size
+            rate = measure(cache, updates, rows)
+            print('%-31s %10.1f updates/s' % (name + ':', rate))
+            cache.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import random
+import string
+import tempfile
+from itertools import accumulate
+
+from ..lib.utils import sep
+from ..lib.memory import TranslationMemory
+
+from .bench_throughput import env_option
+
+
+languages = ('DeepL', 'English', 'German')
+
+
+class TextGenerator:
+    """Sentences of a large vocabulary, whose words are used as often as
+    in real texts, so that the unrelated ones share few n-grams."""
+    def __init__(self, seed=0, size=20000):
+        self.random = random.Random(seed)
+        self.words = ['the', 'of', 'and', 'a', 'to', 'in', 'was', 'he'] + [
+            ''.join(self.random.choice(string.ascii_lowercase)
+                    for _ in range(self.random.randint(3, 10)))
+            for _ in range(size)]
+        self.weights = list(accumulate(
+            1.0 / rank for rank in range(1, len(self.words) + 1)))
+
+    def sentence(self):
+        words = self.random.choices(
+            self.words, cum_weights=self.weights,
+            k=self.random.randint(6, 24))
+        return ' '.join(words).capitalize() + '.'
+
+    def paragraph(self):
+        return ' '.join(
+            self.sentence() for _ in range(self.random.randint(1, 2)))
+
+
+def percentiles(durations):
+    durations = sorted(durations)
+    return [durations[int(len(durations) * share) - 1] * 1000
+            for share in (0.5, 0.99)]
+
+
+def edit(text, generator):
+    """A near-duplicate of the text, as in another edition of the book."""
+    index = generator.random.randrange(len(text))
+    return text[:index] + generator.random.choice(',;.!') + text[index + 1:]
+
+
+def measure(lookup, texts):
+    durations = []
+    results = 0
+    for text in texts:
+        start = time.time()
+        results += lookup(text) is not None
+        durations.append(time.time() - start)
+    return percentiles(durations) + [results]
+
+
+def run(entries=env_option('entries', 1000000), lookups=1000,
+        chunk_size=10000):
+    directory = tempfile.mkdtemp()
+    try:
+        memory = TranslationMemory(os.path.join(directory, 'memory.db'))
+        generator = TextGenerator()
+        print(sep())
+        print('Translation memory: %s entries' % entries)
+        print(sep('┈'))
+        samples = []
+        start = time.time()
+        for offset in range(0, entries, chunk_size):
+            items = []
+            for _ in range(min(chunk_size, entries - offset)):
+                text = generator.paragraph()
+                items.append((text, text.upper()))
+            samples.extend(random.sample(items, min(len(items), lookups)))
+            memory.memorize_many(*languages, items=items)
+        elapsed = time.time() - start
+        print('fill:    %9.1f entries/s, %.1f MB' % (
+            entries / elapsed, os.path.getsize(memory.file_path) / 1048576.))
+
+        samples = random.sample(samples, min(len(samples), lookups))
+        similar = [edit(text, generator) for text, _translation in samples]
+        unrelated = [generator.paragraph()
+                     for _ in range(lookups)]
+        for name, lookup, texts in (
+                ('exact', lambda text: memory.recall(
+                    *languages, texts=[text])[0],
+                 [text for text, _translation in samples]),
+                ('similar', lambda text: memory.search(
+                    *languages, text=text, score=0.8), similar),
+                ('unrelated', lambda text: memory.search(
+                    *languages, text=text, score=0.8), unrelated)):
+            p50, p99, found = measure(lookup, texts)
+            print('%-8s p50 %.3f ms  p99 %.3f ms  found %s of %s' % (
+                name + ':', p50, p99, found, len(texts)))
+        memory.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
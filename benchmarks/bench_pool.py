@@ -0,0 +1,58 @@
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mechanize import Browser, Request
+
+from ..engines.base import Base
+from ..lib.utils import sep
+
+from .server import StubServer
+
+
+class StubTranslate(Base):
+    name = 'Stub'
+    need_api_key = False
+
+
+def legacy_request(url, data, timeout):
+    """The previous behavior: a new browser and connection per request."""
+    br = Browser()
+    br.set_handle_robots(False)
+    br.set_ca_data(
+        context=ssl._create_unverified_context(cert_reqs=ssl.CERT_NONE))
+    br.open(Request(url, data, timeout=timeout, method='POST'))
+    return br.response().read().decode('utf-8').strip()
+
+
+def measure(send, total, concurrency):
+    start = time.time()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for result in executor.map(lambda _: send(), range(total)):
+            assert 'translation' in result
+    return total / (time.time() - start)
+
+
+def run(total=1000, concurrency=(1, 4, 16)):
+    with StubServer() as server:
+        url = server.url + '/translate'
+        data = '{"text": "Hello World!"}'
+        print(sep())
+        print('Connection pool: %s requests to %s' % (total, server.url))
+        print(sep('┈'))
+        for workers in concurrency:
+            translator = StubTranslate()
+            translator.pool_host_limit = workers
+            before = measure(
+                lambda: legacy_request(
+                    url, data, translator.request_timeout),
+                total, workers)
+            after = measure(
+                lambda: translator.get_result(url, data, method='POST'),
+                total, workers)
+            pool = translator.get_connection_pool()
+            print('workers=%-3s before: %8.1f req/s  after: %8.1f req/s  '
+                  '(x%.1f, %s connections opened)' % (
+                      workers, before, after, after / before, pool.created))
+            pool.close()
+            pool.created = pool.reused = 0
@@ -0,0 +1,402 @@
+"""Run the stages of the conversion of synthetic books against the mock
+server, reporting the time of each stage, the paragraphs per second and the
+peak memory, which are also saved as JSON to compare between releases.
+
+Usage: BENCHMARK_SIZES=1000,200000 calibre-debug benchmark.py throughput
+
+The other options are BENCHMARK_FORMATS (epub, srt, pgn), BENCHMARK_ENGINE,
+BENCHMARK_CONCURRENCY, BENCHMARK_MERGE_LENGTH and BENCHMARK_OUTPUT.
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import shutil
+import zipfile
+import platform
+import tempfile
+from datetime import datetime
+from collections import OrderedDict, namedtuple
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from lxml import etree
+
+from .. import EbookTranslator
+from ..engines import builtin_engines
+from ..lib.utils import sep
+from ..lib.cache import TranslationCache
+from ..lib.element import (
+    Extraction, ElementHandler, ElementHandlerMerge, get_srt_elements,
+    get_pgn_elements)
+from ..lib.translation import Translation, Glossary
+from ..lib.conversion import output_srt, output_pgn
+
+from .mock_server import MockServer
+
+
+Page = namedtuple('Page', ('id', 'href', 'data'))
+
+words = (
+    'the', 'of', 'and', 'a', 'to', 'in', 'was', 'he', 'she', 'it', 'that',
+    'his', 'her', 'with', 'for', 'had', 'on', 'at', 'by', 'not', 'from',
+    'river', 'house', 'morning', 'letter', 'window', 'garden', 'village',
+    'silence', 'journey', 'captain', 'winter', 'promise', 'shadow', 'stone',
+    'walked', 'answered', 'remembered', 'waited', 'opened', 'carried',
+    'quietly', 'suddenly', 'never', 'always', 'almost', 'together', 'again',
+    'old', 'long', 'small', 'bright', 'cold', 'strange', 'empty', 'distant')
+
+page_template = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml" lang="en">'
+    '<head><title>Chapter {0}</title></head><body>'
+    '<h2>Chapter {0}</h2>{1}</body></html>')
+
+container = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<container version="1.0" '
+    'xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+    '<rootfiles><rootfile full-path="OEBPS/content.opf" '
+    'media-type="application/oebps-package+xml"/></rootfiles></container>')
+
+package_template = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<package xmlns="http://www.idpf.org/2007/opf" version="2.0" '
+    'unique-identifier="id"><metadata '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    '<dc:title>Benchmark</dc:title><dc:language>en</dc:language>'
+    '<dc:identifier id="id">benchmark</dc:identifier></metadata>'
+    '<manifest>{}</manifest><spine>{}</spine></package>')
+
+
+def env_option(name, default):
+    value = os.environ.get('BENCHMARK_%s' % name.upper())
+    if not value:
+        return default
+    if isinstance(default, (list, tuple)):
+        return type(default)(
+            type(default[0])(item.strip()) for item in value.split(','))
+    return type(default)(value)
+
+
+def peak_rss():
+    """The peak resident memory of the process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS reports bytes.
+    return round(peak / (1024.0 ** (2 if sys.platform == 'darwin' else 1)), 1)
+
+
+class TextGenerator:
+    """Deterministic text with a share of repeated paragraphs, as there are
+    in real books."""
+    def __init__(self, seed=0, repeat=0.05):
+        self.random = random.Random(seed)
+        self.repeat = repeat
+        self.history = []
+
+    def sentence(self, low=6, high=24):
+        count = self.random.randint(low, high)
+        text = ' '.join(self.random.choice(words) for _ in range(count))
+        return text[0].upper() + text[1:] + '.'
+
+    def paragraph(self, low=1, high=4):
+        if self.history and self.random.random() < self.repeat:
+            return self.random.choice(self.history)
+        text = ' '.join(
+            self.sentence() for _ in range(self.random.randint(low, high)))
+        self.history = self.history[-99:] + [text]
+        return text
+
+    def inline(self):
+        """A paragraph with the markup which is reserved or kept."""
+        parts = self.paragraph().split(' ')
+        for _ in range(self.random.randint(0, 3)):
+            markup = self.random.choice((
+                '<img src="../images/figure.png" alt=""/>',
+                '<sup><a href="#note">%s</a></sup>' % self.random.randint(
+                    1, 99),
+                '<code>value_%s</code>' % self.random.randint(1, 99),
+                '<em>%s</em>' % self.random.choice(words),
+                '<strong>%s</strong>' % self.random.choice(words),
+                '<br/>'))
+            parts.insert(self.random.randint(1, len(parts)), markup)
+        return ' '.join(parts)
+
+    def block(self):
+        """Return the markup of a block and the paragraphs in it."""
+        kind = self.random.random()
+        if kind < 0.06:
+            return '<h3>%s</h3>' % self.sentence(2, 6)[:-1], 1
+        if kind < 0.14:
+            items = ['<li>%s</li>' % self.sentence() for _ in range(2)]
+            return ('<ul><li>%s<ul>%s</ul></li><li>%s</li></ul>' % (
+                self.sentence(), ''.join(items), self.sentence()), 2)
+        if kind < 0.20:
+            rows = ''.join(
+                '<tr><td>%s</td><td>%s</td></tr>' % (
+                    self.sentence(1, 4), self.sentence(3, 10))
+                for _ in range(2))
+            return ('<table><tr><th>%s</th><th>%s</th></tr>%s</table>' % (
+                self.sentence(1, 2), self.sentence(1, 2), rows), 6)
+        if kind < 0.22:
+            return '<pre><code>print("%s")</code></pre>' % \
+                self.random.choice(words), 0
+        return '<p>%s</p>' % self.inline(), 1
+
+
+def create_epub(path, size, seed=0, page_size=200):
+    generator = TextGenerator(seed)
+    pages = []
+    count = 0
+    while count < size:
+        blocks = []
+        while count < size and len(blocks) < page_size:
+            block, paragraphs = generator.block()
+            blocks.append(block)
+            count += paragraphs
+        pages.append(page_template.format(len(pages) + 1, ''.join(blocks)))
+    manifest = '<item id="figure" href="images/figure.png" ' \
+        'media-type="image/png"/>'
+    spine = ''
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        epub.writestr(
+            'mimetype', 'application/epub+zip', zipfile.ZIP_STORED)
+        epub.writestr('META-INF/container.xml', container)
+        for number, page in enumerate(pages, 1):
+            href = 'text/chapter_%04d.xhtml' % number
+            epub.writestr('OEBPS/' + href, page)
+            manifest += '<item id="chapter_%04d" href="%s" ' \
+                'media-type="application/xhtml+xml"/>' % (number, href)
+            spine += '<itemref idref="chapter_%04d"/>' % number
+        epub.writestr('OEBPS/images/figure.png', b'\x89PNG\r\n\x1a\n')
+        epub.writestr(
+            'OEBPS/content.opf', package_template.format(manifest, spine))
+
+
+def create_srt(path, size, seed=0):
+    generator = TextGenerator(seed)
+    cues = []
+    for number in range(1, size + 1):
+        start = number * 3000
+        lines = [generator.sentence(3, 9)
+                 for _ in range(generator.random.randint(1, 2))]
+        cues.append('%d\n%s --> %s\n%s' % (
+            number, timestamp(start), timestamp(start + 2500),
+            '\n'.join(lines)))
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n\n'.join(cues) + '\n')
+
+
+def timestamp(milliseconds):
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%02d:%02d:%02d,%03d' % (hours, minutes, seconds, milliseconds)
+
+
+def create_pgn(path, size, seed=0, comments=20):
+    generator = TextGenerator(seed)
+    games = []
+    count = 0
+    while count < size:
+        moves = []
+        for number in range(1, comments + 1):
+            moves.append('%d. e4 e5' % number)
+            if count < size:
+                moves.append('{%s}' % generator.sentence(4, 16))
+                count += 1
+        games.append(
+            '[Event "Benchmark"]\n[Round "%d"]\n[Result "*"]\n\n%s *' % (
+                len(games) + 1, ' '.join(moves)))
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n\n'.join(games) + '\n')
+
+
+def extract_epub(path):
+    """Stand in for the input plugin of Calibre, which is not measured,
+    handing over the parsed pages to the extraction of the elements."""
+    pages = []
+    with zipfile.ZipFile(path) as epub:
+        for name in epub.namelist():
+            if name.endswith('.xhtml'):
+                href = name[len('OEBPS/'):]
+                pages.append(Page(
+                    os.path.basename(href), href,
+                    etree.fromstring(epub.read(name))))
+    extraction = Extraction(pages, [], 'normal', 'text', [], [])
+    return pages, list(extraction.get_elements())
+
+
+def output_epub(pages, input_path, output_path):
+    pages = dict(('OEBPS/' + page.href, page.data) for page in pages)
+    with zipfile.ZipFile(input_path) as original, \
+            zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        for item in original.infolist():
+            page = pages.get(item.filename)
+            if page is None:
+                epub.writestr(item, original.read(item.filename))
+                continue
+            epub.writestr(item.filename, etree.tostring(
+                page, encoding='utf-8', xml_declaration=True))
+
+
+formats = {
+    'epub': create_epub,
+    'srt': create_srt,
+    'pgn': create_pgn,
+}
+
+
+def timed(stages, name, function, *args):
+    start = time.time()
+    result = function(*args)
+    stages[name] = round(time.time() - start, 3)
+    return result
+
+
+def create_translator(server, engine, concurrency):
+    engine_class = dict(
+        (engine_class.name, engine_class) for engine_class in builtin_engines
+    ).get(engine)
+    if engine_class is None:
+        raise Exception('Unknown engine: %s' % engine)
+    api_key = 'id|secret' if engine_class.api_key_pattern else 'key'
+    engine_class.set_config({
+        'api_keys': [api_key], 'concurrency_limit': concurrency,
+        'request_interval': 0, 'request_rate': 0, 'char_rate': 0,
+        'token_rate': 0, 'stream': False})
+    translator = server.point(engine_class())
+    translator.set_source_lang('English')
+    translator.set_target_lang('German')
+    return translator
+
+
+def measure(server, directory, format, size, engine, concurrency,
+            merge_length):
+    input_path = os.path.join(directory, 'input.%s' % format)
+    output_path = os.path.join(directory, 'output.%s' % format)
+    formats.get(format)(input_path, size)
+
+    translator = create_translator(server, engine, concurrency)
+    if merge_length > 0:
+        handler = ElementHandlerMerge(
+            translator.placeholder, translator.separator, 'below')
+        handler.set_merge_length(merge_length)
+    else:
+        handler = ElementHandler(
+            translator.placeholder, translator.separator, 'below')
+    handler.set_translation_lang(translator.get_iso639_target_code('German'))
+    handler.load_remove_rules()
+    handler.load_reserve_rules()
+
+    cache_class = type('BenchmarkCache', (TranslationCache,), {
+        'dir_path': directory,
+        'cache_path': os.path.join(directory, 'cache'),
+        'temp_path': os.path.join(directory, 'temp')})
+    cache = cache_class('%s_%s' % (format, size))
+
+    translation = Translation(translator, Glossary(translator.placeholder))
+    translation.set_batch(True)
+    translation.set_callback(cache.update_paragraph)
+    translation.set_checkpoint(cache.checkpoint_paragraph)
+
+    gc.collect()
+    requests = sum(server.requests.values())
+    stages = OrderedDict()
+    start = time.time()
+    if format == 'epub':
+        pages, elements = timed(
+            stages, 'extraction', extract_epub, input_path)
+    elif format == 'srt':
+        elements = timed(
+            stages, 'extraction', get_srt_elements, input_path, 'utf-8')
+    else:
+        elements = timed(
+            stages, 'extraction', get_pgn_elements, input_path, 'utf-8')
+    originals = timed(
+        stages, 'prepare_original', handler.prepare_original, elements)
+
+    def save():
+        cache.save(originals)
+        return cache.all_paragraphs()
+    paragraphs = timed(stages, 'cache_save', save)
+    timed(stages, 'translation', translation.handle, paragraphs)
+    timed(stages, 'add_translations', handler.add_translations, paragraphs)
+    if format == 'epub':
+        timed(stages, 'output', output_epub, pages, input_path, output_path)
+    elif format == 'srt':
+        timed(stages, 'output', output_srt, elements, output_path)
+    else:
+        timed(stages, 'output', output_pgn, elements, input_path,
+              output_path, 'utf-8')
+    total = time.time() - start
+    cache.destroy()
+
+    return OrderedDict((
+        ('format', format),
+        ('size', size),
+        ('elements', len(elements)),
+        ('paragraphs', len(paragraphs)),
+        ('characters', sum(len(p.original) for p in paragraphs)),
+        ('translated', len(
+            [p for p in paragraphs if p.translation is not None])),
+        ('requests', sum(server.requests.values()) - requests),
+        ('stages', stages),
+        ('total', round(total, 3)),
+        ('paragraphs_per_second', round(len(paragraphs) / total, 1)),
+        ('peak_rss_mb', peak_rss()),
+    ))
+
+
+def run(sizes=env_option('sizes', (1000, 10000)),
+        formats=env_option('formats', ('epub', 'srt', 'pgn')),
+        engine=env_option('engine', 'DeepL'),
+        concurrency=env_option('concurrency', 16),
+        merge_length=env_option('merge_length', 0),
+        output=env_option('output', 'benchmark_throughput.json')):
+    report = OrderedDict((
+        ('date', datetime.now().isoformat()),
+        ('plugin_version', EbookTranslator.__version__),
+        ('python_version', platform.python_version()),
+        ('platform', platform.platform()),
+        ('engine', engine),
+        ('concurrency', concurrency),
+        ('merge_length', merge_length),
+        ('results', []),
+    ))
+    print(sep())
+    print('Throughput: %s paragraphs of %s with %s' % (
+        ', '.join(map(str, sizes)), ', '.join(formats), engine))
+    print(sep('┈'))
+    directory = tempfile.mkdtemp()
+    try:
+        with MockServer(secure=False) as server:
+            # The peak memory only grows, so the smaller books go first.
+            for size in sorted(sizes):
+                for format in formats:
+                    result = measure(
+                        server, directory, format, size, engine,
+                        concurrency, merge_length)
+                    report['results'].append(result)
+                    print('%-4s %7s paragraphs %9.1f paragraphs/s '
+                          'peak RSS %s MB' % (
+                              format, result['paragraphs'],
+                              result['paragraphs_per_second'],
+                              result['peak_rss_mb']))
+                    print('     ' + '  '.join(
+                        '%s: %.3fs' % stage
+                        for stage in result['stages'].items()))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(sep('┈'))
+    print('The results were saved to %s' % os.path.abspath(output))
@@ -0,0 +1,469 @@
+import re
+import json
+import math
+import time
+import base64
+import random
+import threading
+from collections import Counter
+
+try:
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    from urlparse import urlsplit, parse_qs
+
+from .server import StubServer, StubRequestHandler
+
+
+def fixed(seconds):
+    return lambda: seconds
+
+
+def uniform(low, high):
+    return lambda: random.uniform(low, high)
+
+
+def lognormal(median, sigma=0.5):
+    """A long-tailed latency, which is what the APIs of the engines show."""
+    return lambda: random.lognormvariate(math.log(median), sigma)
+
+
+def mark(text):
+    """Stand in for a translation, keeping the placeholders, the separators
+    and the surrounding spaces as they are."""
+    return re.sub(r'(\S(?:.*\S)?)', r'[mock] \1', text)
+
+
+class MockError(Exception):
+    def __init__(self, status, body, headers={}):
+        Exception.__init__(self, status)
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+
+class MockRequest:
+    def __init__(self, handler):
+        url = urlsplit(handler.path)
+        self.method = handler.command
+        self.path = url.path
+        self.query = parse_qs(url.query)
+        self.headers = handler.headers
+        length = int(handler.headers.get('Content-Length') or 0)
+        self.body = handler.rfile.read(length) if length > 0 else b''
+
+    @property
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+    @property
+    def form(self):
+        return parse_qs(self.body.decode('utf-8'))
+
+    def params(self, name):
+        """The values of the parameter in the query or the form data."""
+        values = self.query.get(name, [])
+        if 'json' not in self.headers.get('Content-Type', ''):
+            values = values + self.form.get(name, [])
+        return values
+
+    def param(self, name):
+        values = self.params(name)
+        return values[0] if values else None
+
+    def bearer(self):
+        value = self.headers.get('Authorization') or ''
+        return value[7:] if value.lower().startswith('bearer ') else None
+
+
+class MockRequestHandler(StubRequestHandler):
+    """Answer the requests of the built-in engines in their own formats. The
+    routes are matched in order against the end of the path, as the
+    endpoints are rebased onto the server."""
+    routes = [
+        (r'/translate_a/single$', 'google_free'),
+        (r'/language/translate/v2$', 'google_basic'),
+        (r'/v3/projects/[^/]+:translateText$', 'google_advanced'),
+        (r'/models/[^/]+:(stream)?[gG]enerateContent$', 'gemini'),
+        (r'/v2/translate$', 'deepl'),
+        (r'/v2/usage$', 'deepl_usage'),
+        (r'/jsonrpc$', 'deepl_free'),
+        (r'/api/trans/vip/translate$', 'baidu'),
+        (r'/translate/auth$', 'edge_auth'),
+        (r'/translate$', 'edge'),
+        (r'/chat/completions$', 'openai'),
+        (r'/v1/messages$', 'claude'),
+        (r'/api$', 'youdao'),
+        (r'/nmt/v1/translation$', 'papago'),
+    ]
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def respond(self):
+        request = MockRequest(self)
+        for pattern, name in self.routes:
+            if re.search(pattern, request.path):
+                break
+        else:
+            name = None
+        self.mock.count('requests', name)
+        delay = self.mock.latency()
+        delay > 0 and time.sleep(delay)
+        try:
+            if name is None:
+                raise MockError(404, {'error': 'Not Found'})
+            failure = self.mock.inject()
+            if failure == 'timeout':
+                # Hold the request until the client gives up.
+                time.sleep(self.mock.hang)
+                self.close_connection = True
+                return
+            if isinstance(failure, int):
+                headers = {}
+                if failure == 429 and self.mock.retry_after is not None:
+                    headers['Retry-After'] = str(self.mock.retry_after)
+                raise MockError(failure, {'error': {
+                    'code': failure, 'message': 'Injected error.'}}, headers)
+            getattr(self, 'route_%s' % name)(request, failure == 'break')
+        except MockError as e:
+            self.send(e.status, e.body, headers=e.headers)
+
+    do_GET = do_POST = respond
+
+    def send(self, status, body, content_type='application/json',
+             headers={}):
+        self.mock.count('statuses', status)
+        if not isinstance(body, bytes):
+            if not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, chunks, broken=False,
+                    content_type='text/event-stream'):
+        """Send the chunks as they are generated. A broken stream stops
+        halfway without its end, as a lost connection does."""
+        self.mock.count('statuses', 200)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunks = [chunk.encode('utf-8') for chunk in chunks]
+        if broken:
+            chunks = chunks[:len(chunks) // 2]
+        for index, chunk in enumerate(chunks):
+            index > 0 and self.mock.token_delay > 0 and \
+                time.sleep(self.mock.token_delay)
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.flush()
+        if broken:
+            self.close_connection = True
+            return
+        self.wfile.write(b'0\r\n\r\n')
+
+    def split(self, text):
+        size = self.mock.token_size
+        return [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+    def translate_content(self, content):
+        """Translate the content of an LLM, which is either a text or texts
+        packed into a JSON object."""
+        try:
+            texts = json.loads(content)
+        except Exception:
+            texts = None
+        if isinstance(texts, dict):
+            return json.dumps(dict(
+                (key, self.mock.translate(value))
+                for key, value in texts.items()), ensure_ascii=False)
+        return self.mock.translate(content)
+
+    def route_google_free(self, request, broken):
+        texts = [request.param('q') or '']
+        self.mock.charge(None, texts)
+        self.send(200, {'sentences': [
+            {'trans': self.mock.translate(texts[0]), 'orig': texts[0]}]})
+
+    def route_google_basic(self, request, broken):
+        if 'json' in request.headers.get('Content-Type', ''):
+            data = request.json
+            key, texts = request.bearer(), data.get('q')
+        else:
+            key, texts = request.param('key'), request.params('q')
+        texts = texts if isinstance(texts, list) else [texts]
+        self.mock.charge(key, texts, 403, {'error': {
+            'code': 403, 'message': 'Quota exceeded.'}})
+        self.send(200, {'data': {'translations': [
+            {'translatedText': self.mock.translate(text)}
+            for text in texts]}})
+
+    def route_google_advanced(self, request, broken):
+        texts = request.json.get('contents')
+        self.mock.charge(request.bearer(), texts, 403, {'error': {
+            'code': 403, 'message': 'Quota exceeded.'}})
+        self.send(200, {'translations': [
+            {'translatedText': self.mock.translate(text)}
+            for text in texts]})
+
+    def route_gemini(self, request, broken):
+        prompt = request.json['contents'][0]['parts'][0]['text']
+        text = prompt.split('Start translating: ', 1)[-1]
+        self.mock.charge(request.param('key'), [text], 429, {'error': {
+            'code': 429, 'message': 'Resource has been exhausted.',
+            'status': 'RESOURCE_EXHAUSTED'}})
+        translation = self.translate_content(text)
+
+        def item(text):
+            return {'candidates': [{'content': {
+                'role': 'model', 'parts': [{'text': text}]}}]}
+        if 'streamGenerateContent' not in request.path:
+            return self.send(200, item(translation))
+        items = [json.dumps(item(part), ensure_ascii=False)
+                 for part in self.split(translation)]
+        chunks = ['[' + items[0]] + [',\r\n' + i for i in items[1:]] + [']']
+        self.send_stream(chunks, broken, 'application/json')
+
+    def route_deepl(self, request, broken):
+        key = (request.headers.get('Authorization') or '')[15:] or None
+        if 'json' in request.headers.get('Content-Type', ''):
+            texts = request.json.get('text')
+        else:
+            texts = request.params('text')
+        texts = texts if isinstance(texts, list) else [texts]
+        self.mock.charge(
+            key, texts, 456, {'message': 'Quota exceeded'})
+        self.send(200, {'translations': [
+            {'detected_source_language': 'EN',
+             'text': self.mock.translate(text)} for text in texts]})
+
+    def route_deepl_usage(self, request, broken):
+        key = (request.headers.get('Authorization') or '')[15:] or None
+        used, limit = self.mock.get_usage(key)
+        self.send(200, {'character_count': used, 'character_limit': limit})
+
+    def route_deepl_free(self, request, broken):
+        data = request.json
+        texts = [text['text'] for text in data['params']['texts']]
+        self.mock.charge(None, texts)
+        self.send(200, {'jsonrpc': '2.0', 'id': data.get('id'), 'result': {
+            'texts': [{'text': self.mock.translate(text)}
+                      for text in texts]}})
+
+    def route_edge_auth(self, request, broken):
+        self.send(200, self.mock.issue_token(), 'text/plain')
+
+    def route_edge(self, request, broken):
+        if not self.mock.is_valid_token(request.bearer()):
+            raise MockError(401, {'error': {
+                'code': 401000, 'message': 'The request is not authorized.'}})
+        texts = [item['text'] for item in request.json]
+        self.mock.charge(None, texts)
+        self.send(200, [{'translations': [
+            {'text': self.mock.translate(text),
+             'to': request.param('to')}]} for text in texts])
+
+    def route_openai(self, request, broken):
+        data = request.json
+        key = request.bearer() or request.headers.get('api-key')
+        content = data['messages'][-1]['content']
+        self.mock.charge(key, [content], 429, {'error': {
+            'message': 'You exceeded your current quota.',
+            'type': 'insufficient_quota', 'code': 'insufficient_quota'}})
+        translation = self.translate_content(content)
+        if not data.get('stream'):
+            return self.send(200, {
+                'object': 'chat.completion', 'model': data.get('model'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {
+                    'role': 'assistant', 'content': translation}}]})
+
+        def event(delta, finish_reason=None):
+            return 'data: %s\n\n' % json.dumps({
+                'object': 'chat.completion.chunk', 'choices': [{
+                    'index': 0, 'delta': delta,
+                    'finish_reason': finish_reason}]}, ensure_ascii=False)
+        chunks = [event({'role': 'assistant', 'content': ''})]
+        chunks.extend(
+            event({'content': part}) for part in self.split(translation))
+        chunks.extend([event({}, 'stop'), 'data: [DONE]\n\n'])
+        self.send_stream(chunks, broken)
+
+    def route_claude(self, request, broken):
+        data = request.json
+        content = data['messages'][-1]['content']
+        self.mock.charge(
+            request.headers.get('x-api-key'), [content], 403, {
+                'type': 'error', 'error': {
+                    'type': 'permission_error',
+                    'message': 'Your credit balance is too low.'}})
+        translation = self.translate_content(content)
+        if not data.get('stream'):
+            return self.send(200, {
+                'type': 'message', 'role': 'assistant',
+                'model': data.get('model'), 'stop_reason': 'end_turn',
+                'content': [{'type': 'text', 'text': translation}]})
+
+        def event(name, data):
+            return 'event: %s\ndata: %s\n\n' % (
+                name, json.dumps(data, ensure_ascii=False))
+        chunks = [
+            event('message_start', {'type': 'message_start', 'message': {
+                'role': 'assistant', 'content': []}}),
+            event('content_block_start', {
+                'type': 'content_block_start', 'index': 0,
+                'content_block': {'type': 'text', 'text': ''}}),
+            event('ping', {'type': 'ping'})]
+        chunks.extend(event('content_block_delta', {
+            'type': 'content_block_delta', 'index': 0,
+            'delta': {'type': 'text_delta', 'text': part}})
+            for part in self.split(translation))
+        chunks.extend([
+            event('content_block_stop', {
+                'type': 'content_block_stop', 'index': 0}),
+            event('message_delta', {
+                'type': 'message_delta',
+                'delta': {'stop_reason': 'end_turn'}}),
+            event('message_stop', {'type': 'message_stop'})])
+        self.send_stream(chunks, broken)
+
+    def route_youdao(self, request, broken):
+        text = request.param('q') or ''
+        # Youdao reports errors in the body with the status of 200.
+        self.mock.charge(
+            request.param('appKey'), [text], 200, {'errorCode': '401'})
+        self.send(200, {
+            'errorCode': '0', 'query': text,
+            'translation': [self.mock.translate(text)]})
+
+    def route_baidu(self, request, broken):
+        text = request.param('q') or ''
+        self.mock.charge(request.param('appid'), [text], 200, {
+            'error_code': '54004',
+            'error_msg': 'Please recharge your account.'})
+        self.send(200, {
+            'from': request.param('from'), 'to': request.param('to'),
+            'trans_result': [
+                {'src': text, 'dst': self.mock.translate(text)}]})
+
+    def route_papago(self, request, broken):
+        text = request.json.get('text')
+        self.mock.charge(
+            request.headers.get('X-NCP-APIGW-API-KEY-ID'), [text], 429,
+            {'error': {'errorCode': '010', 'message': 'Quota Exceed'}})
+        self.send(200, {'message': {'result': {
+            'srcLangType': request.json.get('source'),
+            'tarLangType': request.json.get('target'),
+            'translatedText': self.mock.translate(text)}}})
+
+
+class MockServer(StubServer):
+    """A local stand-in of the APIs of the built-in engines, which answers in
+    their formats, including streams and the token of Microsoft Edge, to run
+    the whole request pipeline offline.
+
+    :latency: The seconds to wait before answering, or a function returning
+        them, such as uniform or lognormal.
+    :errors: The chances of failing a request, by an HTTP status, 'timeout'
+        to hold the request for the hang seconds without an answer, or
+        'break' to break off a stream halfway.
+    :quotas: The characters each API key is allowed to translate, with the
+        error of the engine in return once exhausted.
+    :retry_after: The seconds sent with the injected 429 errors.
+    :token_size: The characters in each event of a stream.
+    :token_delay: The seconds between the events of a stream.
+    :token_lifetime: The seconds the token of Microsoft Edge is valid.
+    :translate: The function translating a text.
+    """
+    def __init__(self, latency=0, errors={}, quotas={}, retry_after=None,
+                 hang=60.0, token_size=4, token_delay=0, token_lifetime=600,
+                 translate=mark, secure=True):
+        StubServer.__init__(self, MockRequestHandler, secure)
+        self.server.mock = self
+        self.latency = latency if callable(latency) else fixed(latency)
+        self.errors = errors
+        self.quotas = quotas
+        self.retry_after = retry_after
+        self.hang = hang
+        self.token_size = token_size
+        self.token_delay = token_delay
+        self.token_lifetime = token_lifetime
+        self.translate = translate
+
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.usage = Counter()
+        self.requests = Counter()
+        self.statuses = Counter()
+
+    def count(self, name, key):
+        with self.lock:
+            getattr(self, name)[key] += 1
+
+    def inject(self):
+        """Return the failure picked for a request, or None."""
+        chance = random.random()
+        for failure, probability in self.errors.items():
+            if chance < probability:
+                return failure
+            chance -= probability
+        return None
+
+    def charge(self, key, texts, status=429, error=None):
+        """Count the characters against the quota of the key, raising the
+        error of the engine if it is exceeded."""
+        chars = sum(len(text or '') for text in texts)
+        with self.lock:
+            limit = self.quotas.get(key)
+            if limit is not None and self.usage[key] + chars > limit:
+                raise MockError(status, error or {'error': {
+                    'code': status, 'message': 'Quota exceeded.'}})
+            self.usage[key] += chars
+
+    def get_usage(self, key):
+        with self.lock:
+            return self.usage[key], self.quotas.get(key, 0)
+
+    def issue_token(self):
+        def encode(data):
+            return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')) \
+                .decode('utf-8').rstrip('=')
+        payload = {'exp': int(time.time()) + self.token_lifetime,
+                   'jti': '%016x' % random.getrandbits(64)}
+        token = '%s.%s.mock' % (encode({'alg': 'none'}), encode(payload))
+        with self.lock:
+            self.tokens.add(token)
+        return token
+
+    def is_valid_token(self, token):
+        if token is None or token not in self.tokens:
+            return False
+        payload = token.split('.')[1]
+        payload = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        return json.loads(payload.decode('utf-8'))['exp'] > time.time()
+
+    def rebase(self, url):
+        return re.sub(r'^https?://[^/]+', self.url, url)
+
+    def point(self, translator):
+        """Send the requests of the engine to this server instead."""
+        endpoint = translator.endpoint
+        if isinstance(endpoint, dict):
+            translator.endpoint = dict(
+                (name, self.rebase(url)) for name, url in endpoint.items())
+        else:
+            translator.endpoint = self.rebase(endpoint)
+        auth_endpoint = getattr(translator, 'auth_endpoint', None)
+        if auth_endpoint is not None:
+            translator.auth_endpoint = self.rebase(auth_endpoint)
+        # Stand in for the gcloud command of the ADC of Google.
+        if hasattr(translator, 'api_key_cache'):
+            translator.project_id = 'mock-project'
+            translator.api_key_cache = [time.time(), 'mock-token']
+        return translator
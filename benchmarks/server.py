@@ -0,0 +1,103 @@
+import os
+import sys
+import ssl
+import json
+import shutil
+import tempfile
+import threading
+from subprocess import Popen, PIPE
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 is required for the clients to keep the connection alive.
+    protocol_version = 'HTTP/1.1'
+    # Avoid the delayed ACK stall of writing the headers and body apart.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        length > 0 and self.rfile.read(length)
+        body = json.dumps({'text': 'translation'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+    def finish_request(self, request, client_address):
+        # Do the TLS handshake in the thread of the request rather than
+        # holding up the accepting loop.
+        hasattr(request, 'do_handshake') and request.do_handshake()
+        HTTPServer.finish_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        # A client giving up on a request is expected, not an error.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+def create_certificate(directory):
+    """Create a self-signed certificate with the openssl command. Returns None
+    if openssl is not available.
+    """
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        return None
+    key = os.path.join(directory, 'key.pem')
+    cert = os.path.join(directory, 'cert.pem')
+    process = Popen(
+        [openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days',
+         '1', '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+        stdout=PIPE, stderr=PIPE)
+    process.communicate()
+    return (cert, key) if process.returncode == 0 else None
+
+
+class StubServer:
+    """A local server answering any request with a small JSON document, which
+    serves HTTPS if a certificate can be created, otherwise HTTP.
+    """
+    def __init__(self, handler=StubRequestHandler, secure=True):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.scheme = 'http'
+        self.directory = tempfile.mkdtemp()
+        certificate = secure and create_certificate(self.directory)
+        if certificate:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*certificate)
+            self.server.socket = context.wrap_socket(
+                self.server.socket, server_side=True,
+                do_handshake_on_connect=False)
+            self.scheme = 'https'
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return '%s://127.0.0.1:%s' % (self.scheme, self.server.server_port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -182,11 +182,19 @@ class CacheTableView(QTableView):
 
     def contextMenuEvent(self, event):
         menu = QMenu()
+        menu.addAction(_('Pin'), lambda: self.pin_cache(True))
+        menu.addAction(_('Unpin'), lambda: self.pin_cache(False))
+        menu.addSeparator()
         menu.addAction(_('Delete'), self.delete_cache)
         menu.setMinimumSize(menu.sizeHint())
         menu.setMaximumSize(menu.sizeHint())
         menu.exec_(QCursor.pos())
 
+    def pin_cache(self, pinned):
+        for row in self.selectionModel().selectedRows():
+            TranslationCache.pin(row.data(Qt.UserRole), pinned)
+        self.model().refresh()
+
     def delete_cache(self):
         action = self.alert.ask(
             _('Are you sure you want to delete the selected cache(s)?'))
@@ -203,7 +211,8 @@ class CacheTableView(QTableView):
 class CacheTableModel(QAbstractTableModel):
     headers = [
         _('Title'), _('Engine'), _('Language'), _('Merge Length'),
-        _('Size (MB)'), _('Last Modification Time'), _('Filename'),
+        _('Translated'), _('Size (MB)'), _('Last Modification Time'),
+        _('Pinned'), _('Filename'),
     ]
 
     def __init__(self):
@@ -3,14 +3,10 @@ import json
 from .. import EbookTranslator
 
 from ..engines.base import Base
+from ..engines.stream import iter_events
 from ..engines.languages import google
 
 
-try:
-    from http.client import IncompleteRead
-except ImportError:
-    from httplib import IncompleteRead
-
 load_translations()
 
 
@@ -25,7 +21,10 @@ class ClaudeTranslate(Base):
 
     concurrency_limit = 1
     request_interval = 12
+    token_rate = 20000
     request_timeout = 30.0
+    # Only used with a batch size set by the user.
+    batch_bytes = 8000
 
     prompt = (
         'You are a meticulous translator who translates any given content. '
@@ -94,24 +93,33 @@ class ClaudeTranslate(Base):
             self.endpoint, json.dumps(data), self._get_headers(),
             method='POST', stream=self.stream, callback=self._parse)
 
+    def translate_batch(self, texts):
+        data = self._get_data(self.pack_texts(texts))
+        data['system'] += ' ' + self.batch_prompt
+        sampling_value = getattr(self, self.sampling)
+        data.update({self.sampling: sampling_value})
+
+        return self.get_result(
+            self.endpoint, json.dumps(data), self._get_headers(),
+            method='POST', stream=self.stream, callback=lambda r:
+                self.unpack_texts(''.join(self._parse(r)), len(texts)))
+
     def _parse(self, data):
         if self.stream:
             return self._parse_stream(data)
         return json.loads(data)['content'][0]['text']
 
     def _parse_stream(self, data):
-        while True:
-            try:
-                line = data.readline().decode('utf-8').strip()
-            except IncompleteRead:
+        for event, chunk in iter_events(data, self.request_timeout):
+            # Only decode the events that matter, not the pings and so on.
+            if event not in (None, 'content_block_delta', 'message_stop',
+                             'error'):
                 continue
-            except Exception as e:
-                raise Exception(
-                    _('Can not parse returned response. Raw data: {}')
-                    .format(str(e)))
-            if line.startswith('data:'):
-                chunk = json.loads(line.split('data: ')[1])
-                if chunk.get('type') == 'message_stop':
-                    break
-                if chunk.get('type') == 'content_block_delta':
-                    yield str(chunk.get('delta').get('text'))
+            chunk = json.loads(chunk)
+            if chunk.get('type') == 'message_stop':
+                return
+            if chunk.get('type') == 'error':
+                raise Exception(chunk.get('error'))
+            if chunk.get('type') == 'content_block_delta':
+                yield str(chunk.get('delta').get('text'))
+        raise Exception(_('The stream ended unexpectedly.'))
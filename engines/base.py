@@ -1,16 +1,41 @@
 import ssl
+import json
 import os.path
+import threading
 
 from mechanize import Browser, Request, HTTPError
 from calibre import get_proxies
 from calibre.utils.localization import lang_as_iso639_1
 
-from ..lib.utils import traceback_error
+from ..lib.utils import traceback_error, mask
+from ..lib.pool import (
+    get_connection_pool, KeepAliveHTTPHandler, KeepAliveHTTPSHandler)
+from ..lib.limiter import get_rate_limiter
+from ..lib.concurrency import ConcurrencyController
+from ..lib.retry import RetryPolicy
+from ..lib.keys import ApiKeyPool
+from ..lib.hedging import HedgePolicy
 
 
 load_translations()
 
 
+class DeferredRequest:
+    """The arguments of get_result, which is returned in place of the result
+    while deferring the translation so that another transport can send it.
+    """
+    def __init__(self, url, data=None, headers={}, method='GET',
+                 stream=False, silence=False, callback=None, metric=None):
+        self.url = url
+        self.data = data
+        self.headers = headers
+        self.method = method
+        self.stream = stream
+        self.silence = silence
+        self.callback = callback
+        self.metric = metric
+
+
 class Base:
     name = 'Unknown'
     alias = 'Unknown'
@@ -26,18 +51,58 @@ class Base:
     using_tip = None
 
     concurrency_limit = 0
+    # Adjust the requests in flight to the latency and throttling of the
+    # engine, from the concurrency limit (or 4) up to the maximum.
+    adaptive_concurrency = False
+    max_concurrency = 32
     request_interval = 0.0
+    # Budgets shared by all requests to the engine, 0 means no limit. The
+    # request rate defaults to one request per request interval.
+    request_rate = 0.0  # requests per second
+    char_rate = 0  # characters per second
+    token_rate = 0  # tokens per minute
     request_attempt = 3
+    # Send a duplicate of a request slower than the percentile of the
+    # latencies, to another API key if there is one, and take the first
+    # answer. The budget caps the share of the duplicated requests.
+    hedging = False
+    hedge_percentile = 0.95
+    hedge_budget = 0.05
+    # The retries back off exponentially from the delay up to the maximum.
+    retry_delay = 2.0
+    retry_max_delay = 60.0
     request_timeout = 10.0
     max_error_count = 10
+    # With more than one API key, the requests are spread over all of them
+    # at once, each key with its own budget and requests in flight, 0 means
+    # no limit. A throttled key rests for the cooldown seconds.
+    api_key_rate = 0.0  # requests per second
+    api_key_concurrency = 0
+    api_key_cooldown = 30.0
+    # Send requests with the non-blocking client when running with asyncio.
+    native_async = True
+    # The maximum number of segments and of their bytes sent in a single
+    # request by translate_batch, 0 means no limit on the bytes. Engines
+    # whose API accepts an array of texts enable it with a size above 1.
+    batch_size = 0
+    batch_bytes = 0
+
+    # Keep-alive connections shared by all requests to the engine. The pool
+    # size limits the idle connections, 0 disables the reuse of connections.
+    pool_size = 10
+    pool_host_limit = 0
+    pool_idle_timeout = 60.0
 
     def __init__(self):
         self.source_lang = None
         self.target_lang = None
         self.proxy_uri = None
         self.search_paths = []
+        # Browsers are not thread-safe, so each worker thread keeps its own.
+        self.local = threading.local()
 
         self.merge_enabled = False
+        self.metrics = None
 
         self.api_keys = self.config.get('api_keys', [])[:]
         self.bad_api_keys = []
@@ -46,18 +111,75 @@ class Base:
         concurrency_limit = self.config.get('concurrency_limit')
         if concurrency_limit is not None:
             self.concurrency_limit = int(concurrency_limit)
+        adaptive_concurrency = self.config.get('adaptive_concurrency')
+        if adaptive_concurrency is not None:
+            self.adaptive_concurrency = adaptive_concurrency
+        max_concurrency = self.config.get('max_concurrency')
+        if max_concurrency is not None:
+            self.max_concurrency = int(max_concurrency)
         request_interval = self.config.get('request_interval')
         if request_interval is not None:
             self.request_interval = request_interval
+        request_rate = self.config.get('request_rate')
+        if request_rate is not None:
+            self.request_rate = request_rate
+        char_rate = self.config.get('char_rate')
+        if char_rate is not None:
+            self.char_rate = int(char_rate)
+        token_rate = self.config.get('token_rate')
+        if token_rate is not None:
+            self.token_rate = int(token_rate)
         request_attempt = self.config.get('request_attempt')
         if request_attempt is not None:
             self.request_attempt = int(request_attempt)
+        hedging = self.config.get('hedging')
+        if hedging is not None:
+            self.hedging = hedging
+        hedge_percentile = self.config.get('hedge_percentile')
+        if hedge_percentile is not None:
+            self.hedge_percentile = hedge_percentile
+        hedge_budget = self.config.get('hedge_budget')
+        if hedge_budget is not None:
+            self.hedge_budget = hedge_budget
+        retry_delay = self.config.get('retry_delay')
+        if retry_delay is not None:
+            self.retry_delay = retry_delay
+        retry_max_delay = self.config.get('retry_max_delay')
+        if retry_max_delay is not None:
+            self.retry_max_delay = retry_max_delay
         request_timeout = self.config.get('request_timeout')
         if request_timeout is not None:
             self.request_timeout = request_timeout
         max_error_count = self.config.get('max_error_count')
         if max_error_count is not None:
             self.max_error_count = max_error_count
+        api_key_rate = self.config.get('api_key_rate')
+        if api_key_rate is not None:
+            self.api_key_rate = api_key_rate
+        api_key_concurrency = self.config.get('api_key_concurrency')
+        if api_key_concurrency is not None:
+            self.api_key_concurrency = int(api_key_concurrency)
+        api_key_cooldown = self.config.get('api_key_cooldown')
+        if api_key_cooldown is not None:
+            self.api_key_cooldown = api_key_cooldown
+        native_async = self.config.get('native_async')
+        if native_async is not None:
+            self.native_async = native_async
+        batch_size = self.config.get('batch_size')
+        if batch_size is not None:
+            self.batch_size = int(batch_size)
+        batch_bytes = self.config.get('batch_bytes')
+        if batch_bytes is not None:
+            self.batch_bytes = int(batch_bytes)
+        pool_size = self.config.get('pool_size')
+        if pool_size is not None:
+            self.pool_size = int(pool_size)
+        pool_host_limit = self.config.get('pool_host_limit')
+        if pool_host_limit is not None:
+            self.pool_host_limit = int(pool_host_limit)
+        pool_idle_timeout = self.config.get('pool_idle_timeout')
+        if pool_idle_timeout is not None:
+            self.pool_idle_timeout = pool_idle_timeout
 
     @classmethod
     def load_lang_codes(cls, codes):
@@ -88,6 +210,26 @@ class Base:
         return _('A correct key format "{}" is required.') \
             .format(cls.api_key_hint)
 
+    @property
+    def api_key(self):
+        """The key leased from the pool for the request of the current
+        thread, otherwise the key in use."""
+        return getattr(self.local, 'api_key', None) or self.default_api_key
+
+    @api_key.setter
+    def api_key(self, api_key):
+        self.default_api_key = api_key
+
+    def set_request_api_key(self, api_key):
+        """Send the requests of the current thread with the API key, or
+        with the key in use if None."""
+        self.local.api_key = api_key
+
+    def set_request_retry(self, retry):
+        """The times the request of the current thread was sent before,
+        for its metrics."""
+        self.local.retry = retry
+
     def change_api_key(self):
         """Change the API key if the previous one cannot be used."""
         if self.api_key not in self.bad_api_keys:
@@ -97,13 +239,17 @@ class Base:
                 return True
         return False
 
-    def need_change_api_key(self, error_message):
-        if self.need_api_key and len(self.api_keys) > 0:
+    def is_api_key_error(self, error_message):
+        if self.need_api_key:
             for error in self.api_key_errors:
                 if error in error_message:
                     return True
         return False
 
+    def need_change_api_key(self, error_message):
+        return len(self.api_keys) > 0 and \
+            self.is_api_key_error(error_message)
+
     def set_search_paths(self, paths):
         self.search_paths = paths
 
@@ -121,6 +267,9 @@ class Base:
     def set_merge_enabled(self, enable):
         self.merge_enabled = enable
 
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+
     def set_source_lang(self, source_lang):
         self.source_lang = source_lang
 
@@ -135,6 +284,7 @@ class Base:
             self.proxy_uri = '%s:%s' % tuple(proxy)
             if not self.proxy_uri.startswith('http'):
                 self.proxy_uri = 'http://%s' % self.proxy_uri
+            self.local = threading.local()
 
     def set_concurrency_limit(self, limit):
         self.concurrency_limit = limit
@@ -162,13 +312,77 @@ class Base:
             return self.api_keys.pop(0)
         return None
 
+    def get_connection_pool(self):
+        return get_connection_pool(
+            self.name, self.pool_size, self.pool_host_limit,
+            self.pool_idle_timeout)
+
+    def get_rate_limiter(self):
+        request_rate = self.request_rate
+        if request_rate <= 0 and self.request_interval > 0:
+            request_rate = 1.0 / self.request_interval
+        return get_rate_limiter(
+            self.name, request_rate, self.char_rate, self.token_rate)
+
+    def get_concurrency_controller(self):
+        if not self.adaptive_concurrency:
+            return None
+        return ConcurrencyController(
+            self.concurrency_limit or 4, 1, self.max_concurrency)
+
+    def get_api_key_pool(self):
+        """Return a pool of the API keys to use them at once, or None to
+        use them one after another if there are less than two."""
+        keys = [key for key in [self.default_api_key] + self.api_keys
+                if key is not None]
+        if not self.need_api_key or len(keys) < 2:
+            return None
+        pool = ApiKeyPool(
+            keys, self.api_key_rate, self.api_key_concurrency,
+            self.api_key_cooldown)
+        for key in pool.keys:
+            self.set_request_api_key(key.key)
+            try:
+                quota = self.get_quota()
+            finally:
+                self.set_request_api_key(None)
+            quota is not None and pool.set_quota(key, *quota)
+        return pool
+
+    def get_hedge_policy(self):
+        if not self.hedging:
+            return None
+        return HedgePolicy(self.hedge_percentile, self.hedge_budget)
+
+    def get_retry_policy(self):
+        return RetryPolicy(self.retry_delay, self.retry_max_delay)
+
+    def count_tokens(self, text):
+        """A rough estimate of the tokens in the text for the token rate,
+        which takes about 4 bytes of UTF-8 for a token."""
+        return len(text.encode('utf-8')) // 4 + 1
+
     def get_browser(self):
+        br = getattr(self.local, 'browser', None)
+        if br is not None:
+            return br
         br = Browser()
         br.set_handle_robots(False)
         # Do not verify SSL certificates
-        br.set_ca_data(
-            context=ssl._create_unverified_context(cert_reqs=ssl.CERT_NONE))
+        context = ssl._create_unverified_context(cert_reqs=ssl.CERT_NONE)
+        br.set_ca_data(context=context)
+        # Reuse the connections instead of a handshake for every request.
+        pool = self.get_connection_pool()
+        br.add_handler(KeepAliveHTTPHandler(pool))
+        br.add_handler(KeepAliveHTTPSHandler(pool, context))
+
+        proxies = self.get_proxies()
+        proxies and br.set_proxies(proxies)
+
+        self.local.browser = br
+        return br
 
+    def get_proxies(self):
         proxies = {}
         if self.proxy_uri is not None:
             proxies.update(http=self.proxy_uri, https=self.proxy_uri)
@@ -177,12 +391,33 @@ class Base:
             http and proxies.update(http=http, https=http)
             https = get_proxies(False).get('https')
             https and proxies.update(https=https)
-        proxies and br.set_proxies(proxies)
-
-        return br
+        return proxies
+
+    def get_result_error(self, error, result=''):
+        messages = [traceback_error()]
+        if isinstance(error, HTTPError):
+            messages.append(error.read().decode('utf-8'))
+        elif result:
+            messages.append(result)
+        return Exception(
+            _('Can not parse returned response. Raw data: {}')
+            .format('\n\n' + '\n\n'.join(messages)))
+
+    def create_metric(self, data=None):
+        """Start measuring a request with the data, if the metrics are
+        enabled. The body of a streamed response is not measured."""
+        if self.metrics is None:
+            return None
+        return self.metrics.start(
+            self.name, self.api_key and mask(self.api_key),
+            getattr(self.local, 'retry', 0), data)
 
     def get_result(self, url, data=None, headers={}, method='GET',
                    stream=False, silence=False, callback=None):
+        metric = self.create_metric(data)
+        if getattr(self.local, 'deferred', False):
+            return DeferredRequest(
+                url, data, headers, method, stream, silence, callback, metric)
         # Compatible with mechanize 0.3.0 on Calibre 3.21.
         try:
             request = Request(
@@ -194,25 +429,102 @@ class Base:
         try:
             result = ''
             br = self.get_browser()
+            # The browser is reused, do not let it pile up responses.
+            br.clear_history()
+            metric is not None and metric.begin()
             br.open(request)
             response = br.response()
+            metric is not None and metric.respond(response)
             if not stream:
-                response = result = response.read().decode('utf-8').strip()
-            return response if callback is None else callback(response)
+                body = response.read()
+                metric is not None and metric.receive(len(body))
+                response = result = body.decode('utf-8').strip()
+            if callback is not None:
+                response = callback(response)
+            metric is not None and metric.finish()
+            return response
         except Exception as e:
+            metric is not None and metric.finish(e)
             if silence:
                 return None
-            error = [traceback_error()]
-            if isinstance(e, HTTPError):
-                error.append(e.read().decode('utf-8'))
-            elif result:
-                error.append(result)
-            raise Exception(
-                _('Can not parse returned response. Raw data: {}')
-                .format('\n\n' + '\n\n'.join(error)))
+            raise self.get_result_error(e, result)
+
+    def get_quota(self):
+        """Return the characters used and allowed by the API key, or None
+        if the engine does not report them."""
+        return None
 
     def get_usage(self):
         return None
 
     def translate(self, text):
         raise NotImplementedError()
+
+    def is_batch_supported(self):
+        return self.batch_size > 1
+
+    def translate_batch(self, texts):
+        """Translate multiple segments with a single request, returning the
+        translations in the same order as the texts. A translation missing
+        from the response is None, and is requested again."""
+        return [self.translate(text) for text in texts]
+
+    # Engines answering with free text get the segments of a batch as a JSON
+    # object keyed by their indices, and are asked for the same structure.
+    batch_prompt = (
+        'The content is a JSON object mapping indices to the segments to '
+        'translate. Reply with a JSON object only, which maps every index '
+        'to the translation of its segment.')
+
+    def pack_texts(self, texts):
+        return json.dumps(
+            dict((str(index), text) for index, text in enumerate(texts, 1)),
+            ensure_ascii=False)
+
+    def unpack_texts(self, content, count):
+        """Return the translations of the packed segments, with None in
+        place of the missing ones."""
+        start, end = content.find('{'), content.rfind('}')
+        try:
+            data = json.loads(content[start:end + 1]) if start > -1 else {}
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        translations = []
+        for index in range(1, count + 1):
+            translation = data.get(str(index))
+            if not isinstance(translation, str) or not translation.strip():
+                translation = None
+            translations.append(translation)
+        return translations
+
+    def is_async_supported(self):
+        """Whether translate() sends one request via get_result and returns
+        its result, which is required by translate_async."""
+        return self.native_async
+
+    def defer_request(self, method, *args):
+        """Run the method with get_result returning the request instead of
+        sending it."""
+        self.local.deferred = True
+        try:
+            return method(*args)
+        finally:
+            self.local.deferred = False
+
+    def defer_translate(self, text):
+        return self.defer_request(self.translate, text)
+
+    def defer_translate_batch(self, texts):
+        return self.defer_request(self.translate_batch, texts)
+
+    def translate_async(self, text):
+        """Return an awaitable translation which sends the request with the
+        non-blocking client. It is only available on Python 3.7+."""
+        from ..lib.async_client import translate_async
+        return translate_async(self, text)
+
+    def translate_batch_async(self, texts):
+        from ..lib.async_client import translate_batch_async
+        return translate_batch_async(self, texts)
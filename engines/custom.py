@@ -1,10 +1,14 @@
+import re
 import json
+
 from lxml import etree
 
 from ..lib.utils import is_str
+from ..lib.jsonpath import JSONPath
 
 from . import builtin_engines
 from .base import Base
+from .stream import iter_events
 
 
 load_translations()
@@ -79,57 +83,228 @@ def load_engine_data(text):
     if is_str(data) and not has_content_type:
         return (False, _('A appropriate Content-Type in headers is required.'))
     # response parser
-    response = json_data.get('response')
-    if not response or 'response' not in response:
-        return (False, _('Expression to parse response is required.'))
+    error = validate_response(
+        json_data.get('response'), json_data.get('response_type'))
+    if error is not None:
+        return (False, error)
+    # batch request
+    batch = json_data.get('batch')
+    if batch is not None:
+        if not isinstance(batch, dict) or \
+                '"<texts>"' not in json.dumps(batch.get('data')):
+            return (False, _('Placeholder <texts> is required in batch data.'))
+        error = validate_response(
+            batch.get('response'), batch.get('response_type'))
+        if error is not None:
+            return (False, error)
 
     return (True, json_data)
 
 
+def validate_response(expression, response_type):
+    if not is_str(expression) or not (
+            expression.startswith(('$', '/')) or 'response' in expression):
+        return _('Expression to parse response is required.')
+    try:
+        ResponseParser(expression, response_type)
+    except Exception as e:
+        return _('Invalid expression to parse response: {}').format(e)
+    return None
+
+
+class RequestTemplate:
+    """The data of a request, serialized once and split at the placeholders,
+    so that a request only joins the parts with the values of the slots.
+
+    The text is put into the JSON string as escaped, and the texts of a
+    batch take the place of the whole "<texts>" string as a JSON array.
+    """
+    placeholder = re.compile(r'("<texts>"|<source>|<target>|<text>)')
+
+    def __init__(self, data):
+        self.parts = self.placeholder.split(json.dumps(data))
+        self.slots = self.parts[1::2]
+
+    def fill(self, values):
+        parts = self.parts[:]
+        parts[1::2] = [values[slot] for slot in self.slots]
+        return ''.join(parts)
+
+
+class ResponseParser:
+    """Extract the translation from a response, with an expression compiled
+    once: a JSONPath starting with $, an XPath starting with /, or a Python
+    expression of the parsed response.
+
+    :response_type: json, xml or text. The response is parsed as declared, as
+        implied by a JSONPath or XPath, or else tried as JSON, then XML and
+        then left as text.
+    """
+    def __init__(self, expression, response_type=None):
+        self.path = self.code = None
+        if expression.startswith('$'):
+            self.path = JSONPath(expression)
+            implied_type = 'json'
+        elif expression.startswith('/'):
+            self.path = etree.XPath(expression)
+            implied_type = 'xml'
+        else:
+            self.code = compile(expression, '<response>', 'eval')
+            implied_type = response_type
+        if response_type not in (None, 'json', 'xml', 'text'):
+            raise ValueError(
+                _('Unknown response type: {}').format(response_type))
+        if response_type is not None and response_type != implied_type:
+            raise ValueError(
+                _('The expression cannot parse a response of type {}.')
+                .format(response_type))
+        self.response_type = implied_type
+
+    def load(self, response):
+        if self.response_type == 'json':
+            return json.loads(response)
+        if self.response_type == 'xml':
+            return etree.fromstring(response)
+        if self.response_type == 'text':
+            return response
+        try:
+            return json.loads(response)
+        except Exception:
+            try:
+                return etree.fromstring(response)
+            except Exception:
+                return response
+
+    def find(self, response):
+        """Return the values found in the response."""
+        data = self.load(response)
+        if self.code is not None:
+            return eval(self.code, {'response': data})
+        if isinstance(self.path, JSONPath):
+            return self.path.find(data)
+        values = []
+        for value in self.path(data):
+            if etree.iselement(value):
+                value = ''.join(value.itertext())
+            values.append(str(value))
+        return values
+
+    def parse(self, response):
+        result = self.find(response)
+        if self.path is not None:
+            result = result[0] if result else None
+        if not is_str(result):
+            raise Exception(_('Response was parsed incorrectly.'))
+        return result
+
+    def parse_batch(self, response, count):
+        """Return the translations of a batch in order, with None in place
+        of the missing ones."""
+        results = self.find(response)
+        # A single value of the path may be the array of the translations.
+        if self.path is not None and len(results) == 1 and \
+                isinstance(results[0], list):
+            results = results[0]
+        if not isinstance(results, list):
+            raise Exception(_('Response was parsed incorrectly.'))
+        results = [result if is_str(result) else None
+                   for result in results[:count]]
+        return results + [None] * (count - len(results))
+
+
+class EngineTemplate:
+    """The engine data compiled once when loaded, rather than for each
+    request."""
+    def __init__(self, data):
+        request = data.get('request')
+        self.url = request.get('url')
+        self.method = request.get('method') or 'GET'
+        self.headers = request.get('headers') or {}
+        self.is_json = bool(self.headers) and \
+            'application/json' in self.headers.values()
+
+        request_data = request.get('data')
+        self.request = RequestTemplate(request_data)
+        # The data is sent as form fields unless it is JSON.
+        self.restore = isinstance(request_data, dict) and not self.is_json
+        # OpenAI compatible endpoints send server-sent events if asked to.
+        self.stream = isinstance(request_data, dict) and \
+            request_data.get('stream') is True
+        self.response = ResponseParser(
+            data.get('response'), data.get('response_type'))
+
+        batch = data.get('batch') or {}
+        self.batch_size = 0
+        self.batch_request = self.batch_response = None
+        if batch:
+            self.batch_size = int(batch.get('size') or 50)
+            self.batch_request = RequestTemplate(batch.get('data'))
+            self.batch_response = ResponseParser(
+                batch.get('response'), batch.get('response_type'))
+
+
 class CustomTranslate(Base):
     name = 'Custom'
     alias = 'Custom'
     need_api_key = False
     engine_data = {}
+    template = None
 
     @classmethod
     def set_engine_data(cls, data):
         cls.name = data.get('name')  # rename custom engine
         cls.engine_data = data
         cls.lang_codes = cls.load_lang_codes(data.get('languages'))
+        cls.template = EngineTemplate(data)
+        cls.batch_size = cls.template.batch_size
 
-    def translate(self, text):
-        request = self.engine_data.get('request')
-
-        endpoint = request.get('url')
-        method = request.get('method') or 'GET'
-        headers = request.get('headers') or {}
-
-        data = request.get('data')
-        need_restore = isinstance(data, dict)
-        data = json.dumps(data)
+    def _get_result(self, request, values, stream=False, callback=None):
+        template = self.template
+        values.update({
+            '<source>': self._get_source_code(),
+            '<target>': self._get_target_code()})
         # The replacement may include UTF-8 characters that need to be encoded
         # to ensure pure Latin-1 (compliance with ISO-8859-1).
-        data = data.replace('<source>', self._get_source_code()) \
-            .replace('<target>', self._get_target_code()) \
-            .replace('<text>', json.dumps(text)[1:-1]).encode('utf-8')
-        is_json = headers and 'application/json' in headers.values()
-        if need_restore and not is_json:
+        data = request.fill(values).encode('utf-8')
+        if template.restore:
             data = json.loads(data)
-
         return self.get_result(
-            endpoint, data, headers, method=method, callback=self._parse)
+            template.url, data, template.headers, method=template.method,
+            stream=stream, callback=callback)
 
-    def _parse(self, response):
-        try:
-            response = json.loads(response)
-        except Exception:
+    def translate(self, text):
+        template = self.template
+        values = {'<text>': json.dumps(text)[1:-1]}
+        if template.stream:
+            return self._get_result(
+                template.request, values, stream=True,
+                callback=self._parse_stream)
+        return self._get_result(
+            template.request, values, callback=self._parse)
+
+    def translate_batch(self, texts):
+        template = self.template
+        if template.batch_request is None:
+            return Base.translate_batch(self, texts)
+        return self._get_result(
+            template.batch_request, {'"<texts>"': json.dumps(texts)},
+            callback=lambda response: template.batch_response.parse_batch(
+                response, len(texts)))
+
+    def _parse_stream(self, response):
+        parsed = False
+        for _event, data in iter_events(response, self.request_timeout):
+            if data == '[DONE]':
+                break
+            # Some events, like the last one, may carry no text.
             try:
-                response = etree.fromstring(response)
+                result = self._parse(data)
             except Exception:
-                return response
-        result = eval(
-            self.engine_data.get('response'), {"response": response})
-        if not is_str(result):
+                continue
+            parsed = True
+            yield result
+        if not parsed:
             raise Exception(_('Response was parsed incorrectly.'))
-        return result
+
+    def _parse(self, response):
+        return self.template.response.parse(response)
@@ -20,8 +20,11 @@ class DeeplTranslate(Base):
     # api_key_hint = 'xxx-xxx-xxx:fx'
     placeholder = ('<m id={} />', r'<m\s+id={}\s+/>')
     api_key_errors = ['403', '456']
+    # Up to 50 texts and 128 KiB in a request.
+    batch_size = 50
+    batch_bytes = 100000
 
-    def get_usage(self):
+    def get_quota(self):
         # See: https://www.deepl.com/docs-api/general/get-usage/
         headers = {'Authorization': 'DeepL-Auth-Key %s' % self.api_key}
         usage = self.get_result(
@@ -29,8 +32,13 @@ class DeeplTranslate(Base):
             callback=lambda r: json.loads(r))
         if usage is None:
             return None
-        total = usage.get('character_limit')
-        used = usage.get('character_count')
+        return usage.get('character_count'), usage.get('character_limit')
+
+    def get_usage(self):
+        quota = self.get_quota()
+        if quota is None:
+            return None
+        used, total = quota
         left = total - used
 
         return _('{} total, {} used, {} left').format(total, used, left)
@@ -50,6 +58,25 @@ class DeeplTranslate(Base):
             self.endpoint.get('translate'), data, headers, method='POST',
             callback=lambda r: json.loads(r)['translations'][0]['text'])
 
+    def translate_batch(self, texts):
+        headers = {
+            'Authorization': 'DeepL-Auth-Key %s' % self.api_key,
+            'Content-Type': 'application/json',
+        }
+
+        data = {
+            'text': texts,
+            'target_lang': self._get_target_code()
+        }
+
+        if not self._is_auto_lang():
+            data.update(source_lang=self._get_source_code())
+
+        return self.get_result(
+            self.endpoint.get('translate'), json.dumps(data), headers,
+            method='POST', callback=lambda r: [
+                i['text'] for i in json.loads(r)['translations']])
+
 
 class DeeplProTranslate(DeeplTranslate):
     name = 'DeepL(Pro)'
@@ -70,6 +97,8 @@ class DeeplFreeTranslate(Base):
 
     concurrency_limit = 1
     request_interval = 1.0
+    batch_size = 10
+    batch_bytes = 5000
 
     headers = {
         'Accept': '*/*',
@@ -85,18 +114,18 @@ class DeeplFreeTranslate(Base):
         'Referer': 'https://www.deepl.com/',
     }
 
-    def _vars(self, text):
+    def _vars(self, texts):
         # t.forEach((e => r += (e.match(/[i]/g) || []).length)),
         # a.timestamp = o - o % r + r;
         uid = random.randint(1000000000, 9999999999)
-        count_i = text.count('i')
+        count_i = sum(text.count('i') for text in texts)
         ts = int(time.time() * 1000)
         if count_i > 0:
             count_i += 1
             ts = ts - ts % count_i + count_i
         return uid, ts
 
-    def _data(self, text):
+    def _data(self, texts):
         regional_variant = {}
         target_lang = self._get_target_code()
         if '-' in target_lang:
@@ -104,14 +133,14 @@ class DeeplFreeTranslate(Base):
             variant = '-'.join([portions[0].lower(), portions[1]])
             regional_variant['regionalVariant'] = variant
             target_lang = portions[0]
-        uid, ts = self._vars(text)
+        uid, ts = self._vars(texts)
 
         data = json.dumps({
             'jsonrpc': '2.0',
             'method': 'LMT_handle_texts',
             'params': {
                 'commonJobParams': regional_variant,
-                'texts': [{'text': text}],
+                'texts': [{'text': text} for text in texts],
                 'splitting': 'newlines',
                 'lang': {
                     'source_lang_user_selected': self._get_source_code(),
@@ -131,5 +160,11 @@ class DeeplFreeTranslate(Base):
 
     def translate(self, text):
         return self.get_result(
-            self.endpoint, self._data(text), self.headers, method='POST',
+            self.endpoint, self._data([text]), self.headers, method='POST',
             callback=lambda r: json.loads(r)['result']['texts'][0]['text'])
+
+    def translate_batch(self, texts):
+        return self.get_result(
+            self.endpoint, self._data(texts), self.headers, method='POST',
+            callback=lambda r: [
+                i['text'] for i in json.loads(r)['result']['texts']])
@@ -7,6 +7,7 @@ import os.path
 from subprocess import Popen, PIPE
 
 from ..lib.utils import traceback_error
+from ..lib.tokens import get_token_cache
 
 from .base import Base
 from .languages import google, gemini
@@ -17,6 +18,11 @@ try:
 except ImportError:
     from httplib import IncompleteRead
 
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
 load_translations()
 
 
@@ -132,23 +138,31 @@ class GoogleTranslate:
 
     def _get_credential(self):
         """The default lifetime of the API key is 3600 seconds. Once an
-        available key is generated, it will be cached until it expired.
+        available key is generated, it will be cached until it expired, and
+        shared with the other jobs through the token cache.
         """
         timestamp, old_api_key = self.api_key_cache or (None, None)
         if old_api_key is not None and time.time() - timestamp < 3600:
             return old_api_key
+        new_api_key, expires = get_token_cache().fetch(
+            'google_adc', self._create_credential)
+        self.api_key_cache[:] = [expires - 3600, new_api_key]
+        return new_api_key
+
+    def _create_credential(self):
         # Temporarily add existing proxies.
         self.proxy_uri and os.environ.update(
             http_proxy=self.proxy_uri, https_proxy=self.proxy_uri)
-        new_api_key = self._run_command([
-            self._get_gcloud_command(), 'auth', 'application-default',
-            'print-access-token'])
-        # Cleanse the proxies after use.
-        for proxy in ('http_proxy', 'https_proxy'):
-            if proxy in os.environ:
-                del os.environ[proxy]
-        self.api_key_cache[:] = [time.time(), new_api_key]
-        return new_api_key
+        try:
+            new_api_key = self._run_command([
+                self._get_gcloud_command(), 'auth', 'application-default',
+                'print-access-token'])
+        finally:
+            # Cleanse the proxies after use.
+            for proxy in ('http_proxy', 'https_proxy'):
+                if proxy in os.environ:
+                    del os.environ[proxy]
+        return new_api_key, time.time() + 3600
 
 
 class GoogleBasicTranslateADC(GoogleTranslate, Base):
@@ -158,6 +172,9 @@ class GoogleBasicTranslateADC(GoogleTranslate, Base):
     endpoint = 'https://translation.googleapis.com/language/translate/v2'
     api_key_hint = 'API key'
     need_api_key = False
+    # Up to 128 segments and 30K code points are recommended in a request.
+    batch_size = 128
+    batch_bytes = 30000
 
     def get_headers(self):
         return {
@@ -169,23 +186,32 @@ class GoogleBasicTranslateADC(GoogleTranslate, Base):
     def get_data(self, data):
         return json.dumps(data)
 
-    def translate(self, text):
+    def _get_result(self, q, callback):
         data = {
             'format': 'html',
             'model': 'nmt',
             'target': self._get_target_code(),
-            'q': text
+            'q': q
         }
 
         if not self._is_auto_lang():
             data.update(source=self._get_source_code())
         return self.get_result(
             self.endpoint, self.get_data(data), self.get_headers(),
-            method='POST', callback=self._parse)
+            method='POST', callback=callback)
+
+    def translate(self, text):
+        return self._get_result(text, self._parse)
+
+    def translate_batch(self, texts):
+        return self._get_result(texts, self._parse_batch)
 
     def _parse(self, data):
+        return ''.join(self._parse_batch(data))
+
+    def _parse_batch(self, data):
         translations = json.loads(data)['data']['translations']
-        return ''.join(i['translatedText'] for i in translations)
+        return [i['translatedText'] for i in translations]
 
 
 class GoogleBasicTranslate(GoogleBasicTranslateADC):
@@ -199,6 +225,9 @@ class GoogleBasicTranslate(GoogleBasicTranslateADC):
 
     def get_data(self, data):
         data.update(key=self.api_key)
+        # Mechanize does not encode a list as repeated parameters.
+        if isinstance(data.get('q'), list):
+            return urlencode(data, doseq=True)
         return data
 
 
@@ -209,8 +238,11 @@ class GoogleAdvancedTranslate(GoogleTranslate, Base):
     endpoint = 'https://translation.googleapis.com/v3/projects/{}'
     api_key_hint = 'PROJECT_ID'
     need_api_key = False
+    # Up to 1024 segments and 30K code points are recommended in a request.
+    batch_size = 1024
+    batch_bytes = 30000
 
-    def translate(self, text):
+    def _get_result(self, contents, callback):
         project_id = self._get_project_id()
         endpoint = self.endpoint.format('%s:translateText' % project_id)
         headers = {
@@ -221,7 +253,7 @@ class GoogleAdvancedTranslate(GoogleTranslate, Base):
 
         data = {
             'targetLanguageCode': self._get_target_code(),
-            'contents': [text],
+            'contents': contents,
             'mimeType': 'text/plain',
         }
 
@@ -230,11 +262,20 @@ class GoogleAdvancedTranslate(GoogleTranslate, Base):
 
         return self.get_result(
             endpoint, json.dumps(data), headers, method='POST',
-            callback=self._parse)
+            callback=callback)
+
+    def translate(self, text):
+        return self._get_result([text], self._parse)
+
+    def translate_batch(self, texts):
+        return self._get_result(texts, self._parse_batch)
 
     def _parse(self, data):
+        return ''.join(self._parse_batch(data))
+
+    def _parse_batch(self, data):
         translations = json.loads(data)['translations']
-        return ''.join(i['translatedText'] for i in translations)
+        return [i['translatedText'] for i in translations]
 
 
 class GeminiPro(Base):
@@ -247,7 +288,10 @@ class GeminiPro(Base):
 
     concurrency_limit = 1
     request_interval = 1
+    token_rate = 32000
     request_timeout = 30.0
+    # For the batch size, which is up to the user.
+    batch_bytes = 8000
 
     prompt = (
         'You are a meticulous translator who translates any given content '
@@ -271,7 +315,7 @@ class GeminiPro(Base):
         method = 'streamGenerateContent' if self.stream else 'generateContent'
         return self.endpoint.format(method, self.api_key)
 
-    def _prompt(self, text):
+    def _prompt(self, text, batch=False):
         prompt = self.prompt.replace('<tlang>', self.target_lang)
         if self._is_auto_lang():
             prompt = prompt.replace('<slang>', 'detected language')
@@ -281,15 +325,18 @@ class GeminiPro(Base):
         if self.merge_enabled:
             prompt += ' Ensure that placeholders matching the pattern' \
                 '{{id_\\d+}} in the content are retained.'
+        if batch:
+            prompt += ' ' + self.batch_prompt
         return prompt + ' Start translating: ' + text
 
     def _headers(self):
         return {'Content-Type': 'application/json'}
 
-    def _data(self, text):
+    def _data(self, text, batch=False):
         return {
             "contents": [
-                {"role": "user", "parts": [{"text": self._prompt(text)}]},
+                {"role": "user",
+                 "parts": [{"text": self._prompt(text, batch)}]},
             ],
             "generationConfig": {
                 # "stopSequences": ["Test"],
@@ -323,6 +370,13 @@ class GeminiPro(Base):
             self._endpoint(), json.dumps(self._data(text)), self._headers(),
             method='POST', callback=self._parse)
 
+    def translate_batch(self, texts):
+        data = self._data(self.pack_texts(texts), True)
+        return self.get_result(
+            self._endpoint(), json.dumps(data), self._headers(),
+            method='POST', callback=lambda r:
+                self.unpack_texts(self._parse(r), len(texts)))
+
     def _parse(self, data):
         if self.stream:
             parts = []
@@ -1,7 +1,10 @@
 import json
+import time
 import base64
 from datetime import datetime
 
+from ..lib.tokens import get_token_cache
+
 from .languages import microsoft
 from .base import Base
 from .openai import ChatgptTranslate
@@ -20,8 +23,12 @@ class MicrosoftEdgeTranslate(Base):
     alias = 'Microsoft Edge (Free)'
     lang_codes = Base.load_lang_codes(microsoft)
     endpoint = 'https://api-edge.cognitive.microsofttranslator.com/translate'
+    auth_endpoint = 'https://edge.microsoft.com/translate/auth'
     need_api_key = False
     access_info = None
+    # Up to 1000 elements and 50000 characters in a request.
+    batch_size = 100
+    batch_bytes = 50000
 
     def _normalized_endpoint(self):
         query = {
@@ -47,25 +54,48 @@ class MicrosoftEdgeTranslate(Base):
         expired_date = datetime.fromtimestamp(parsed['exp'])
         return {'Token': token, 'Expire': expired_date}
 
+    def _create_app_key(self):
+        app_key = self.get_result(self.auth_endpoint, method='GET')
+        expired_date = self._parse_jwt(app_key)['Expire']
+        return app_key, time.mktime(expired_date.timetuple())
+
     def _get_app_key(self):
+        """The token is shared with the other jobs through the token cache,
+        by the endpoint which issued it."""
         if not self.access_info or datetime.now() > self.access_info['Expire']:
-            auth_url = 'https://edge.microsoft.com/translate/auth'
-            app_key = self.get_result(auth_url, method='GET')
-            self.access_info = self._parse_jwt(app_key)
+            app_key, expires = get_token_cache().fetch(
+                self.auth_endpoint, self._create_app_key)
+            self.access_info = {
+                'Token': app_key, 'Expire': datetime.fromtimestamp(expires)}
         else:
             app_key = self.access_info['Token']
         return app_key
 
-    def translate(self, text):
+    def defer_request(self, method, *args):
+        # The token has to be ready as its request cannot be deferred.
+        self._get_app_key()
+        return Base.defer_request(self, method, *args)
+
+    def _get_result(self, texts, callback):
         headers = {
             'Content-Type': 'application/json',
             'authorization': 'Bearer %s' % self._get_app_key()
         }
-        data = json.dumps([{'text': text}])
+        data = json.dumps([{'text': text} for text in texts])
 
         return self.get_result(
             self._normalized_endpoint(), data, headers, method='POST',
-            callback=lambda r: json.loads(r)[0]['translations'][0]['text'])
+            callback=callback)
+
+    def translate(self, text):
+        return self._get_result(
+            [text],
+            lambda r: json.loads(r)[0]['translations'][0]['text'])
+
+    def translate_batch(self, texts):
+        return self._get_result(
+            texts,
+            lambda r: [i['translations'][0]['text'] for i in json.loads(r)])
 
 
 class AzureChatgptTranslate(ChatgptTranslate):
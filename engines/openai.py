@@ -3,14 +3,10 @@ import json
 from .. import EbookTranslator
 
 from .base import Base
+from .stream import iter_events
 from .languages import google
 
 
-try:
-    from http.client import IncompleteRead
-except ImportError:
-    from httplib import IncompleteRead
-
 load_translations()
 
 
@@ -25,7 +21,10 @@ class ChatgptTranslate(Base):
 
     concurrency_limit = 1
     request_interval = 20
+    token_rate = 40000
     request_timeout = 30.0
+    # Packing paragraphs into a request is enabled with a batch size.
+    batch_bytes = 8000
 
     prompt = (
         'You are a meticulous translator who translates any given content. '
@@ -99,25 +98,28 @@ class ChatgptTranslate(Base):
             self.endpoint, json.dumps(data), self._get_headers(),
             method='POST', stream=self.stream, callback=self._parse)
 
+    def translate_batch(self, texts):
+        data = self._get_data(self.pack_texts(texts))
+        data['messages'][0]['content'] += ' ' + self.batch_prompt
+        sampling_value = getattr(self, self.sampling)
+        data.update({self.sampling: sampling_value})
+
+        return self.get_result(
+            self.endpoint, json.dumps(data), self._get_headers(),
+            method='POST', stream=self.stream, callback=lambda r:
+                self.unpack_texts(''.join(self._parse(r)), len(texts)))
+
     def _parse(self, data):
         if self.stream:
             return self._parse_stream(data)
         return json.loads(data)['choices'][0]['message']['content']
 
     def _parse_stream(self, data):
-        while True:
-            try:
-                line = data.readline().decode('utf-8').strip()
-            except IncompleteRead:
-                continue
-            except Exception as e:
-                raise Exception(
-                    _('Can not parse returned response. Raw data: {}')
-                    .format(str(e)))
-            if line.startswith('data:'):
-                chunk = line.split('data: ')[1]
-                if chunk == '[DONE]':
-                    break
-                delta = json.loads(chunk)['choices'][0]['delta']
-                if 'content' in delta:
-                    yield str(delta['content'])
+        for _event, chunk in iter_events(data, self.request_timeout):
+            if chunk == '[DONE]':
+                return
+            # Azure sends the results of the content filter without choices.
+            choices = json.loads(chunk).get('choices')
+            if choices and choices[0].get('delta', {}).get('content'):
+                yield str(choices[0]['delta']['content'])
+        raise Exception(_('The stream ended unexpectedly.'))
@@ -49,6 +49,10 @@ class PapagoTranslate(Base):
         self.glossary_key = self.config.get('glossary_key', self.glossary_key)
         self.is_novel_translate = self.config.get('is_novel_translate', self.is_novel_translate)
 
+    def is_async_supported(self):
+        # The novel mode sends a request for each of the sentences.
+        return Base.is_async_supported(self) and not self.is_novel_translate
+
     def translate_request(self, text):
         headers = {
             'Content-Type': 'application/json',
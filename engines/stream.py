@@ -0,0 +1,120 @@
+import io
+import time
+
+try:
+    from http.client import IncompleteRead
+except ImportError:
+    from httplib import IncompleteRead
+
+
+load_translations()
+
+
+def get_reader(response):
+    """Return the method reading the bytes that arrived, up to a size, from
+    the response. The buffered reader wrapped by mechanize is bypassed since
+    it waits for the size to be filled.
+    """
+    stream, seen = response, set()
+    while stream is not None and id(stream) not in seen:
+        seen.add(id(stream))
+        if isinstance(stream, io.BufferedReader):
+            stream = stream.raw
+            continue
+        if getattr(type(stream), 'read1', None) is not None:
+            return stream.read1
+        attributes = getattr(stream, '__dict__', {})
+        for name in ('wrapped', 'fp', '_sock', 'response'):
+            if attributes.get(name) is not None:
+                stream = attributes.get(name)
+                break
+        else:
+            stream = None
+    return response.read
+
+
+class EventParser:
+    """Parse server-sent events incrementally from the chunks of a stream,
+    keeping only the incomplete line between the chunks.
+    """
+    def __init__(self):
+        self.buffer = b''
+        self.event = None
+        self.data = []
+
+    def _dispatch(self):
+        event = (self.event, b'\n'.join(self.data).decode('utf-8'))
+        self.event = None
+        self.data = []
+        return event
+
+    def feed(self, chunk):
+        """Return the events completed by the chunk as (event, data)."""
+        buffer = self.buffer + chunk if self.buffer else chunk
+        events = []
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = buffer[start:end]
+            start = end + 1
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            if not line:
+                if self.data:
+                    events.append(self._dispatch())
+                else:
+                    self.event = None
+                continue
+            # Comments are used to keep the connection alive.
+            if line.startswith(b':'):
+                continue
+            name, _colon, value = line.partition(b':')
+            if value.startswith(b' '):
+                value = value[1:]
+            if name == b'data':
+                self.data.append(value)
+            elif name == b'event':
+                self.event = value.decode('utf-8')
+        self.buffer = buffer[start:]
+        return events
+
+    def flush(self):
+        """Return the last event if the stream ended without a blank line."""
+        if self.buffer:
+            self.feed(b'\n')
+        return [self._dispatch()] if self.data else []
+
+
+def iter_events(response, stall_timeout=None, chunk_size=8192):
+    """Yield the server-sent events of the response as (event, data) as
+    soon as they arrive. The reads are bounded by the timeout of the
+    connection, and the stream is given up if only keep-alive comments or
+    partial events arrive for the stall timeout.
+    """
+    read = get_reader(response)
+    parser = EventParser()
+    last_event = time.time()
+    while True:
+        try:
+            chunk = read(chunk_size)
+        except IncompleteRead as e:
+            # The connection was closed, keep what arrived before.
+            for event in parser.feed(e.partial):
+                yield event
+            break
+        if not chunk:
+            break
+        events = parser.feed(chunk)
+        now = time.time()
+        if events:
+            last_event = now
+        elif stall_timeout and now - last_event > stall_timeout:
+            raise Exception(
+                _('The stream stalled for more than {} seconds.')
+                .format(stall_timeout))
+        for event in events:
+            yield event
+    for event in parser.flush():
+        yield event
@@ -0,0 +1,343 @@
+import io
+import ssl
+import zlib
+import asyncio
+from urllib.parse import urlsplit, urljoin, urlencode
+
+from mechanize import HTTPError
+
+from ..engines.base import DeferredRequest
+
+
+load_translations()
+
+
+async def wait(awaitable, timeout=None):
+    """Await an operation on the socket within the timeout, which applies
+    to each of them as with mechanize, rather than to the whole exchange,
+    so that a streamed response may take longer as long as it flows."""
+    if timeout is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, timeout)
+
+
+class AsyncResponse:
+    """The counterpart of the mechanize response with the body already read,
+    which is what the parsers of the engines expect.
+    """
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = io.BytesIO(body)
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.status
+
+    def info(self):
+        return self.headers
+
+    def read(self, *args):
+        return self.body.read(*args)
+
+    def read1(self, *args):
+        return self.body.read1(*args)
+
+    def readline(self, *args):
+        return self.body.readline(*args)
+
+    def close(self):
+        self.body.close()
+
+
+class AsyncClient:
+    """A minimal HTTP/1.1 client built on asyncio streams, which keeps the
+    connections alive and supports HTTP proxies, to send requests without
+    occupying a thread for each of them.
+    """
+    max_redirects = 5
+
+    def __init__(self, proxies={}, ssl_context=None, pool_size=10):
+        self.proxies = proxies
+        self.ssl_context = ssl_context
+        self.pool_size = pool_size
+        self.idle = {}
+        self.loop = asyncio.get_event_loop()
+
+    async def _start_tls(self, reader, writer, host):
+        if hasattr(writer, 'start_tls'):  # Python 3.11+
+            await writer.start_tls(self.ssl_context, server_hostname=host)
+            return reader, writer
+        transport = await self.loop.start_tls(
+            writer.transport, writer.transport.get_protocol(),
+            self.ssl_context, server_hostname=host)
+        writer._transport = transport
+        return reader, writer
+
+    async def _connect(self, scheme, host, port, timeout=None):
+        proxy = self.proxies.get(scheme)
+        if proxy is None:
+            return await wait(asyncio.open_connection(
+                host, port, ssl=self.ssl_context if scheme == 'https' else None,
+                server_hostname=host if scheme == 'https' else None), timeout)
+        proxy = urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+        reader, writer = await wait(asyncio.open_connection(
+            proxy.hostname, proxy.port or 80), timeout)
+        if scheme == 'http':
+            return reader, writer
+        writer.write((
+            'CONNECT {0}:{1} HTTP/1.1\r\nHost: {0}:{1}\r\n\r\n'
+            .format(host, port)).encode('latin-1'))
+        status, _reason, _headers = await self._read_head(reader, timeout)
+        if status != 200:
+            writer.close()
+            raise ConnectionError(
+                _('The proxy refused to connect: {}').format(status))
+        return await wait(self._start_tls(reader, writer, host), timeout)
+
+    async def _acquire(self, key, timeout=None):
+        connections = self.idle.get(key) or []
+        while connections:
+            reader, writer = connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._connect(*key, timeout=timeout)
+        return reader, writer, False
+
+    def _release(self, key, reader, writer, reusable):
+        connections = self.idle.setdefault(key, [])
+        if reusable and len(connections) < self.pool_size:
+            connections.append((reader, writer))
+        else:
+            writer.close()
+
+    async def _read_head(self, reader, timeout=None):
+        line = await wait(reader.readline(), timeout)
+        if not line:
+            raise ConnectionResetError(
+                _('The server closed the connection unexpectedly.'))
+        parts = line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        status = int(parts[1])
+        reason = parts[2] if len(parts) > 2 else ''
+        headers = {}
+        while True:
+            line = (await wait(reader.readline(), timeout)).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        return status, reason, headers
+
+    async def _read_body(self, reader, headers, partial=False, timeout=None):
+        """Returns the body and whether the connection can be reused. If
+        partial, the body of a connection lost halfway is returned as far as
+        it arrived, which is still of use to a streaming parser.
+        """
+        chunks = []
+        try:
+            if 'chunked' in headers.get('transfer-encoding', '').lower():
+                while True:
+                    line = await wait(reader.readline(), timeout)
+                    if not line:
+                        raise ConnectionResetError(_(
+                            'The server closed the connection unexpectedly.'))
+                    size = int(line.split(b';')[0].strip(), 16)
+                    if size == 0:
+                        # Skip the trailer headers.
+                        while (await wait(reader.readline(), timeout)) \
+                                not in (b'\r\n', b'\n', b''):
+                            pass
+                        break
+                    chunks.append(
+                        await wait(reader.readexactly(size), timeout))
+                    await wait(reader.readexactly(2), timeout)
+            elif 'content-length' in headers:
+                length = int(headers['content-length'])
+                while length > 0:
+                    chunk = await wait(
+                        reader.read(min(length, 65536)), timeout)
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b'', length)
+                    chunks.append(chunk)
+                    length -= len(chunk)
+            else:
+                while True:
+                    chunk = await wait(reader.read(65536), timeout)
+                    if not chunk:
+                        return b''.join(chunks), False
+                    chunks.append(chunk)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            if not partial:
+                raise
+            chunks.append(getattr(e, 'partial', b''))
+            return b''.join(chunks), False
+        reusable = headers.get('connection', '').lower() != 'close'
+        return b''.join(chunks), reusable
+
+    def _decode(self, body, headers):
+        encoding = headers.get('content-encoding', '').lower()
+        if encoding == 'gzip':
+            return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+        return body
+
+    async def _send(self, method, url, body, headers, partial=False,
+                    timeout=None):
+        url = urlsplit(url)
+        scheme = url.scheme.lower()
+        port = url.port or (443 if scheme == 'https' else 80)
+        key = (scheme, url.hostname, port)
+        target = url.path or '/'
+        if url.query:
+            target += '?' + url.query
+        if scheme == 'http' and self.proxies.get('http'):
+            target = url.geturl()
+
+        lines = ['%s %s HTTP/1.1' % (method, target)]
+        default_port = 443 if scheme == 'https' else 80
+        names = [name.lower() for name in headers]
+        if 'host' not in names:
+            lines.append('Host: %s' % (
+                url.hostname if port == default_port
+                else '%s:%s' % (url.hostname, port)))
+        for name, value in headers.items():
+            if name.lower() not in ('connection', 'content-length'):
+                lines.append('%s: %s' % (name, value))
+        if body is not None:
+            lines.append('Content-Length: %d' % len(body))
+        lines.append('Connection: keep-alive')
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        message += body or b''
+
+        while True:
+            reader, writer, reused = await self._acquire(key, timeout)
+            try:
+                writer.write(message)
+                await wait(writer.drain(), timeout)
+                status, reason, response_headers = \
+                    await self._read_head(reader, timeout)
+                if method == 'HEAD' or status in (204, 304) or \
+                        100 <= status < 200:
+                    content, reusable = b'', True
+                else:
+                    content, reusable = await self._read_body(
+                        reader, response_headers, partial, timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # The server may have closed the idle connection already.
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            self._release(key, reader, writer, reusable)
+            content = self._decode(content, response_headers)
+            return status, reason, response_headers, content
+
+    async def request(self, method, url, data=None, headers={},
+                      timeout=None, partial=False):
+        """Follows the behavior of mechanize: a dictionary is URL-encoded,
+        appended to the URL for GET requests, and an HTTPError is raised for
+        a status code of 400 and above. The body of a streamed response is
+        read partially if the connection is lost.
+        """
+        method = (method or ('POST' if data is not None else 'GET')).upper()
+        headers = dict(headers)
+        if isinstance(data, dict):
+            data = urlencode(dict(
+                (key, value.encode('utf-8') if isinstance(value, str)
+                 else value) for key, value in data.items())) or None
+            if data is not None and method == 'GET':
+                url += ('&' if '?' in url else '?') + data
+                data = None
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if data is not None and 'content-type' not in \
+                [name.lower() for name in headers]:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        for _redirect in range(self.max_redirects + 1):
+            status, reason, response_headers, body = await self._send(
+                method, url, data, headers, partial, timeout)
+            if status in (301, 302, 303, 307, 308) and \
+                    'location' in response_headers:
+                url = urljoin(url, response_headers['location'])
+                if status in (301, 302, 303) and method != 'HEAD':
+                    method, data = 'GET', None
+                continue
+            break
+        if status >= 400:
+            raise HTTPError(
+                url, status, reason, response_headers, io.BytesIO(body))
+        return AsyncResponse(url, status, reason, response_headers, body)
+
+    def close(self):
+        for connections in self.idle.values():
+            for _reader, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+def get_async_client(engine):
+    """The connections belong to the event loop, so the client is created
+    for each of the event loops the engine runs in.
+    """
+    loop = asyncio.get_event_loop()
+    client = getattr(engine.local, 'async_client', None)
+    if client is None or client.loop is not loop:
+        client = AsyncClient(
+            engine.get_proxies(),
+            ssl._create_unverified_context(cert_reqs=ssl.CERT_NONE),
+            engine.pool_size)
+        engine.local.async_client = client
+    return client
+
+
+async def send_request(engine, request):
+    """Send the request deferred by the engine and handle the response as
+    get_result does. Anything else is returned as is."""
+    if not isinstance(request, DeferredRequest):
+        return request
+    result = ''
+    metric = request.metric
+    try:
+        metric is not None and metric.begin()
+        response = await get_async_client(engine).request(
+            request.method, request.url, request.data, request.headers,
+            engine.request_timeout, partial=request.stream)
+        metric is not None and metric.respond(response)
+        if not request.stream:
+            body = response.read()
+            metric is not None and metric.receive(len(body))
+            response = result = body.decode('utf-8').strip()
+        if request.callback is not None:
+            response = request.callback(response)
+        metric is not None and metric.finish()
+        return response
+    except Exception as e:
+        metric is not None and metric.finish(e)
+        if request.silence:
+            return None
+        raise engine.get_result_error(e, result)
+
+
+async def translate_async(engine, text):
+    return await send_request(engine, engine.defer_translate(text))
+
+
+async def translate_batch_async(engine, texts):
+    requests = engine.defer_translate_batch(texts)
+    # An engine not supporting batches defers a request for each text.
+    if isinstance(requests, list):
+        return [await send_request(engine, request) for request in requests]
+    return await send_request(engine, requests)
@@ -1,15 +1,189 @@
 import sys
+import time
 import asyncio
 import concurrent.futures
 
 from ..lib.utils import traceback_error
 
-from .exception import TranslationCanceled
+from .exception import TranslationCanceled, TranslationDeferred
+
+
+load_translations()
+
+
+async def lease_api_key(translation):
+    """The counterpart of Translation._lease_api_key."""
+    if translation.api_key_pool is None:
+        return None
+    while True:
+        key, delay = translation.api_key_pool.acquire()
+        delay > 0 and await asyncio.sleep(delay)
+        if key is not None:
+            return key
+        if translation.cancel_request():
+            raise TranslationCanceled(_('Translation canceled.'))
+
+
+async def hedge(translation, text, translate, key, retry=0):
+    """Send a duplicate of the request once it is slower than most, and
+    return the first answer, canceling the other request."""
+    hedging = translation.hedging
+
+    async def attempt(key, delay=0):
+        delay > 0 and await asyncio.sleep(delay)
+        start = time.time()
+        # The request is built with the key before awaiting anything.
+        translation._use_api_key(key)
+        translation.translator.set_request_retry(retry)
+        result = await translate(text)
+        hedging.record(time.time() - start)
+        return result
+
+    first = asyncio.ensure_future(attempt(key))
+    delay = hedging.get_delay()
+    if delay is not None:
+        await asyncio.wait([first], timeout=delay)
+    if delay is None or first.done() or not hedging.allow():
+        return await first
+
+    # Prefer another key, whose budget the duplicate waits for.
+    hedge_key, wait = key, 0.0
+    if translation.api_key_pool is not None:
+        hedge_key, wait = translation.api_key_pool.acquire(exclude=[key])
+        if hedge_key is None:
+            hedge_key, wait = key, 0.0
+    second = asyncio.ensure_future(
+        attempt(hedge_key, max(wait, translation._reserve(text))))
+    tasks = [first, second]
+    try:
+        pending = tasks
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    task is second and hedging.win()
+                    return task.result()
+        return first.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if hedge_key is not key:
+            error = None
+            if second.done() and not second.cancelled():
+                error = second.exception()
+            translation._release_api_key(hedge_key, text, error)
+
+
+async def request(translation, paragraph, text, translate):
+    """The counterpart of Translation._request awaiting the engine."""
+    while True:
+        delay = translation._reserve(text)
+        delay > 0 and await asyncio.sleep(delay)
+        if translation.cancel_request():
+            raise TranslationCanceled(_('Translation canceled.'))
+        key = await lease_api_key(translation)
+        start = time.time()
+        try:
+            if translation.hedging is not None:
+                result = await hedge(
+                    translation, text, translate, key, paragraph.retry)
+            else:
+                # The request is built with the key before awaiting anything.
+                translation._use_api_key(key)
+                translation.translator.set_request_retry(paragraph.retry)
+                result = await translate(text)
+        except Exception as e:
+            translation._release_api_key(key, text, e)
+            translation._adapt(start, e)
+            translation._handle_failure(e, paragraph, text, key)
+        else:
+            translation._release_api_key(key, text)
+            translation.abort_count = 0
+            translation._adapt(start)
+            return result
+
+
+async def translate_text(translation, paragraph, text):
+    text = translation.glossary.replace(text)
+    return await request(
+        translation, paragraph, text, translation.translator.translate_async)
+
+
+async def translate_texts(translation, batch, texts):
+    texts = [translation.glossary.replace(text) for text in texts]
+
+    async def translate_batch(texts):
+        # Other requests may use their API keys while awaiting a chunk.
+        api_key = translation.translator.api_key
+        translations = []
+        for chunk in translation._split_texts(texts):
+            translations.extend(await translate_chunk(
+                translation, chunk, api_key, batch.retry))
+        return translations
+    return await request(translation, batch, texts, translate_batch)
+
+
+async def translate_chunk(translation, texts, api_key, retry=0):
+    """The counterpart of Translation._translate_chunk."""
+    translations = [None] * len(texts)
+    missing = list(range(len(texts)))
+    while True:
+        missing_texts = [texts[index] for index in missing]
+        if len(missing) < len(texts):
+            delay = translation._reserve(missing_texts)
+            delay > 0 and await asyncio.sleep(delay)
+        if translation.api_key_pool is not None:
+            translation.translator.set_request_api_key(api_key)
+        translation.translator.set_request_retry(retry)
+        results = await translation.translator.translate_batch_async(
+            missing_texts)
+        missing = translation._fill_missing(translations, missing, results)
+        if not missing:
+            return translations
+
+
+async def run_in_executor(method, paragraph):
+    """Fall back to the thread of an engine not supporting the client."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None, method, paragraph)
+
+
+async def translate_paragraph(translation, paragraph):
+    translation = translation._route(paragraph)
+    if not translation.translator.is_async_supported():
+        return await run_in_executor(
+            translation.translate_paragraph, paragraph)
+    if not translation._need_translate(paragraph):
+        return
+    prefix, text = translation._resume(paragraph)
+    result = await translate_text(translation, paragraph, text)
+    translation._set_translation(
+        paragraph, translation._complete(paragraph, prefix, text, result))
+
+
+async def translate_paragraphs(translation, batch):
+    translation = translation._route(batch)
+    if not translation.translator.is_async_supported():
+        return await run_in_executor(translation.translate_paragraphs, batch)
+    paragraphs = translation._filter_paragraphs(batch)
+    if not paragraphs:
+        return
+    results = await translate_texts(
+        translation, batch, [p.original for p in paragraphs])
+    for paragraph, result in zip(paragraphs, results):
+        translation._set_translation(paragraph, result)
 
 
 class AsyncHandler:
     def __init__(self, paragraphs, concurrency_limit, translate_paragraph,
-                 process_translation, request_interval):
+                 process_translation, translate_paragraph_async=None,
+                 concurrency=None):
+        """:translate_paragraph_async: If given, it is awaited in the event
+        loop instead of running translate_paragraph in a thread.
+        :concurrency: If given, a ConcurrencyController which decides the
+        number of paragraphs in flight instead of the concurrency limit.
+        """
         if sys.platform == 'win32':
             asyncio.set_event_loop_policy(
                 asyncio.WindowsSelectorEventLoopPolicy())
@@ -26,23 +200,40 @@ class AsyncHandler:
             self.queue.put_nowait(paragraph)
 
         self.concurrency_limit = concurrency_limit or self.queue.qsize()
+        self.concurrency = concurrency
+        if concurrency is not None:
+            self.concurrency_limit = min(
+                concurrency.maximum, self.queue.qsize())
+        self.slots = None
+        self.retries = set()
         self.translate_paragraph = translate_paragraph
         self.process_translation = process_translation
-        self.request_interval = request_interval
+        self.translate_paragraph_async = translate_paragraph_async
+        # Processing is sequential, so a single thread is enough.
+        self.processing_executor = concurrent.futures.ThreadPoolExecutor(1)
 
     async def translation_worker(self):
         while True:
             try:
                 paragraph = await self.queue.get()
-                await asyncio.get_running_loop().run_in_executor(
-                    None, self.translate_paragraph, paragraph)
+                await self.acquire_slot()
+                try:
+                    if self.translate_paragraph_async is not None:
+                        await self.translate_paragraph_async(paragraph)
+                    else:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.translate_paragraph, paragraph)
+                finally:
+                    await self.release_slot()
                 paragraph.error = None
-                if self.queue.qsize() > 0 and not paragraph.is_cache:
-                    await asyncio.sleep(self.request_interval)
                 self.done_queue.put_nowait(paragraph)
                 self.queue.task_done()
+            except TranslationDeferred:
+                self.retry_later(paragraph)
             except TranslationCanceled:
                 self.queue.task_done()
+                for task in list(self.retries):
+                    task.cancel()
                 while not self.queue.empty():
                     await self.queue.get()
                     self.queue.task_done()
@@ -55,15 +246,47 @@ class AsyncHandler:
                 self.done_queue.put_nowait(paragraph)
                 self.queue.task_done()
 
+    def retry_later(self, paragraph):
+        """Put the paragraph back into the queue once it is due, without
+        occupying a worker in the meantime."""
+        task = asyncio.ensure_future(self.requeue(paragraph))
+        self.retries.add(task)
+        task.add_done_callback(self.retry_done)
+
+    async def requeue(self, paragraph):
+        await asyncio.sleep(max(0, paragraph.not_before - time.time()))
+        self.queue.put_nowait(paragraph)
+
+    def retry_done(self, task):
+        """Called even if the task is canceled before it starts."""
+        self.retries.discard(task)
+        # The paragraph stays unfinished until it is back in the queue.
+        self.queue.task_done()
+
+    async def acquire_slot(self):
+        if self.concurrency is None:
+            return
+        async with self.slots:
+            await self.slots.wait_for(self.concurrency.is_available)
+            self.concurrency.enter()
+
+    async def release_slot(self):
+        if self.concurrency is None:
+            return
+        async with self.slots:
+            self.concurrency.leave()
+            self.slots.notify_all()
+
     async def processing_worker(self):
         while True:
             paragraph = await self.done_queue.get()
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                await asyncio.get_running_loop().run_in_executor(
-                    pool, self.process_translation, paragraph)
+            await asyncio.get_running_loop().run_in_executor(
+                self.processing_executor, self.process_translation,
+                paragraph)
             self.done_queue.task_done()
 
     async def create_tasks(self):
+        self.slots = asyncio.Condition()
         tasks = []
         for _ in range(self.concurrency_limit):
             tasks.append(asyncio.create_task(self.translation_worker()))
@@ -83,4 +306,7 @@ class AsyncHandler:
             pass
 
     def handle(self):
-        self.loop.run_until_complete(self.process_tasks())
+        try:
+            self.loop.run_until_complete(self.process_tasks())
+        finally:
+            self.processing_executor.shutdown()
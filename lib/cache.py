@@ -4,11 +4,13 @@ import json
 import shutil
 import sqlite3
 import os.path
+import time
 import tempfile
+import threading
 from datetime import datetime
 from glob import glob
 
-from .utils import size_by_unit
+from .utils import uid, size_by_unit, file_digest
 from .config import get_config
 
 
@@ -34,6 +36,12 @@ class Paragraph:
         self.is_cache = False
         self.error = None
         self.aligned = True
+        self.retry = 0
+        self.not_before = 0.0
+        # The position of the engine in the failover chain.
+        self.failover = 0
+        # The translation streamed before the request broke off.
+        self.partial = None
 
     def get_attributes(self):
         if self.attributes:
@@ -47,6 +55,116 @@ class Paragraph:
         return count_original == count_translation
 
 
+def cache_stat(file_path):
+    """The size and the modification time of the cache, or None while it
+    has changes in its write-ahead log, which it may not show yet."""
+    wal_path = file_path + '-wal'
+    if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+        return None
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class CacheCatalog:
+    """The summaries of the caches in a database of their own, so that they
+    are listed without opening each cache. A summary is recorded once its
+    cache is done with, and rebuilt from the cache when its size or its
+    modification time no longer match. The time a cache was last used and
+    whether it is pinned are kept along, for the eviction.
+    """
+    columns = ('title', 'engine_name', 'target_lang', 'merge_length',
+               'translated', 'total')
+
+    def __init__(self, file_path):
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS catalog(filename UNIQUE, %s, '
+            'size, mtime, accessed DEFAULT NULL, pinned DEFAULT 0)'
+            % ', '.join(self.columns))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS alias(filename UNIQUE, target)')
+
+    def record(self, filename, summary, stat):
+        size, mtime = stat or (None, None)
+        columns = self.columns + ('size', 'mtime')
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO catalog (filename, %s) VALUES (%s) '
+                'ON CONFLICT (filename) DO UPDATE SET %s' % (
+                    ', '.join(columns), ', '.join(['?'] * (len(columns) + 1)),
+                    ', '.join('%s=excluded.%s' % (column, column)
+                              for column in columns)),
+                (filename,) + tuple(summary) + (size, mtime))
+
+    def touch(self, filename, accessed):
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO catalog (filename, accessed) VALUES (?1, ?2) '
+                'ON CONFLICT (filename) DO UPDATE SET accessed=?2',
+                (filename, accessed))
+
+    def pin(self, filename, pinned=True):
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO catalog (filename, pinned) VALUES (?1, ?2) '
+                'ON CONFLICT (filename) DO UPDATE SET pinned=?2',
+                (filename, int(pinned)))
+
+    def forget(self, filenames):
+        filenames = [(filename,) for filename in filenames]
+        with self.connection:
+            self.connection.executemany(
+                'DELETE FROM catalog WHERE filename=?', filenames)
+            self.connection.executemany(
+                'DELETE FROM alias WHERE target=?', filenames)
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM catalog')
+            self.connection.execute('DELETE FROM alias')
+
+    def alias(self, filename, target):
+        """Open the cache of the target file for the filename."""
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO alias VALUES (?1, ?2) ON CONFLICT (filename) '
+                'DO UPDATE SET target=?2', (filename, target))
+
+    def resolve(self, filename):
+        """Return the target file of the filename, or None."""
+        result = self.connection.execute(
+            'SELECT target FROM alias WHERE filename=?',
+            (filename,)).fetchone()
+        return result[0] if result else None
+
+    def stats(self):
+        """Return the size and the modification time recorded of each
+        cache by its filename."""
+        resource = self.connection.execute(
+            'SELECT filename, size, mtime FROM catalog')
+        return dict((filename, (size, mtime))
+                    for filename, size, mtime in resource.fetchall())
+
+    def entries(self):
+        resource = self.connection.execute(
+            'SELECT filename, %s, size, mtime, pinned FROM catalog'
+            % ', '.join(self.columns))
+        return resource.fetchall()
+
+    def usage(self):
+        """Return the filename, the size, the time last used and whether it
+        is pinned of each cache, the ones used least recently first. The
+        caches not used since the catalog exists were last used when they
+        were modified."""
+        resource = self.connection.execute(
+            'SELECT filename, size, COALESCE(accessed, mtime / 1e9) AS used, '
+            'pinned FROM catalog ORDER BY used')
+        return resource.fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
 def default_cache_path():
     path = os.path.join(
         tempfile.gettempdir(), 'com.bookfere.Calibre.EbookTranslator')
@@ -67,6 +185,14 @@ class TranslationCache:
     dir_path = cache_path()
     cache_path = os.path.join(dir_path, 'cache')
     temp_path = os.path.join(dir_path, 'temp')
+    # The updates are written behind in a single transaction once there are
+    # enough of them, or at the latest after the interval in seconds, which
+    # is the most a crash can lose. Reading the cache writes them first.
+    flush_size = 200
+    flush_interval = 1.0
+    # The share of the pages left free by the paragraphs deleted, from which
+    # the cache is rebuilt when closed to give the space back.
+    vacuum_threshold = 0.25
 
     def __init__(self, identity, persistence=True):
         """:persistence: We use two types of cache, one is used temporarily for
@@ -74,6 +200,7 @@ class TranslationCache:
         avoids the need for retranslation.
         """
         self.persistence = persistence
+        self.identity = identity
         self.file_path = self._path(identity)
         # An interruption may occur, resulting in the cache size being less
         # than 50,000 bytes. Therefore, we need to resave it again.
@@ -83,14 +210,33 @@ class TranslationCache:
         self.connection = sqlite3.connect(
             self.file_path, check_same_thread=False)
         self.cursor = self.connection.cursor()
+        # A commit appends to the write-ahead log, which is only synced at
+        # the checkpoints, instead of syncing the database every time.
+        self.cursor.execute('PRAGMA journal_mode=WAL')
+        self.cursor.execute('PRAGMA synchronous=NORMAL')
+        self.cursor.execute('PRAGMA cache_size=-8192')
+        # The unique indexes of a new cache are built after loading it, the
+        # older caches have them declared in the table.
         self.cursor.execute(
             'CREATE TABLE IF NOT EXISTS cache('
-            'id UNIQUE, md5 UNIQUE, raw, original, ignored, '
+            'id, md5, raw, original, ignored, '
             'attributes DEFAULT NULL, page DEFAULT NULL,'
             'translation DEFAULT NULL, engine_name DEFAULT NULL, '
             'target_lang DEFAULT NULL)')
+        self.indexed = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND "
+            "tbl_name='cache'").fetchone() is not None
         self.cursor.execute(
             'CREATE TABLE IF NOT EXISTS info(key UNIQUE, value)')
+        self.cursor.execute(
+            'CREATE TABLE IF NOT EXISTS partial(id UNIQUE, translation)')
+        # The partial translations are saved from the translation threads.
+        self.lock = threading.Lock()
+        self.partial_ids = set()
+        self.pending = []
+        self.pending_columns = None
+        self.pending_partials = []
+        self.timer = None
 
     @classmethod
     def move(cls, dest):
@@ -107,33 +253,132 @@ class TranslationCache:
             total += os.path.getsize(file_path)
         return size_by_unit(total, 'MB')
 
+    @classmethod
+    def get_catalog(cls):
+        if not os.path.exists(cls.dir_path):
+            os.mkdir(cls.dir_path)
+        return CacheCatalog(os.path.join(cls.dir_path, 'catalog.db'))
+
     @classmethod
     def remove(cls, filename):
         file_path = os.path.join(cls.cache_path, filename)
-        os.path.exists(file_path) and os.remove(file_path)
+        for path in (file_path, file_path + '-wal', file_path + '-shm'):
+            os.path.exists(path) and os.remove(path)
+        catalog = cls.get_catalog()
+        catalog.forget([filename])
+        catalog.close()
 
     @classmethod
     def clean(cls):
         for filename in os.listdir(cls.cache_path):
             cls.remove(filename)
+        catalog = cls.get_catalog()
+        catalog.clear()
+        catalog.close()
 
     @classmethod
-    def get_list(cls):
-        names = []
+    def resolve(cls, identity, alias=None):
+        """Return the identity of the cache to open: the one it is an alias
+        of, or else the one of the alias if only that cache exists, which
+        becomes the one it is an alias of.
+        """
+        def exists(identity):
+            return os.path.exists(
+                os.path.join(cls.cache_path, '%s.db' % identity))
+        catalog = cls.get_catalog()
+        try:
+            target = catalog.resolve('%s.db' % identity)
+            if target is not None and exists(os.path.splitext(target)[0]):
+                return os.path.splitext(target)[0]
+            if alias is not None and not exists(identity) and exists(alias):
+                catalog.alias('%s.db' % identity, '%s.db' % alias)
+                return alias
+        finally:
+            catalog.close()
+        return identity
+
+    @classmethod
+    def pin(cls, filename, pinned=True):
+        """Keep the cache from being evicted."""
+        catalog = cls.get_catalog()
+        catalog.pin(filename, pinned)
+        catalog.close()
+
+    @classmethod
+    def _refresh_catalog(cls, catalog):
+        """Bring the catalog up to date with the cache files, and return
+        their filenames."""
+        stats = catalog.stats()
+        filenames = set()
         for file_path in glob(os.path.join(cls.cache_path, '*.db')):
             name = os.path.basename(file_path)
-            cache = cls(os.path.splitext(name)[0])
-            title = cache.get_info('title') or '[%s]' % _('Unknown')
-            engine = cache.get_info('engine_name')
-            lang = cache.get_info('target_lang')
-            merge = int(cache.get_info('merge_length') or 0)
-            size = size_by_unit(os.path.getsize(file_path), 'MB')
-            time = datetime.fromtimestamp(os.path.getmtime(file_path)) \
+            filenames.add(name)
+            # Closing the cache records its summary again.
+            stat = cache_stat(file_path)
+            if stat is None or stats.get(name) != stat:
+                cls(os.path.splitext(name)[0]).close()
+        catalog.forget(set(stats) - filenames)
+        return filenames
+
+    @classmethod
+    def get_list(cls):
+        catalog = cls.get_catalog()
+        try:
+            filenames = cls._refresh_catalog(catalog)
+            entries = catalog.entries()
+        finally:
+            catalog.close()
+        names = []
+        for name, title, engine, lang, merge, translated, total, size, \
+                mtime, pinned in sorted(entries):
+            if name not in filenames:
+                continue
+            title = title or '[%s]' % _('Unknown')
+            merge = int(merge or 0)
+            progress = '%d/%d' % (translated or 0, total or 0)
+            size = size_by_unit(size or 0, 'MB')
+            time = datetime.fromtimestamp((mtime or 0) / 1e9) \
                 .strftime('%Y-%m-%d %H:%M:%S')
-            names.append((title, engine, lang, merge, size, time, name))
-            cache.close()
+            pinned = _('Yes') if pinned else ''
+            names.append((title, engine, lang, merge, progress, size, time,
+                          pinned, name))
         return names
 
+    @classmethod
+    def evict(cls, max_size=0, max_age=0, max_count=0):
+        """Remove the caches used least recently beyond the limits, and
+        return their filenames.
+
+        :max_size: The megabytes of all the caches, 0 means no limit.
+        :max_age: The days since a cache was last used, 0 means no limit.
+        :max_count: The number of caches, 0 means no limit.
+
+        The caches pinned or in use are kept, though they count toward the
+        limits.
+        """
+        catalog = cls.get_catalog()
+        try:
+            filenames = cls._refresh_catalog(catalog)
+            usage = [item for item in catalog.usage() if item[0] in filenames]
+        finally:
+            catalog.close()
+        expiry = time.time() - max_age * 86400
+        total_size = sum(size or 0 for _name, size, _used, _pinned in usage)
+        count = len(usage)
+        removed = []
+        for filename, size, used, pinned in usage:
+            expired = max_age > 0 and (used or 0) < expiry
+            excess = (max_count > 0 and count > max_count) or \
+                (max_size > 0 and total_size > max_size * 1024 * 1024)
+            if not (expired or excess) or pinned or cache_stat(
+                    os.path.join(cls.cache_path, filename)) is None:
+                continue
+            cls.remove(filename)
+            removed.append(filename)
+            total_size -= size or 0
+            count -= 1
+        return removed
+
     def _path(self, name):
         if not os.path.exists(self.dir_path):
             os.mkdir(self.dir_path)
@@ -169,23 +414,47 @@ class TranslationCache:
         result = resource.fetchone()
         return result[0] if result else None
 
+    def _create_indexes(self):
+        self.cursor.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS cache_id ON cache(id)')
+        self.cursor.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS cache_md5 ON cache(md5)')
+        self.indexed = True
+
     def save(self, original_group):
-        if self.is_fresh():
-            for original_unit in original_group:
-                self.add(*original_unit)
+        """Load the originals in a single transaction, then build the
+        indexes of a new cache at once, which is faster than keeping them up
+        to date with each row. Return the number of originals loaded."""
+        if not self.is_fresh():
+            return 0
+        # The merged originals have no attributes and page.
+        defaults = (False, None, None)
+        rows = (tuple(unit) + defaults[len(unit) - 4:]
+                for unit in original_group)
+        with self.lock:
+            self.cursor.executemany(
+                'INSERT INTO cache VALUES ('
+                '?1, ?2, ?3, ?4, ?5, ?6, ?7, NULL, NULL, NULL'
+                ') ON CONFLICT DO NOTHING', rows)
+            count = self.cursor.rowcount
+            self.indexed or self._create_indexes()
             self.connection.commit()
+        return count
 
     def all(self):
+        self.flush()
         resource = self.cursor.execute('SELECT * FROM cache WHERE NOT ignored')
         return resource.fetchall()
 
     def get(self, ids):
+        self.flush()
         placeholders = ', '.join(['?'] * len(ids))
         resource = self.cursor.execute(
             'SELECT * FROM cache WHERE id IN (%s) ' % placeholders, tuple(ids))
         return resource.fetchall()
 
     def first(self, **kwargs):
+        self.flush()
         if kwargs:
             data = ' AND '.join(['%s=?' % column for column in kwargs])
             resource = self.cursor.execute(
@@ -196,6 +465,7 @@ class TranslationCache:
 
     def add(self, id, md5, raw, original, ignored=False, attributes=None,
             page=None):
+        self.indexed or self._create_indexes()
         self.cursor.execute(
             'INSERT INTO cache VALUES ('
             '?1, ?2, ?3, ?4, ?5, ?6, ?7, NULL, NULL, NULL'
@@ -205,39 +475,158 @@ class TranslationCache:
 
     def update(self, ids, **kwargs):
         ids = ids if isinstance(ids, list) else [ids]
-        data = ', '.join(['%s=?' % column for column in kwargs.keys()])
-        placeholders = ', '.join(['?'] * len(ids))
-        self.cursor.execute(
-            'UPDATE cache SET %s WHERE id IN (%s)' % (data, placeholders),
-            tuple(list(kwargs.values()) + ids))
+        columns = tuple(kwargs.keys())
+        values = list(kwargs.values())
+        with self.lock:
+            # Keep the order of the updates of other columns.
+            if columns != self.pending_columns:
+                self._flush()
+            self.pending_columns = columns
+            self.pending.extend(tuple(values + [id]) for id in ids)
+            if len(self.pending) >= self.flush_size:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending and not self.pending_partials:
+            return
+        if self.pending:
+            data = ', '.join(
+                ['%s=?' % column for column in self.pending_columns])
+            self.connection.executemany(
+                'UPDATE cache SET %s WHERE id=?' % data, self.pending)
+        self.connection.executemany(
+            'DELETE FROM partial WHERE id=?',
+            [(id,) for id in self.pending_partials])
         self.connection.commit()
+        self.pending = []
+        self.pending_columns = None
+        self.pending_partials = []
+
+    def flush(self):
+        """Write the updates buffered."""
+        with self.lock:
+            self._flush()
 
     def ignore(self, ids):
         self.update(ids, ignored=True)
 
     def delete(self, ids):
+        self.flush()
         placeholders = ', '.join(['?'] * len(ids))
         self.cursor.execute(
             'DELETE FROM cache WHERE id IN (%s)' % placeholders, tuple(ids))
         self.connection.commit()
+        self.delete_partials(ids)
+
+    def save_partial(self, id, translation):
+        with self.lock:
+            id in self.pending_partials and self.pending_partials.remove(id)
+            self.connection.execute(
+                'INSERT INTO partial VALUES (?1, ?2) ON CONFLICT (id) '
+                'DO UPDATE SET translation=excluded.translation',
+                (id, translation))
+            self.connection.commit()
+            self.partial_ids.add(id)
+
+    def get_partials(self):
+        with self.lock:
+            self._flush()
+            resource = self.connection.execute('SELECT * FROM partial')
+            partials = dict(resource.fetchall())
+            self.partial_ids.update(partials)
+            return partials
+
+    def delete_partials(self, ids):
+        placeholders = ', '.join(['?'] * len(ids))
+        with self.lock:
+            self.partial_ids.difference_update(ids)
+            self.connection.execute(
+                'DELETE FROM partial WHERE id IN (%s)' % placeholders,
+                tuple(ids))
+            self.connection.commit()
+
+    def summary(self):
+        """Return the values of the cache listed in the catalog."""
+        info = dict(self.cursor.execute('SELECT key, value FROM info'))
+        translated, total = self.cursor.execute(
+            "SELECT COUNT(NULLIF(translation, '')), COUNT(*) FROM cache "
+            "WHERE NOT ignored").fetchone()
+        return (info.get('title'), info.get('engine_name'),
+                info.get('target_lang'), info.get('merge_length'),
+                translated, total)
+
+    def _catalog(self, method, *args):
+        catalog = self.get_catalog()
+        try:
+            getattr(catalog, method)(os.path.basename(self.file_path), *args)
+        except sqlite3.Error:
+            # Another job may hold the catalog, it is rebuilt when listed.
+            pass
+        finally:
+            catalog.close()
+
+    def record(self, summary):
+        self._catalog('record', summary, cache_stat(self.file_path))
+
+    def touch(self):
+        """Record the time the cache is used, for the eviction."""
+        self.persistence and self._catalog('touch', time.time())
+
+    def compact(self):
+        """Rebuild the cache if the paragraphs deleted left enough of it
+        free, and return whether it did."""
+        pages = self.cursor.execute('PRAGMA page_count').fetchone()[0]
+        free = self.cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        if pages < 1 or free < pages * self.vacuum_threshold:
+            return False
+        self.connection.commit()
+        self.cursor.execute('VACUUM')
+        return True
 
     def close(self):
+        self.flush()
+        self.persistence and self.compact()
+        summary = self.persistence and self.summary()
         self.cursor.close()
         self.connection.commit()
         self.connection.close()
+        summary and self.record(summary)
 
     def destroy(self):
         self.close()
-        os.path.exists(self.file_path) and os.remove(self.file_path)
+        for path in (self.file_path, self.file_path + '-wal',
+                     self.file_path + '-shm'):
+            os.path.exists(path) and os.remove(path)
+        self.persistence and self.remove(os.path.basename(self.file_path))
 
     def done(self):
-        self.persistence or self.destroy()
+        self.flush()
+        if not self.persistence:
+            return self.destroy()
+        # Write the log back to the cache, so that it matches the summary.
+        self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.record(self.summary())
+
+    def _load_partials(self, paragraphs):
+        partials = self.get_partials()
+        if partials:
+            for paragraph in paragraphs:
+                paragraph.partial = partials.get(paragraph.id)
+        return paragraphs
 
     def paragraph(self, id=None):
-        return Paragraph(*self.first(id=id))
+        return self._load_partials([Paragraph(*self.first(id=id))])[0]
 
     def get_paragraphs(self, ids):
-        return [Paragraph(*item) for item in self.get(ids)]
+        return self._load_partials(
+            [Paragraph(*item) for item in self.get(ids)])
 
     def all_paragraphs(self):
         paragraphs = []
@@ -246,13 +635,26 @@ class TranslationCache:
             if self.cache_only and not paragraph.translation:
                 continue
             paragraphs.append(paragraph)
-        return paragraphs
+        return self._load_partials(paragraphs)
 
     def update_paragraph(self, paragraph):
         self.update(
             paragraph.id, translation=paragraph.translation,
             engine_name=paragraph.engine_name,
             target_lang=paragraph.target_lang)
+        if paragraph.translation and paragraph.id in self.partial_ids:
+            # Deleted along with the update, so a crash loses neither.
+            with self.lock:
+                self.partial_ids.discard(paragraph.id)
+                self.pending_partials.append(paragraph.id)
+
+    def checkpoint_paragraph(self, paragraph):
+        """Keep the partial translation of the paragraph, so that it can
+        be resumed even after the job is over."""
+        if paragraph.partial is None:
+            self.delete_partials([paragraph.id])
+        else:
+            self.save_partial(paragraph.id, paragraph.partial)
 
     def delete_paragraphs(self, paragraphs):
         self.delete([paragraph.id for paragraph in paragraphs])
@@ -261,5 +663,29 @@ class TranslationCache:
         self.ignore([paragraph.id for paragraph in paragraphs])
 
 
-def get_cache(uid):
-    return TranslationCache(uid, get_config().get('cache_enabled'))
+def cache_uid(input_path, *parameters):
+    """Return the identity of the cache of the book, from the content of
+    the file and the parameters of the translation, so that it is found
+    again once the book is moved, along with the identity from the path of
+    the file used before."""
+    return (uid(file_digest(input_path), *parameters),
+            uid(input_path, *parameters))
+
+
+def get_cache(uid, alias=None):
+    """:alias: The identity of an older cache of the book, which is used if
+    there is no cache of its identity yet."""
+    persistence = get_config().get('cache_enabled')
+    if persistence:
+        uid = TranslationCache.resolve(uid, alias)
+    cache = TranslationCache(uid, persistence)
+    cache.touch()
+    return cache
+
+
+def evict_caches():
+    """Enforce the limits of the caches set in the config."""
+    config = get_config()
+    return TranslationCache.evict(
+        config.get('cache_max_size'), config.get('cache_max_age'),
+        config.get('cache_max_count'))
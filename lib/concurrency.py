@@ -0,0 +1,105 @@
+import time
+import socket
+import threading
+
+from .utils import error_chain
+
+
+try:
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+except ImportError:
+    FutureTimeoutError = socket.timeout
+
+
+def is_overloaded(error):
+    """Whether the error, or any error it was raised from, means that the
+    engine is throttling or overloaded: HTTP 429, 5xx or a timeout.
+    """
+    for error in error_chain(error):
+        code = getattr(error, 'code', None)
+        if isinstance(code, int) and (code == 429 or code >= 500):
+            return True
+        if isinstance(error, (socket.timeout, FutureTimeoutError)):
+            return True
+        if isinstance(getattr(error, 'reason', None), socket.timeout):
+            return True
+    return False
+
+
+class ConcurrencyController:
+    """Additive increase, multiplicative decrease of the number of requests
+    in flight.
+
+    The limit grows by one for every limit's worth of successful requests
+    while it is fully used and their smoothed latency stays within the
+    tolerance of the lowest latency seen. It holds when the latency rises,
+    and is cut by the backoff factor on throttling errors or timeouts, at
+    most once per round trip.
+    """
+    def __init__(self, initial=4, minimum=1, maximum=64, tolerance=2.0,
+                 backoff=0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.tolerance = tolerance
+        self.backoff = backoff
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.history = [(time.time(), self.current)]
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def is_available(self):
+        return self.in_flight < self.current
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def _record(self, previous):
+        """Return the new limit if it changed, otherwise None."""
+        current = self.current
+        if current == previous:
+            return None
+        self.history.append((time.time(), current))
+        return current
+
+    def on_success(self, latency):
+        with self.lock:
+            previous = self.current
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+            # Let the baseline creep up, in case the engine got slower for
+            # good rather than because of the load.
+            if self.baseline is None or self.latency < self.baseline:
+                self.baseline = self.latency
+            else:
+                self.baseline += 0.001 * (self.latency - self.baseline)
+            # A limit that is not reached tells nothing about a higher one.
+            saturated = self.in_flight >= self.current
+            if saturated and self.latency <= self.baseline * self.tolerance:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            return self._record(previous)
+
+    def on_failure(self):
+        with self.lock:
+            previous = self.current
+            now = time.time()
+            # The requests in flight fail together, which is one signal.
+            if now - self.last_decrease < (self.latency or 0):
+                return None
+            self.last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            return self._record(previous)
@@ -10,11 +10,23 @@ defaults = {
     'to_library': True,
     'output_path': None,
     'translate_engine': None,
+    'failover_engines': [],
     'engine_preferences': {},
     'proxy_enabled': False,
     'proxy_setting': [],
     'cache_enabled': True,
     'cache_path': None,
+    'cache_max_size': 0,
+    'cache_max_age': 0,
+    'cache_max_count': 0,
+    'memory_enabled': False,
+    'memory_max_entries': 1000000,
+    'memory_max_size': 500,
+    'memory_reuse_score': 0,
+    'memory_suggest_score': 0.8,
+    'metrics_enabled': False,
+    'metrics_jsonl_path': None,
+    'metrics_prometheus_path': None,
     'log_translation': True,
     'show_notification': True,
     'translation_position': None,
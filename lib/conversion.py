@@ -15,8 +15,8 @@ from calibre.ebooks.metadata.meta import get_metadata, set_metadata
 from .. import EbookTranslator
 
 from .config import get_config
-from .utils import sep, uid, open_path, open_file
-from .cache import get_cache
+from .utils import sep, open_path, open_file
+from .cache import get_cache, cache_uid
 from .element import (
     get_element_handler, get_srt_elements, get_toc_elements, get_page_elements,
     get_metadata_elements, get_pgn_elements)
@@ -105,10 +105,33 @@ def convert_srt(
     log(_('Starting to output subtitles file...'))
     log(sep())
 
+    output_srt(elements, output_path)
+
+    log(_('The translation of the subtitles file was completed.'))
+
+
+def output_srt(elements, output_path):
     with open(output_path, 'w') as file:
         file.write('\n\n'.join([e.get_translation() for e in elements]))
 
-    log(_('The translation of the subtitles file was completed.'))
+
+def output_pgn(elements, input_path, output_path, encoding):
+    """Replace the comments in the order they were extracted, in a single
+    pass over the content rather than a pass for each comment."""
+    pgn_content = open_file(input_path, encoding)
+    parts = []
+    position = 0
+    for element in elements:
+        raw = element.get_raw()
+        index = pgn_content.find(raw, position)
+        if index < 0:
+            continue
+        parts.append(pgn_content[position:index])
+        parts.append(element.get_translation())
+        position = index + len(raw)
+    parts.append(pgn_content[position:])
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(''.join(parts))
 
 
 def convert_pgn(
@@ -130,12 +153,7 @@ def convert_pgn(
     log(_('Starting to output PGN file...'))
     log(sep())
 
-    pgn_content = open_file(input_path, encoding)
-    for element in elements:
-        pgn_content = pgn_content.replace(
-            element.get_raw(), element.get_translation(), 1)
-    with open(output_path, 'w', encoding='utf-8') as file:
-        file.write(pgn_content)
+    output_pgn(elements, input_path, output_path, encoding)
 
     log(_('The translation of the PGN file was completed.'))
 
@@ -205,9 +223,8 @@ def convert_item(
     _encoding = ''
     if encoding.lower() != 'utf-8':
         _encoding = encoding.lower()
-    cache_id = uid(
-        input_path + translator.name + target_lang + merge_length + _encoding)
-    cache = get_cache(cache_id)
+    cache = get_cache(*cache_uid(
+        input_path, translator.name, target_lang, merge_length, _encoding))
     cache.set_cache_only(cache_only)
     cache.set_info('title', ebook_title)
     cache.set_info('engine_name', translator.name)
@@ -220,11 +237,14 @@ def convert_item(
         translator, lambda text, error=False: log.info(text))
     translation.set_batch(is_batch)
     translation.set_callback(cache.update_paragraph)
+    translation.set_checkpoint(cache.checkpoint_paragraph)
 
     debug_info = '{0}\n| Diagnosis Information\n{0}'.format(sep())
     debug_info += '\n| Calibre Version: %s\n' % __version__
     debug_info += '| Plugin Version: %s\n' % EbookTranslator.__version__
     debug_info += '| Translation Engine: %s\n' % translator.name
+    debug_info += '| Failover Engines: %s\n' % ', '.join(
+        item.translator.name for item in translation.chain[1:])
     debug_info += '| Source Language: %s\n' % source_lang
     debug_info += '| Target Language: %s\n' % target_lang
     debug_info += '| Encoding: %s\n' % encoding
@@ -232,6 +252,8 @@ def convert_item(
     debug_info += '| Merging Length: %s\n' % element_handler.merge_length
     debug_info += '| Concurrent requests: %s\n' % translator.concurrency_limit
     debug_info += '| Request Interval: %s\n' % translator.request_interval
+    debug_info += '| Rate Limits: %s/s, %s chars/s, %s tokens/min\n' % (
+        translator.request_rate, translator.char_rate, translator.token_rate)
     debug_info += '| Request Attempt: %s\n' % translator.request_attempt
     debug_info += '| Request Timeout: %s\n' % translator.request_timeout
     debug_info += '| Input Path: %s\n' % input_path
@@ -239,8 +261,11 @@ def convert_item(
 
     handler = extra_formats.get(format)
     convertor = convert_book if handler is None else handler.get('convertor')
-    convertor(input_path, output_path, translation, element_handler, cache,
-              debug_info, encoding, notification)
+    try:
+        convertor(input_path, output_path, translation, element_handler,
+                  cache, debug_info, encoding, notification)
+    finally:
+        translation.close()
     cache.done()
 
 
@@ -14,6 +14,10 @@ class TranslationCanceled(Exception):
     pass
 
 
+class TranslationDeferred(Exception):
+    pass
+
+
 class BadApiKeyFormat(TranslationCanceled):
     pass
 
@@ -0,0 +1,82 @@
+import re
+import zlib
+import struct
+import hashlib
+import binascii
+
+
+def shingles(text, size=3):
+    """The character n-grams of the text, ignoring the case and the runs of
+    spaces."""
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    if len(text) <= size:
+        return set([text])
+    return set(text[index:index + size]
+               for index in range(len(text) - size + 1))
+
+
+def similarity(shingles_a, shingles_b):
+    """The Jaccard similarity of two sets of shingles."""
+    if not shingles_a or not shingles_b:
+        return 0.0
+    common = len(shingles_a & shingles_b)
+    return float(common) / (len(shingles_a) + len(shingles_b) - common)
+
+
+class MinHash:
+    """Locality-sensitive hashing of the shingles of texts into buckets, so
+    that texts similar enough share a bucket with a high probability.
+
+    :bands: The buckets of a text, and the chances to meet a similar one.
+    :rows: The values of the signature in each bucket; the more there are,
+        the fewer dissimilar texts share a bucket.
+
+    The signature is computed with a single hash of each shingle, split into
+    a bin for each value, rather than a hash for each value. With 8 bands of
+    4 rows, texts with a similarity of 0.8 share a bucket 98% of the time,
+    and those of 0.5 only 40% of the time.
+    """
+    multiplier = 0x9E3779B1
+
+    def __init__(self, bands=8, rows=4):
+        self.bands = bands
+        self.rows = rows
+        self.size = bands * rows
+
+    def signature(self, shingles):
+        size = self.size
+        values = [None] * size
+        for shingle in shingles:
+            value = (zlib.crc32(shingle.encode('utf-8')) * self.multiplier) \
+                & 0xFFFFFFFF
+            index = (value * size) >> 32
+            if values[index] is None or value < values[index]:
+                values[index] = value
+        # Fill the empty bins with the next value on the right, told apart
+        # by the distance, as the same bins are empty for similar texts.
+        filled = [index for index in range(size) if values[index] is not None]
+        if not filled:
+            return values
+        for index in range(size):
+            if values[index] is not None:
+                continue
+            distance = 1
+            while values[(index + distance) % size] is None:
+                distance += 1
+            values[index] = values[(index + distance) % size] + \
+                (distance << 32)
+        return values
+
+    def buckets(self, signature, namespace=''):
+        """The bucket of each band, which can be kept as a signed 64-bit
+        integer. The namespace keeps apart the buckets of the texts which
+        are not to be compared."""
+        namespace = namespace.encode('utf-8')
+        buckets = []
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(
+                namespace + struct.pack('<%dQ' % self.rows, *values),
+                digest_size=7).digest()
+            buckets.append((band << 56) | int(binascii.hexlify(digest), 16))
+        return buckets
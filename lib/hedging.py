@@ -0,0 +1,53 @@
+import math
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    """Decide when to send a duplicate of a slow request.
+
+    :percentile: A request taking longer than this percentile of the recent
+        latencies is hedged.
+    :budget: The hedged requests as a share of all requests at most.
+    :min_samples: No request is hedged before this number of latencies.
+    :window: The number of recent latencies to take into account.
+    """
+    def __init__(self, percentile=0.95, budget=0.05, min_samples=20,
+                 window=500):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def record(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def get_delay(self):
+        """Called once for each request, return the seconds to wait for it
+        before hedging, or None if too few latencies are known."""
+        with self.lock:
+            self.requests += 1
+            if len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+            index = int(math.ceil(self.percentile * len(latencies))) - 1
+            return latencies[max(0, index)]
+
+    def allow(self):
+        """Take a hedged request from the budget if there is any left."""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def win(self):
+        """The hedged request answered first."""
+        with self.lock:
+            self.wins += 1
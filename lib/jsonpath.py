@@ -0,0 +1,66 @@
+import re
+
+
+load_translations()
+
+
+step_pattern = re.compile(
+    r'\.(?P<name>[^.\[\]\s]+)'
+    r'|\[\s*(?:(?P<index>-?\d+)'
+    r'|(?P<all>\*)'
+    r'|\'(?P<single>(?:[^\'\\]|\\.)*)\''
+    r'|"(?P<double>(?:[^"\\]|\\.)*)")\s*\]')
+
+
+class JSONPath:
+    """A subset of JSONPath, compiled once to look up the values of the
+    parsed JSON data without evaluating any code: the root $ followed by
+    .name, ['name'], [index] with negative ones from the end, and the
+    wildcards .* and [*] for all the members or items.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.steps = []
+        expression = expression.strip()
+        if not expression.startswith('$'):
+            raise ValueError(
+                _('JSONPath must start with $: {}').format(self.expression))
+        position = 1
+        while position < len(expression):
+            match = step_pattern.match(expression, position)
+            if match is None:
+                raise ValueError(
+                    _('Invalid JSONPath at position {}: {}')
+                    .format(position, self.expression))
+            position = match.end()
+            name, index, wildcard, single, double = match.group(
+                'name', 'index', 'all', 'single', 'double')
+            if wildcard or name == '*':
+                self.steps.append(('all', None))
+            elif index is not None:
+                self.steps.append(('index', int(index)))
+            else:
+                key = name if name is not None else \
+                    re.sub(r'\\(.)', r'\1', single if double is None
+                           else double)
+                self.steps.append(('key', key))
+
+    def find(self, data):
+        """Return the values matched in the data, in their order."""
+        values = [data]
+        for kind, argument in self.steps:
+            matches = []
+            for value in values:
+                if kind == 'key':
+                    if isinstance(value, dict) and argument in value:
+                        matches.append(value[argument])
+                elif kind == 'index':
+                    if isinstance(value, list) and \
+                            -len(value) <= argument < len(value):
+                        matches.append(value[argument])
+                elif isinstance(value, dict):
+                    matches.extend(value.values())
+                elif isinstance(value, list):
+                    matches.extend(value)
+            values = matches
+        return values
@@ -0,0 +1,129 @@
+import time
+import threading
+
+from .utils import mask
+from .limiter import RateLimiter
+from .concurrency import is_overloaded
+from .exception import NoAvailableApiKey
+
+
+load_translations()
+
+
+class ApiKey:
+    """The state of an API key in the pool, with its own request budget and
+    the counters of its usage."""
+    def __init__(self, key, request_rate=0):
+        self.key = key
+        self.limiter = RateLimiter(request_rate)
+        self.ready_at = 0.0
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.disabled = False
+
+        self.requests = 0
+        self.failures = 0
+        self.chars = 0
+        # The characters used and allowed by the quota, if the engine
+        # reports them.
+        self.used = None
+        self.limit = None
+
+    @property
+    def remaining(self):
+        """The share of the quota left, or None if unknown."""
+        if self.used is None or not self.limit:
+            return None
+        return max(0.0, 1.0 - float(self.used) / self.limit)
+
+    def masked(self):
+        return mask(self.key)
+
+
+class ApiKeyPool:
+    """Spread the requests over all the healthy API keys at once.
+
+    :request_rate: Requests per second for each key, 0 means no limit.
+    :max_in_flight: Requests in flight for each key, 0 means no limit.
+    :cooldown: Seconds to rest a key after the engine throttled it, unless
+        the engine asked for another delay.
+
+    A key is leased for each request with acquire and given back with
+    release. The key picked is the first to be ready, then the least busy
+    for the share of its quota left, so that a nearly exhausted key gets
+    little traffic. A key that is rejected is disabled for good.
+    """
+    poll_interval = 0.1
+
+    def __init__(self, keys, request_rate=0, max_in_flight=0, cooldown=30.0):
+        self.lock = threading.Lock()
+        self.keys = [ApiKey(key, request_rate) for key in keys]
+        self.max_in_flight = max_in_flight
+        self.cooldown = cooldown
+
+    def is_ready(self, key, now):
+        return not key.disabled and key.cooldown_until <= now and (
+            self.max_in_flight < 1 or key.in_flight < self.max_in_flight)
+
+    def _score(self, key, now):
+        remaining = key.remaining
+        share = 1.0 if remaining is None else max(0.01, remaining)
+        return (max(0.0, key.ready_at - now), (key.in_flight + 1) / share,
+                key.requests)
+
+    def acquire(self, exclude=()):
+        """Return a key and the seconds to wait before sending the request
+        with it, or None and the seconds to wait before trying again if all
+        the keys, but the excluded ones, are busy or resting."""
+        with self.lock:
+            now = time.time()
+            keys = [key for key in self.keys if not key.disabled]
+            if not keys:
+                raise NoAvailableApiKey(_('No available API key.'))
+            keys = [key for key in keys if key not in exclude]
+            ready = [key for key in keys if self.is_ready(key, now)]
+            if not ready:
+                waits = [
+                    key.cooldown_until - now if key.cooldown_until > now
+                    else self.poll_interval for key in keys]
+                return None, min(waits or [self.poll_interval])
+            key = min(ready, key=lambda key: self._score(key, now))
+            delay = key.limiter.reserve()
+            key.ready_at = now + delay
+            key.in_flight += 1
+            return key, delay
+
+    def release(self, key, error=None, chars=0, hint=None):
+        """Give back the key after a request with the characters, resting
+        it if the engine throttled it."""
+        with self.lock:
+            key.in_flight -= 1
+            key.requests += 1
+            if error is None:
+                key.chars += chars
+                # Keep the quota up to date between the usage reports.
+                if key.used is not None:
+                    key.used += chars
+                    if key.limit and key.used >= key.limit:
+                        key.disabled = True
+                return
+            key.failures += 1
+            if is_overloaded(error):
+                cooldown = self.cooldown if hint is None else hint
+                key.cooldown_until = max(
+                    key.cooldown_until, time.time() + cooldown)
+
+    def disable(self, key):
+        """Return whether the key was in use until now."""
+        with self.lock:
+            disabled, key.disabled = key.disabled, True
+            return not disabled
+
+    def set_quota(self, key, used, limit):
+        with self.lock:
+            key.used, key.limit = used, limit
+            if limit and used >= limit:
+                key.disabled = True
+
+    def available(self):
+        return len([key for key in self.keys if not key.disabled])
@@ -0,0 +1,93 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Tokens refill at the rate per second up to the capacity. Reserving
+    more tokens than available puts the bucket into debt, which the caller
+    pays off by waiting before sending the request.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.time()
+
+    def reserve(self, amount, now):
+        """Take the amount of tokens and return the seconds to wait."""
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Budgets shared by all workers sending requests to an engine.
+
+    :request_rate: Requests per second.
+    :char_rate: Characters per second.
+    :token_rate: Tokens per minute.
+
+    A rate of 0 means no limit. The workers reserve their share before each
+    request and wait for the returned seconds, so the rate holds for the
+    engine as a whole regardless of the number of workers.
+    """
+    def __init__(self, request_rate=0, char_rate=0, token_rate=0):
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.rates = (0, 0, 0)
+        self.buckets = (None, None, None)
+        self.configure(request_rate, char_rate, token_rate)
+
+    def configure(self, request_rate=None, char_rate=None, token_rate=None):
+        with self.lock:
+            rates = tuple(
+                current if rate is None else float(rate)
+                for current, rate in zip(
+                    self.rates, (request_rate, char_rate, token_rate)))
+            if rates == self.rates:
+                return
+            request_rate, char_rate, token_rate = self.rates = rates
+            self.buckets = (
+                # Allow a request as soon as one is due, but no burst.
+                request_rate > 0 and TokenBucket(request_rate, 1) or None,
+                char_rate > 0 and TokenBucket(char_rate, char_rate) or None,
+                token_rate > 0 and TokenBucket(
+                    token_rate / 60.0, token_rate) or None)
+
+    def pause(self, seconds):
+        """Hold all requests for the seconds, as asked by the server."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def reserve(self, requests=1, chars=0, tokens=0):
+        """Return the seconds to wait before sending the request."""
+        with self.lock:
+            now = time.time()
+            delay = max(0.0, self.paused_until - now)
+            for bucket, amount in zip(
+                    self.buckets, (requests, chars, tokens)):
+                if bucket is not None:
+                    delay = max(delay, bucket.reserve(amount, now))
+            return delay
+
+    def acquire(self, requests=1, chars=0, tokens=0):
+        delay = self.reserve(requests, chars, tokens)
+        delay > 0 and time.sleep(delay)
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name, request_rate=None, char_rate=None,
+                     token_rate=None):
+    """Limiters are shared by all instances of the same engine in the
+    process, like the connection pools."""
+    with limiters_lock:
+        limiter = limiters.get(name)
+        if limiter is None:
+            limiter = limiters[name] = RateLimiter()
+    limiter.configure(request_rate, char_rate, token_rate)
+    return limiter
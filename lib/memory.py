@@ -0,0 +1,260 @@
+import re
+import os
+import time
+import sqlite3
+import threading
+from collections import Counter
+
+from .utils import uid
+from .config import get_config
+from .cache import TranslationCache
+from .fuzzy import MinHash, shingles, similarity
+
+
+def normalize(text):
+    """Collapse the spaces of the text, keeping the line breaks which
+    separate the merged paragraphs."""
+    return re.sub(r'[^\S\n]+', ' ', text.strip())
+
+
+class TranslationMemory:
+    """The translations of all books, shared between the caches of the books,
+    by the engine, the languages and the original text.
+
+    :max_entries: The translations kept, 0 means no limit.
+    :max_size: The bytes of the originals and translations kept, 0 means no
+        limit.
+
+    The translations used least recently are evicted beyond the limits,
+    down to nine tenths of them to leave room for the next ones. The
+    originals are also indexed by the buckets of MinHash to search for the
+    similar ones.
+    """
+    chunk_size = 500
+    # The candidates of a search compared with the text, which share the
+    # most buckets with it.
+    candidate_count = 8
+
+    def __init__(self, file_path, max_entries=0, max_size=0):
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.minhash = MinHash()
+        self.touched = {}
+        self.lock = threading.Lock()
+        # The memory may be used by the jobs of several books at once.
+        self.connection = sqlite3.connect(
+            file_path, timeout=30, check_same_thread=False)
+        self.cursor = self.connection.cursor()
+        self.cursor.execute('PRAGMA journal_mode=WAL')
+        self.cursor.execute(
+            'CREATE TABLE IF NOT EXISTS memory('
+            'key PRIMARY KEY, engine_name, source_lang, target_lang, '
+            'original, translation, size, used)')
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS memory_used ON memory(used)')
+        self.cursor.execute(
+            'CREATE TABLE IF NOT EXISTS info(key UNIQUE, value)')
+        indexed = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name='fuzzy'").fetchone()
+        self.cursor.execute(
+            'CREATE TABLE IF NOT EXISTS fuzzy('
+            'bucket INTEGER, id INTEGER, PRIMARY KEY (bucket, id)) '
+            'WITHOUT ROWID')
+        if indexed is None:
+            self._index(self.cursor.execute(
+                'SELECT rowid, engine_name, source_lang, target_lang, '
+                'original FROM memory').fetchall())
+        self.connection.commit()
+        self.count, self.size = self.cursor.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM memory').fetchone()
+
+    def _key(self, engine_name, source_lang, target_lang, text):
+        return uid('%s\0%s\0%s\0%s' % (
+            engine_name, source_lang, target_lang, normalize(text)))
+
+    def _buckets(self, engine_name, source_lang, target_lang, text):
+        namespace = '%s\0%s\0%s' % (engine_name, source_lang, target_lang)
+        return self.minhash.buckets(
+            self.minhash.signature(shingles(text)), namespace)
+
+    def _index(self, rows, delete=False):
+        """Add the originals of the rows, (id, engine_name, source_lang,
+        target_lang, original), to the index or delete them from it."""
+        items = []
+        for id, engine_name, source_lang, target_lang, original in rows:
+            items.extend(
+                (bucket, id) for bucket in self._buckets(
+                    engine_name, source_lang, target_lang, original))
+        self.cursor.executemany(
+            'DELETE FROM fuzzy WHERE bucket=? AND id=?' if delete else
+            'INSERT OR IGNORE INTO fuzzy VALUES (?, ?)', items)
+
+    def recall(self, engine_name, source_lang, target_lang, texts):
+        """Return the translations of the texts, None for those missing."""
+        keys = [self._key(engine_name, source_lang, target_lang, text)
+                for text in texts]
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), self.chunk_size):
+                chunk = keys[start:start + self.chunk_size]
+                found.update(self.cursor.execute(
+                    'SELECT key, translation FROM memory WHERE key IN (%s)'
+                    % ', '.join(['?'] * len(chunk)), chunk).fetchall())
+            now = time.time()
+            self.cursor.executemany(
+                'UPDATE memory SET used=? WHERE key=?',
+                [(now, key) for key in found])
+            hits = len([key for key in keys if key in found])
+            self._count_usage(hits, len(keys) - hits)
+            self._flush_touched()
+            self.connection.commit()
+        return [found.get(key) for key in keys]
+
+    def search(self, engine_name, source_lang, target_lang, text, score):
+        """Return the most similar original to the text, with a similarity
+        of at least the score, as (similarity, original, translation), or
+        None if there is none."""
+        buckets = self._buckets(engine_name, source_lang, target_lang, text)
+        with self.lock:
+            ids = Counter(id for id, in self.cursor.execute(
+                'SELECT id FROM fuzzy WHERE bucket IN (%s)'
+                % ', '.join(['?'] * len(buckets)), buckets))
+            if not ids:
+                return None
+            ids = [id for id, _count in ids.most_common(self.candidate_count)]
+            rows = self.cursor.execute(
+                'SELECT rowid, original, translation FROM memory '
+                'WHERE rowid IN (%s) AND engine_name=? AND source_lang=? '
+                'AND target_lang=?' % ', '.join(['?'] * len(ids)),
+                ids + [engine_name, source_lang, target_lang]).fetchall()
+            shingles_text = shingles(text)
+            best = None
+            for id, original, translation in rows:
+                value = similarity(shingles_text, shingles(original))
+                if value >= score and (best is None or value > best[0]):
+                    best = (value, original, translation, id)
+            if best is None:
+                return None
+            self.touched[best[3]] = time.time()
+        return best[:3]
+
+    def _flush_touched(self):
+        """Write the time of use of the translations found by searching,
+        which is left to the next write rather than a commit each."""
+        self.cursor.executemany(
+            'UPDATE memory SET used=? WHERE rowid=?',
+            [(used, id) for id, used in self.touched.items()])
+        self.touched.clear()
+
+    def memorize(self, engine_name, source_lang, target_lang, text,
+                 translation):
+        self.memorize_many(
+            engine_name, source_lang, target_lang, [(text, translation)])
+
+    def memorize_many(self, engine_name, source_lang, target_lang, items):
+        """Keep the translations of the items, (text, translation), in a
+        single transaction."""
+        now = time.time()
+        with self.lock:
+            rows = []
+            for text, translation in items:
+                key = self._key(engine_name, source_lang, target_lang, text)
+                size = len(text.encode('utf-8')) + \
+                    len(translation.encode('utf-8'))
+                row = self.cursor.execute(
+                    'SELECT size FROM memory WHERE key=?', (key,)).fetchone()
+                self.size += size
+                # The original is the same but for the spaces, so it stays
+                # in the same buckets.
+                if row is not None:
+                    self.size -= row[0]
+                    self.cursor.execute(
+                        'UPDATE memory SET original=?, translation=?, '
+                        'size=?, used=? WHERE key=?',
+                        (text, translation, size, now, key))
+                    continue
+                self.count += 1
+                self.cursor.execute(
+                    'INSERT INTO memory VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, engine_name, source_lang, target_lang, text,
+                     translation, size, now))
+                rows.append((
+                    self.cursor.lastrowid, engine_name, source_lang,
+                    target_lang, text))
+            self._index(rows)
+            self._flush_touched()
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        excess_count = excess_size = 0
+        if self.max_entries > 0 and self.count > self.max_entries:
+            excess_count = self.count - int(self.max_entries * 0.9)
+        if self.max_size > 0 and self.size > self.max_size:
+            excess_size = self.size - int(self.max_size * 0.9)
+        if excess_count < 1 and excess_size < 1:
+            return
+        rows = []
+        freed = 0
+        # Walk the index of the use lazily, as few rows are needed.
+        for row in self.connection.execute(
+                'SELECT rowid, engine_name, source_lang, target_lang, '
+                'original, size FROM memory ORDER BY used'):
+            if len(rows) >= excess_count and freed >= excess_size:
+                break
+            rows.append(row[:5])
+            freed += row[5]
+        self.cursor.executemany(
+            'DELETE FROM memory WHERE rowid=?', [row[:1] for row in rows])
+        self._index(rows, delete=True)
+        self.count -= len(rows)
+        self.size -= freed
+
+    def _count_usage(self, hits, misses):
+        for name, count in (('hits', hits), ('misses', misses)):
+            self.cursor.execute(
+                'INSERT INTO info VALUES (?1, ?2) ON CONFLICT (key) DO '
+                'UPDATE SET value=value+excluded.value', (name, count))
+
+    def get_stats(self):
+        """Return the entries, bytes, hits and misses of all time, and the
+        share of the lookups found."""
+        with self.lock:
+            info = dict(self.cursor.execute(
+                'SELECT key, value FROM info').fetchall())
+        hits, misses = info.get('hits', 0), info.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'entries': self.count, 'size': self.size, 'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self.lock:
+            self.cursor.execute('DELETE FROM memory')
+            self.cursor.execute('DELETE FROM fuzzy')
+            self.cursor.execute('DELETE FROM info')
+            self.connection.commit()
+            self.touched.clear()
+            self.count = self.size = 0
+
+    def close(self):
+        with self.lock:
+            self._flush_touched()
+            self.cursor.close()
+            self.connection.commit()
+            self.connection.close()
+
+
+def memory_path():
+    dir_path = TranslationCache.dir_path
+    not os.path.exists(dir_path) and os.mkdir(dir_path)
+    return os.path.join(dir_path, 'memory.db')
+
+
+def get_memory():
+    config = get_config()
+    return TranslationMemory(
+        memory_path(), config.get('memory_max_entries'),
+        config.get('memory_max_size') * 1024 * 1024)
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import os.path
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from .utils import error_chain
+from .config import get_config
+from .concurrency import is_overloaded
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+
+# The upper bounds of the buckets of the latencies in seconds.
+latency_bounds = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def data_size(data):
+    """The bytes of the data sent with a request."""
+    if data is None:
+        return 0
+    if isinstance(data, dict):
+        data = urlencode(data)
+    if not isinstance(data, bytes):
+        data = str(data).encode('utf-8')
+    return len(data)
+
+
+class Histogram:
+    """The counts of the values up to each bound, as a histogram of
+    Prometheus, which can be summarized with quantiles."""
+    def __init__(self, bounds=latency_bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, share):
+        """Estimate the quantile by interpolating within its bucket, or
+        return the last bound if it is beyond."""
+        if self.count < 1:
+            return 0.0
+        rank = share * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count > 0 and seen + count >= rank:
+                if index == len(self.bounds):
+                    break
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                return lower + (self.bounds[index] - lower) * \
+                    (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class RequestMetric:
+    """The measures of a request to an engine: the time to the first byte
+    and the latency in seconds, the bytes sent and received, the HTTP status,
+    the retries of the request before and whether it was throttled."""
+    def __init__(self, metrics, engine, key=None, retry=0, bytes_sent=0):
+        self.metrics = metrics
+        self.engine = engine
+        self.key = key
+        self.retry = retry
+        self.bytes_sent = bytes_sent
+        self.bytes_received = None
+        self.status = None
+        self.ttfb = None
+        self.latency = None
+        self.throttled = False
+        self.error = None
+        self.start = time.time()
+
+    def begin(self):
+        self.start = time.time()
+
+    def respond(self, response):
+        """The headers of the response arrived."""
+        self.ttfb = time.time() - self.start
+        try:
+            status = response.getcode()
+        except Exception:
+            status = None
+        self.status = status if isinstance(status, int) else None
+
+    def receive(self, size):
+        self.bytes_received = size
+
+    def finish(self, error=None):
+        self.latency = time.time() - self.start
+        if error is not None:
+            self.error = type(error).__name__
+            self.throttled = is_overloaded(error)
+            for item in error_chain(error):
+                code = getattr(item, 'code', None)
+                if isinstance(code, int):
+                    self.status = code
+                    break
+        self.metrics.record(self)
+
+    def to_dict(self):
+        return {
+            'time': round(self.start, 3), 'engine': self.engine,
+            'key': self.key, 'status': self.status, 'retry': self.retry,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'ttfb': None if self.ttfb is None else round(self.ttfb, 4),
+            'latency': round(self.latency, 4), 'throttled': self.throttled,
+            'error': self.error}
+
+
+class EngineStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.statuses = Counter()
+        self.latency = Histogram()
+        self.ttfb = Histogram()
+
+    def add(self, metric):
+        self.requests += 1
+        self.failures += metric.error is not None
+        self.throttled += metric.throttled
+        self.retries += metric.retry > 0
+        self.bytes_sent += metric.bytes_sent
+        self.bytes_received += metric.bytes_received or 0
+        self.statuses[metric.status] += 1
+        self.latency.observe(metric.latency)
+        metric.ttfb is not None and self.ttfb.observe(metric.ttfb)
+
+
+class MemorySink:
+    """Aggregate the measures of the requests by engine."""
+    def __init__(self):
+        self.engines = {}
+
+    def record(self, metric):
+        stats = self.engines.get(metric.engine)
+        if stats is None:
+            stats = self.engines[metric.engine] = EngineStats()
+        stats.add(metric)
+
+    def flush(self):
+        pass
+
+
+class JsonLinesSink:
+    """Append the measures of each request to a file as a line of JSON. The
+    file is opened for each line, so that the jobs can share it."""
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def record(self, metric):
+        with open(self.file_path, 'a') as file:
+            file.write(json.dumps(metric.to_dict()) + '\n')
+
+    def flush(self):
+        pass
+
+
+class PrometheusSink(MemorySink):
+    """Write the aggregated measures to a file in the text format of
+    Prometheus, as read by the textfile collector of the node exporter."""
+    prefix = 'ebook_translator_'
+
+    def __init__(self, file_path):
+        MemorySink.__init__(self)
+        self.file_path = file_path
+
+    def _label(self, value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"') \
+            .replace('\n', r'\n')
+
+    def _histogram(self, lines, name, engine, histogram):
+        cumulative = 0
+        for bound, count in zip(
+                histogram.bounds + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append('%s%s_bucket{engine="%s",le="%s"} %d' % (
+                self.prefix, name, engine, bound, cumulative))
+        lines.append('%s%s_sum{engine="%s"} %s' % (
+            self.prefix, name, engine, histogram.sum))
+        lines.append('%s%s_count{engine="%s"} %d' % (
+            self.prefix, name, engine, histogram.count))
+
+    def render(self):
+        lines = []
+        counters = (
+            ('request_failures_total', 'failures', 'Failed requests.'),
+            ('throttled_total', 'throttled', 'Throttled requests.'),
+            ('retries_total', 'retries', 'Requests sent again.'),
+            ('sent_bytes_total', 'bytes_sent', 'Bytes sent.'),
+            ('received_bytes_total', 'bytes_received', 'Bytes received.'))
+        lines.append('# HELP %srequests_total Requests by HTTP status.'
+                     % self.prefix)
+        lines.append('# TYPE %srequests_total counter' % self.prefix)
+        for engine, stats in sorted(self.engines.items()):
+            for status, count in sorted(
+                    stats.statuses.items(), key=lambda item: str(item[0])):
+                lines.append('%srequests_total{engine="%s",status="%s"} %d' % (
+                    self.prefix, self._label(engine),
+                    '' if status is None else status, count))
+        for name, attribute, description in counters:
+            lines.append('# HELP %s%s %s' % (self.prefix, name, description))
+            lines.append('# TYPE %s%s counter' % (self.prefix, name))
+            for engine, stats in sorted(self.engines.items()):
+                lines.append('%s%s{engine="%s"} %d' % (
+                    self.prefix, name, self._label(engine),
+                    getattr(stats, attribute)))
+        for name, attribute, description in (
+                ('latency_seconds', 'latency', 'Latency of the requests.'),
+                ('ttfb_seconds', 'ttfb', 'Time to the first byte.')):
+            lines.append('# HELP %s%s %s' % (self.prefix, name, description))
+            lines.append('# TYPE %s%s histogram' % (self.prefix, name))
+            for engine, stats in sorted(self.engines.items()):
+                self._histogram(
+                    lines, name, self._label(engine),
+                    getattr(stats, attribute))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        # Replace the file at once, as it may be read at any time.
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.file_path)))
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(self.render())
+        os.replace(temp_path, self.file_path)
+
+
+class Metrics:
+    """Pass the measures of the requests to the engines on to the sinks,
+    and aggregate them in memory for the summary of the job."""
+    def __init__(self, sinks=[]):
+        self.lock = threading.Lock()
+        self.aggregator = MemorySink()
+        self.sinks = [self.aggregator] + list(sinks)
+
+    def start(self, engine, key=None, retry=0, data=None):
+        return RequestMetric(self, engine, key, retry, data_size(data))
+
+    def record(self, metric):
+        with self.lock:
+            for sink in self.sinks:
+                sink.record(metric)
+
+    def summary(self):
+        """Return the stats of the requests by engine."""
+        with self.lock:
+            return dict(self.aggregator.engines)
+
+    def flush(self):
+        with self.lock:
+            for sink in self.sinks:
+                sink.flush()
+
+
+def get_metrics():
+    config = get_config()
+    sinks = []
+    jsonl_path = config.get('metrics_jsonl_path')
+    jsonl_path and sinks.append(JsonLinesSink(jsonl_path))
+    prometheus_path = config.get('metrics_prometheus_path')
+    prometheus_path and sinks.append(PrometheusSink(prometheus_path))
+    return Metrics(sinks)
@@ -0,0 +1,272 @@
+import time
+import socket
+import weakref
+import threading
+from functools import partial
+
+from mechanize import HTTPHandler, HTTPSHandler
+
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+
+load_translations()
+
+
+class ConnectionPool:
+    """Keep-alive connections shared by all requests of an engine.
+
+    :pool_size: The maximum number of idle connections to keep open.
+    :per_host: The maximum number of connections in use for a single host,
+        0 means no limit.
+    :idle_timeout: Idle connections older than this (in seconds) are closed
+        instead of reused, as servers tend to drop them silently.
+    """
+    def __init__(self, pool_size=10, per_host=0, idle_timeout=60.0):
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.idle_timeout = idle_timeout
+
+        self.lock = threading.Condition()
+        self.idle = {}
+        self.busy = {}
+
+        self.created = 0
+        self.reused = 0
+
+    def configure(self, pool_size=None, per_host=None, idle_timeout=None):
+        with self.lock:
+            if pool_size is not None:
+                self.pool_size = int(pool_size)
+            if per_host is not None:
+                self.per_host = int(per_host)
+            if idle_timeout is not None:
+                self.idle_timeout = float(idle_timeout)
+            self.lock.notify_all()
+
+    def idle_count(self):
+        with self.lock:
+            return sum(len(connections) for connections in self.idle.values())
+
+    def _evict(self, now):
+        for key, connections in list(self.idle.items()):
+            for item in connections[:]:
+                if now - item[1] > self.idle_timeout:
+                    connections.remove(item)
+                    item[0].close()
+            if not connections:
+                del self.idle[key]
+
+    def evict(self):
+        """Close idle connections which have expired."""
+        with self.lock:
+            self._evict(time.time())
+
+    def acquire(self, key, create, timeout=None):
+        """Get an idle connection to the host or create a new one. Returns a
+        tuple of the connection and whether it was reused.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.lock:
+            while self.per_host > 0 and \
+                    self.busy.get(key, 0) >= self.per_host:
+                remaining = None if deadline is None \
+                    else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise socket.timeout(
+                        _('Timed out waiting for an available connection.'))
+                self.lock.wait(remaining)
+            self.busy[key] = self.busy.get(key, 0) + 1
+            self._evict(time.time())
+            connections = self.idle.get(key)
+            if connections:
+                self.reused += 1
+                return (connections.pop()[0], True)
+            self.created += 1
+        try:
+            return (create(), False)
+        except Exception:
+            self.release(key, None)
+            raise
+
+    def release(self, key, connection, reusable=True):
+        with self.lock:
+            self.busy[key] = max(0, self.busy.get(key, 0) - 1)
+            if connection is not None:
+                if reusable and self.pool_size > 0:
+                    self.idle.setdefault(key, []).append(
+                        (connection, time.time()))
+                    self._shrink()
+                else:
+                    connection.close()
+            self.lock.notify()
+
+    def _shrink(self):
+        """Close the least recently used connections beyond the pool size."""
+        items = [(item[1], key, item) for key, connections
+                 in self.idle.items() for item in connections]
+        for _timestamp, key, item in sorted(items, key=lambda i: i[0])[
+                :max(0, len(items) - self.pool_size)]:
+            self.idle[key].remove(item)
+            item[0].close()
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection, _timestamp in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+class PooledResponse:
+    """Return the connection to the pool once the body is fully consumed. If
+    the response is dropped before that, the connection is discarded.
+    """
+    def __init__(self, response, release):
+        self.response = response
+        self._release = release
+        self._finalizer = weakref.finalize(self, release, False)
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def _check(self):
+        if self.response.isclosed() and self._finalizer.alive:
+            self._finalizer.detach()
+            self._release(not self.response.will_close)
+
+    def read(self, *args):
+        data = self.response.read(*args)
+        self._check()
+        return data
+
+    def read1(self, *args):
+        data = self.response.read1(*args)
+        self._check()
+        return data
+
+    def readinto(self, buffer):
+        size = self.response.readinto(buffer)
+        self._check()
+        return size
+
+    def readline(self, *args):
+        line = self.response.readline(*args)
+        self._check()
+        return line
+
+    def close(self):
+        self.response.close()
+        if self._finalizer.alive:
+            self._finalizer.detach()
+            self._release(False)
+
+
+class PooledConnection:
+    """Stand in for HTTPConnection in mechanize which leases a real connection
+    from the pool on request, instead of opening one for every request.
+    """
+    def __init__(self, pool, scheme, create, host, timeout=None):
+        self.pool = pool
+        self.scheme = scheme
+        self.create = create
+        self.host = host
+        self.timeout = timeout
+        self.tunnel = None
+        self.debuglevel = 0
+        self.response = None
+
+    def set_debuglevel(self, level):
+        self.debuglevel = level
+
+    def set_tunnel(self, host, port=None, headers=None):
+        self.tunnel = (host, port, headers)
+
+    def _connect(self):
+        connection = self.create(self.host, timeout=self.timeout)
+        connection.set_debuglevel(self.debuglevel)
+        if self.tunnel is not None:
+            connection.set_tunnel(*self.tunnel)
+        return connection
+
+    def request(self, method, url, body=None, headers={}):
+        # Mechanize asks the server to close the connection after every
+        # response, which is exactly what the pool is here to avoid.
+        headers = dict((name, value) for name, value in headers.items()
+                       if name.lower() != 'connection')
+        key = (self.scheme, self.host, self.tunnel and self.tunnel[:2])
+        # Mechanize passes a sentinel object if no timeout was specified.
+        timeout = self.timeout if isinstance(self.timeout, (int, float)) \
+            else None
+        while True:
+            connection, reused = self.pool.acquire(
+                key, self._connect, timeout)
+            if reused and connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request(method, url, body, headers)
+                response = connection.getresponse()
+            except (socket.error, HTTPException):
+                self.pool.release(key, connection, False)
+                # The server may have closed the idle connection already,
+                # so it is worth one more try with a fresh connection.
+                if reused:
+                    continue
+                raise
+            break
+        self.response = PooledResponse(
+            response, partial(self.pool.release, key, connection))
+
+    def getresponse(self):
+        return self.response
+
+    def close(self):
+        self.response is not None and self.response.close()
+
+
+class KeepAliveHandler:
+    handler_order = 400  # Before the default HTTP(S) handlers.
+
+    def _open(self, scheme, create, req):
+        def connection(host, timeout=None):
+            return PooledConnection(self.pool, scheme, create, host, timeout)
+        return self.do_open(connection, req)
+
+
+class KeepAliveHTTPHandler(KeepAliveHandler, HTTPHandler):
+    def __init__(self, pool):
+        HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        return self._open('http', HTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(KeepAliveHandler, HTTPSHandler):
+    def __init__(self, pool, ssl_context=None):
+        HTTPSHandler.__init__(self)
+        self.pool = pool
+        self.ssl_context = ssl_context
+
+    def https_open(self, req):
+        return self._open(
+            'https', partial(HTTPSConnection, context=self.ssl_context), req)
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_connection_pool(name, pool_size=None, per_host=None,
+                        idle_timeout=None):
+    """Pools are shared by all instances of the same engine in the process,
+    so the connections stay warm between translation jobs.
+    """
+    with pools_lock:
+        pool = pools.get(name)
+        if pool is None:
+            pool = pools[name] = ConnectionPool()
+    pool.configure(pool_size, per_host, idle_timeout)
+    return pool
@@ -0,0 +1,80 @@
+import re
+import time
+import random
+from email.utils import parsedate_tz, mktime_tz
+
+from .utils import error_chain
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: the delay before the nth retry
+    is random between 0 and the base delay times 2 ** (n - 1), capped by the
+    maximum delay. A delay hinted by the server with the Retry-After or rate
+    limit reset headers of a throttled request is honored instead, up to the
+    maximum delay.
+    """
+    # Some APIs send the rate limit reset headers with every response, which
+    # only ask to wait along with these statuses.
+    throttled_statuses = (429, 503)
+
+    def __init__(self, base_delay=2.0, max_delay=60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, retry, error=None):
+        hint = None if error is None else self.get_hint(error)
+        if hint is not None:
+            return min(self.max_delay, hint)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return random.uniform(0, ceiling)
+
+    def get_hint(self, error):
+        """Return the seconds the server asked to wait, or None."""
+        for error in error_chain(error):
+            headers = getattr(error, 'hdrs', None) or \
+                getattr(error, 'headers', None)
+            code = getattr(error, 'code', None)
+            if headers is None or code not in self.throttled_statuses:
+                continue
+            delays = []
+            for name, parse in (
+                    ('retry-after', parse_retry_after),
+                    ('retry-after-ms', lambda v: float(v) / 1000),
+                    ('x-ratelimit-reset-requests', parse_duration),
+                    ('x-ratelimit-reset-tokens', parse_duration),
+                    ('x-ratelimit-reset', parse_reset),
+                    ('ratelimit-reset', parse_reset)):
+                value = headers.get(name)
+                if value is None:
+                    continue
+                try:
+                    delays.append(max(0.0, parse(value.strip())))
+                except Exception:
+                    pass
+            if delays:
+                return max(delays)
+        return None
+
+
+def parse_retry_after(value):
+    """The value is either seconds or an HTTP date."""
+    if value.isdigit():
+        return float(value)
+    return mktime_tz(parsedate_tz(value)) - time.time()
+
+
+def parse_duration(value):
+    """Parse the durations like "1s", "6m0s" or "20ms"."""
+    units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    parts = re.findall(r'([\d.]+)(ms|h|m|s)', value)
+    if not parts:
+        return float(value)
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def parse_reset(value):
+    """The value is either seconds or an epoch timestamp."""
+    value = float(value)
+    if value > 1e9:
+        return value - time.time()
+    return value
@@ -1,9 +1,9 @@
 import time
-from threading import Thread
+from threading import Thread, Condition, Lock, Timer
 
 from ..lib.utils import traceback_error
 
-from .exception import TranslationCanceled
+from .exception import TranslationCanceled, TranslationDeferred
 
 
 try:
@@ -14,34 +14,52 @@ except ImportError:
 
 class ThreadHandler:
     def __init__(self, paragraphs, concurrency_limit, translate_paragraph,
-                 process_translation, request_interval):
+                 process_translation, concurrency=None):
         self.queue = queue.Queue()
         for paragraph in paragraphs:
             self.queue.put_nowait(paragraph)
         self.done_queue = queue.Queue()
 
         self.concurrency_limit = concurrency_limit or 10  # 0 or 10
+        self.concurrency = concurrency
+        if concurrency is not None:
+            self.concurrency_limit = concurrency.maximum
+        self.slots = Condition()
+        self.lock = Lock()
+        self.retries = {}
         self.translate_paragraph = translate_paragraph
         self.process_translation = process_translation
-        self.request_interval = request_interval
 
     def translation_thread(self):
-        while not self.queue.empty():
+        while True:
+            paragraph = self.queue.get()
+            if paragraph is None:
+                self.queue.task_done()
+                break
             try:
-                paragraph = self.queue.get_nowait()
-                self.translate_paragraph(paragraph)
+                self.acquire_slot()
+                try:
+                    self.translate_paragraph(paragraph)
+                finally:
+                    self.release_slot()
                 paragraph.error = None
-                if self.queue.qsize() > 0 and not paragraph.is_cache:
-                    time.sleep(self.request_interval)
                 self.done_queue.put(paragraph)
                 self.queue.task_done()
-            except queue.Empty:
-                break
+            except TranslationDeferred:
+                self.retry_later(paragraph)
             except TranslationCanceled:
                 self.queue.task_done()
+                self.cancel_retries()
                 while not self.queue.empty():
-                    self.queue.get_nowait()
+                    try:
+                        paragraph = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
                     self.queue.task_done()
+                    # Leave the signal of termination to its thread.
+                    if paragraph is None:
+                        self.queue.put(None)
+                        break
                 while not self.done_queue.empty():
                     self.done_queue.get_nowait()
                     self.done_queue.task_done()
@@ -51,6 +69,47 @@ class ThreadHandler:
                 self.done_queue.put(paragraph)
                 self.queue.task_done()
 
+    def retry_later(self, paragraph):
+        """Put the paragraph back into the queue once it is due, without
+        occupying a thread in the meantime."""
+        timer = Timer(
+            max(0, paragraph.not_before - time.time()), self.requeue,
+            (paragraph,))
+        timer.daemon = True
+        with self.lock:
+            self.retries[id(paragraph)] = timer
+        timer.start()
+
+    def requeue(self, paragraph):
+        with self.lock:
+            if self.retries.pop(id(paragraph), None) is None:
+                return
+            self.queue.put(paragraph)
+            # The paragraph stays unfinished until it is back in the queue.
+            self.queue.task_done()
+
+    def cancel_retries(self):
+        with self.lock:
+            for timer in self.retries.values():
+                timer.cancel()
+                self.queue.task_done()
+            self.retries.clear()
+
+    def acquire_slot(self):
+        if self.concurrency is None:
+            return
+        with self.slots:
+            while not self.concurrency.is_available():
+                self.slots.wait()
+            self.concurrency.enter()
+
+    def release_slot(self):
+        if self.concurrency is None:
+            return
+        with self.slots:
+            self.concurrency.leave()
+            self.slots.notify_all()
+
     def processing_thread(self):
         while True:
             paragraph = self.done_queue.get()
@@ -69,6 +128,11 @@ class ThreadHandler:
 
     def handle(self):
         Thread(target=self.processing_thread).start()
-        for thread in self.create_threads():
+        threads = self.create_threads()
+        # Wait for the retries as well, which are not in the queue yet.
+        self.queue.join()
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
             thread.join()
         self.done_queue.put(None)
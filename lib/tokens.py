@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import os.path
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from calibre.utils.config import config_dir
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class TokenCache:
+    """The access tokens of the engines, kept in a file until they expire,
+    so that the jobs, each in a process of its own, share them rather than
+    requesting one each.
+
+    :margin: Seconds before the expiry from which a token is renewed, so that
+        it does not expire on the way to the engine.
+
+    The file is locked while a token is renewed, so that the jobs starting
+    at once wait for the first one to get it.
+    """
+    margin = 60
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock_path = file_path + '.lock'
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self.lock, open(self.lock_path, 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                # It gives up after 10 seconds, so keep on trying.
+                while True:
+                    try:
+                        msvcrt.locking(
+                            lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load(self):
+        try:
+            with open(self.file_path) as file:
+                tokens = json.load(file)
+            return tokens if isinstance(tokens, dict) else {}
+        except Exception:
+            return {}
+
+    def _save(self, tokens):
+        # Replace the file at once, as it is read without the lock.
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.file_path))
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(tokens, file)
+        os.replace(temp_path, self.file_path)
+
+    def _find(self, tokens, name):
+        entry = tokens.get(name)
+        if isinstance(entry, dict) and \
+                entry.get('expires', 0) - self.margin > time.time():
+            return entry['token'], entry['expires']
+        return None
+
+    def get(self, name):
+        """Return the token of the name, as (token, expires), or None if
+        there is none or it is about to expire."""
+        return self._find(self._load(), name)
+
+    def fetch(self, name, renew):
+        """Return the token of the name, as (token, expires), renewing it
+        with the callable if needed, which returns a new one likewise."""
+        entry = self.get(name)
+        if entry is not None:
+            return entry
+        with self._locked():
+            tokens = self._load()
+            # Another job may have renewed it while waiting for the lock.
+            entry = self._find(tokens, name)
+            if entry is not None:
+                return entry
+            token, expires = renew()
+            now = time.time()
+            tokens = dict(
+                (key, value) for key, value in tokens.items()
+                if isinstance(value, dict) and value.get('expires', 0) > now)
+            tokens[name] = {'token': token, 'expires': expires}
+            self._save(tokens)
+        return token, expires
+
+
+def token_path():
+    dir_path = os.path.join(config_dir, 'plugins')
+    not os.path.exists(dir_path) and os.makedirs(dir_path)
+    return os.path.join(dir_path, 'ebook_translator_tokens.json')
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(token_path())
+    return _token_cache
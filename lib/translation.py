@@ -8,10 +8,15 @@ from ..engines import builtin_engines
 from ..engines import GoogleFreeTranslate
 from ..engines.custom import CustomTranslate
 
-from .utils import sep, trim, dummy, traceback_error
+from .utils import sep, trim, dummy, traceback_error, size_by_unit
 from .config import get_config
+from .concurrency import is_overloaded
+from .memory import normalize, get_memory
+from .metrics import get_metrics
+from .retry import RetryPolicy
 from .exception import (
-    TranslationFailed, TranslationCanceled, NoAvailableApiKey)
+    TranslationFailed, TranslationCanceled, TranslationDeferred,
+    NoAvailableApiKey)
 
 
 load_translations()
@@ -78,6 +83,32 @@ class ProgressBar:
         return self._count
 
 
+class ParagraphBatch:
+    """Paragraphs translated with a single request. The handlers treat it as
+    a paragraph, so it carries the error of the request.
+    """
+    def __init__(self):
+        self.paragraphs = []
+        self.count = 0
+        self.size = 0
+        self.error = None
+        self.retry = 0
+        self.not_before = 0.0
+        self.failover = 0
+
+    @property
+    def row(self):
+        return self.paragraphs[0].row if self.paragraphs else -1
+
+    def add(self, paragraph, size=None):
+        """Cached paragraphs are added without a size, as they do not go
+        into the request."""
+        self.paragraphs.append(paragraph)
+        if size is not None:
+            self.count += 1
+            self.size += size
+
+
 class Translation:
     def __init__(self, translator, glossary):
         self.translator = translator
@@ -89,11 +120,32 @@ class Translation:
         self.log = dummy
         self.streaming = dummy
         self.callback = dummy
+        self.checkpoint = dummy
         self.cancel_request = dummy
+        self.memory = None
+        # The translations of the job to keep in the memory, which are
+        # written at once when it ends rather than as they arrive.
+        self.memorized = []
+        self.metrics = None
+        # The similarity from which the translation of a similar original
+        # in the memory is used, 0 means only the same original.
+        self.reuse_score = 0
 
         self.total = 0
+        # The paragraphs given the translation of an identical one, by the
+        # identity of the paragraph sent in their place.
+        self.duplicates = {}
         self.progress_bar = ProgressBar()
         self.abort_count = 0
+        self.rate_limiter = None
+        self.concurrency = None
+        self.retry_policy = RetryPolicy()
+        self.api_key_pool = None
+        self.hedging = None
+        # The translations of the engines to switch to in order, which
+        # share the chain. Batches are packed for the first engine.
+        self.chain = [self]
+        self.level = 0
 
     def set_fresh(self, fresh):
         self.fresh = fresh
@@ -113,15 +165,50 @@ class Translation:
     def set_callback(self, callback):
         self.callback = callback
 
+    def set_checkpoint(self, checkpoint):
+        self.checkpoint = checkpoint
+
+    def set_memory(self, memory):
+        self.memory = memory
+
+    def set_reuse_score(self, score):
+        self.reuse_score = score
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+
     def set_cancel_request(self, cancel_request):
         self.cancel_request = cancel_request
 
+    def add_failover(self, translation):
+        """Switch to the translation if this and the translations added
+        before fail."""
+        translation.chain = self.chain
+        translation.level = len(self.chain)
+        self.chain.append(translation)
+
+    def get_failover(self):
+        if self.level + 1 < len(self.chain):
+            return self.chain[self.level + 1]
+        return None
+
     def need_stop(self):
         # Cancel the request if there are more than max continuous errors.
         return self.translator.max_error_count > 0 and \
             self.abort_count >= self.translator.max_error_count
 
-    def _translate_text(self, row, text, retry=0, interval=0):
+    def _route(self, paragraph):
+        """Return the translation of the chain to translate the paragraph
+        with, skipping the engines with too many errors."""
+        if len(self.chain) < 2:
+            return self
+        level = paragraph.failover
+        while level + 1 < len(self.chain) and self.chain[level].need_stop():
+            level += 1
+        paragraph.failover = level
+        return self.chain[level]
+
+    def _translate_text(self, paragraph, text):
         """Translation engine service error code documentation:
         * https://cloud.google.com/apis/design/errors
         * https://www.deepl.com/docs-api/api-access/error-handling/
@@ -129,52 +216,440 @@ class Translation:
         * https://ai.youdao.com/DOCSIRMA/html/trans/api/wbfy/index.html
         * https://api.fanyi.baidu.com/doc/21
         """
-        if self.cancel_request():
-            raise TranslationCanceled(_('Translation canceled.'))
-        try:
-            text = self.glossary.replace(text)
-            translation = self.translator.translate(text)
-            self.abort_count = 0
-            return translation
-        except Exception as e:
-            if self.cancel_request() or self.need_stop():
+        text = self.glossary.replace(text)
+        return self._request(paragraph, text, self.translator.translate)
+
+    def _translate_texts(self, batch, texts):
+        texts = [self.glossary.replace(text) for text in texts]
+
+        def translate_batch(texts):
+            translations = []
+            for chunk in self._split_texts(texts):
+                translations.extend(self._translate_chunk(chunk))
+            return translations
+        return self._request(batch, texts, translate_batch)
+
+    def _translate_chunk(self, texts):
+        """Request the translations of the texts, then those missing from
+        the response again, as long as fewer of them are missing."""
+        translations = [None] * len(texts)
+        missing = list(range(len(texts)))
+        while True:
+            missing_texts = [texts[index] for index in missing]
+            if len(missing) < len(texts):
+                delay = self._reserve(missing_texts)
+                delay > 0 and time.sleep(delay)
+            results = self.translator.translate_batch(missing_texts)
+            missing = self._fill_missing(translations, missing, results)
+            if not missing:
+                return translations
+
+    def _fill_missing(self, translations, missing, results):
+        """Put the results in place of the missing translations and return
+        the indices of those still missing."""
+        self._check_batch(missing, results)
+        for index, result in zip(missing, results):
+            translations[index] = result
+        remaining = [index for index in missing if translations[index] is None]
+        if len(remaining) == len(missing):
+            raise Exception(
+                _('Translations of {} segments are missing.')
+                .format(len(missing)))
+        if remaining:
+            self.log(_('Requesting {} missing translations again.')
+                     .format(len(remaining)))
+        return remaining
+
+    def _split_texts(self, texts):
+        """Split the texts of a batch packed for the first engine of the
+        chain within the limits of this engine."""
+        if self.level == 0:
+            return [texts]
+        batch_size = self.translator.batch_size
+        batch_bytes = self.translator.batch_bytes
+        if not self.translator.is_batch_supported():
+            batch_size, batch_bytes = 1, 0
+        chunks = []
+        size = 0
+        for text in texts:
+            length = len(text.encode('utf-8'))
+            if not chunks or len(chunks[-1]) >= batch_size or (
+                    batch_bytes > 0 and size + length > batch_bytes):
+                chunks.append([])
+                size = 0
+            chunks[-1].append(text)
+            size += length
+        return chunks
+
+    def _check_batch(self, texts, translations):
+        if len(translations) != len(texts):
+            raise Exception(
+                _('Expected {} translations but received {}.')
+                .format(len(texts), len(translations)))
+
+    def _reserve(self, text):
+        """Reserve the budgets of the engine for a request with the text,
+        which is a list for a batch, and return the seconds to wait."""
+        if self.rate_limiter is None:
+            return 0.0
+        texts = text if isinstance(text, list) else [text]
+        return self.rate_limiter.reserve(
+            1, sum(len(text) for text in texts),
+            sum(self.translator.count_tokens(text) for text in texts))
+
+    def _adapt(self, start, error=None):
+        """Feed the outcome of a request to the adaptive concurrency."""
+        if self.concurrency is None:
+            return
+        if error is None:
+            limit = self.concurrency.on_success(time.time() - start)
+        elif is_overloaded(error):
+            limit = self.concurrency.on_failure()
+        else:
+            return
+        if limit is not None:
+            self.log(_('Concurrency limit: {}').format(limit))
+
+    def _lease_api_key(self):
+        """Wait for a key of the API key pool, if any, to send a request."""
+        if self.api_key_pool is None:
+            return None
+        while True:
+            key, delay = self.api_key_pool.acquire()
+            delay > 0 and time.sleep(delay)
+            if key is not None:
+                return key
+            if self.cancel_request():
                 raise TranslationCanceled(_('Translation canceled.'))
-            # Try to retrieve an available API key.
-            if self.translator.need_change_api_key(str(e).lower()):
-                if not self.translator.change_api_key():
-                    raise NoAvailableApiKey(_('No available API key.'))
-                self.log(
-                    _('API key was Changed due to previous one unavailable.'))
-            else:
-                self.abort_count += 1
-                message = _(
-                    'Failed to retrieve data from translate engine API.')
-                if retry >= self.translator.request_attempt:
-                    raise TranslationFailed('{}\n{}'.format(message, str(e)))
-                retry += 1
-                interval += 5
-                # Logging any errors that occur during translation.
-                logged_text = text[:200] + '...' if len(text) > 200 else text
-                error_messages = [
-                    sep(), _('Original: {}').format(logged_text), sep('┈'),
-                    _('Status: Failed {} times / Sleeping for {} seconds')
-                    .format(retry, interval), sep('┈'), _('Error: {}')
-                    .format(traceback_error())]
-                if row >= 0:
-                    error_messages.insert(1, _('Row: {}').format(row))
-                self.log('\n'.join(error_messages), True)
-                time.sleep(interval)
-            return self._translate_text(text, retry, interval)
 
-    def translate_paragraph(self, paragraph):
+    def _use_api_key(self, key):
+        if key is not None:
+            self.translator.set_request_api_key(key.key)
+
+    def _release_api_key(self, key, text, error=None):
+        if key is None:
+            return
+        self.translator.set_request_api_key(None)
+        texts = text if isinstance(text, list) else [text]
+        hint = None if error is None else self.retry_policy.get_hint(error)
+        self.api_key_pool.release(
+            key, error, sum(len(text) for text in texts), hint)
+
+    def _request(self, paragraph, text, translate):
+        while True:
+            delay = self._reserve(text)
+            delay > 0 and time.sleep(delay)
+            if self.cancel_request():
+                raise TranslationCanceled(_('Translation canceled.'))
+            key = self._lease_api_key()
+            start = time.time()
+            try:
+                self._use_api_key(key)
+                self.translator.set_request_retry(paragraph.retry)
+                translation = translate(text)
+            except Exception as e:
+                self._release_api_key(key, text, e)
+                self._adapt(start, e)
+                self._handle_failure(e, paragraph, text, key)
+            else:
+                self._release_api_key(key, text)
+                self.abort_count = 0
+                self._adapt(start)
+                return translation
+
+    def _handle_failure(self, error, paragraph, text, key=None):
+        """Decide how to proceed with a failed request. Returns if it can be
+        sent again at once with another API key. Otherwise, it raises
+        TranslationDeferred after scheduling the retry on the paragraph, or
+        the error ending the translation of the paragraph. The paragraph
+        can also be a ParagraphBatch. The key is the one leased from the API
+        key pool for the request, if any.
+        """
+        failover = self.get_failover()
+        if self.cancel_request() or (self.need_stop() and failover is None):
+            raise TranslationCanceled(_('Translation canceled.'))
+        # Leave out the rejected key of the pool.
+        if key is not None and \
+                self.translator.is_api_key_error(str(error).lower()):
+            if self.api_key_pool.disable(key):
+                self.log(_('API key was disabled due to being unavailable, '
+                           '{} left.').format(self.api_key_pool.available()))
+            return
+        # Try to retrieve an available API key.
+        if self.translator.need_change_api_key(str(error).lower()):
+            if not self.translator.change_api_key():
+                raise NoAvailableApiKey(_('No available API key.'))
+            self.log(
+                _('API key was Changed due to previous one unavailable.'))
+            return
+        self.abort_count += 1
+        message = _(
+            'Failed to retrieve data from translate engine API.')
+        # Spill over to the next engine instead of giving up.
+        if failover is not None and (
+                self.need_stop() or
+                paragraph.retry >= self.translator.request_attempt):
+            paragraph.failover = failover.level
+            paragraph.retry = 0
+            paragraph.not_before = 0.0
+            self._log_failure(paragraph, text, _(
+                'Status: Failed with {} / Switching to {}').format(
+                    self.translator.name, failover.translator.name))
+            raise TranslationDeferred(message)
+        if paragraph.retry >= self.translator.request_attempt:
+            raise TranslationFailed('{}\n{}'.format(message, str(error)))
+        paragraph.retry += 1
+        delay = round(self.retry_policy.get_delay(paragraph.retry, error), 1)
+        paragraph.not_before = time.time() + delay
+        # The wait asked by the server applies to all requests, unless only
+        # the key of the request is resting.
+        if self.rate_limiter is not None and key is None and \
+                self.retry_policy.get_hint(error) is not None:
+            self.rate_limiter.pause(delay)
+        self._log_failure(paragraph, text, _(
+            'Status: Failed {} times / Retrying in {} seconds').format(
+                paragraph.retry, delay))
+        raise TranslationDeferred(message)
+
+    def _log_failure(self, paragraph, text, status):
+        """Logging any errors that occur during translation."""
+        if isinstance(text, list):
+            text = '\n'.join(text)
+        logged_text = text[:200] + '...' if len(text) > 200 else text
+        error_messages = [
+            sep(), _('Original: {}').format(logged_text), sep('┈'), status,
+            sep('┈'), _('Error: {}').format(traceback_error())]
+        if paragraph.row >= 0:
+            error_messages.insert(1, _('Row: {}').format(paragraph.row))
+        self.log('\n'.join(error_messages), True)
+
+    def _need_translate(self, paragraph):
         if self.cancel_request():
             raise TranslationCanceled(_('Translation canceled.'))
         if paragraph.translation and not self.fresh:
             paragraph.is_cache = True
-            return
+            return False
         self.streaming('')
         self.streaming(_('Translating...'))
-        translation = self._translate_text(paragraph.row, paragraph.original)
+        return True
+
+    def _resume(self, paragraph):
+        """Return the translation of the segments completed before the
+        stream of the paragraph broke off, and the original text of the
+        segments left to translate."""
+        separator = self.translator.separator
+        partial = paragraph.partial
+        if not partial or separator not in partial:
+            return '', paragraph.original
+        prefix = partial[:partial.rindex(separator) + len(separator)]
+        if not prefix.strip():
+            return '', paragraph.original
+        count = len(re.split(
+            '(?:%s)+' % re.escape(separator), prefix.strip()))
+        originals = paragraph.original.split(separator)
+        if count >= len(paragraph.original.strip().split(separator)):
+            return '', paragraph.original
+        self.log(_('Resuming the translation after {} segments.')
+                 .format(count))
+        return prefix, separator.join(originals[count:])
+
+    def _checkpoint(self, paragraph, prefix, text, translation):
+        """Yield the streamed translation following the prefix. If the
+        stream breaks off, what arrived is kept for the retry."""
+        chunks = [prefix]
+        try:
+            if prefix:
+                yield prefix
+            for chunk in translation:
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            paragraph.partial = ''.join(chunks)
+            self.checkpoint(paragraph)
+            self._handle_failure(e, paragraph, text)
+            raise TranslationDeferred(
+                _('Failed to retrieve data from translate engine API.'))
+
+    def _complete(self, paragraph, prefix, text, result):
+        if isinstance(result, GeneratorType):
+            return self._checkpoint(paragraph, prefix, text, result)
+        return prefix + result
+
+    def translate_paragraph(self, paragraph):
+        translation = self._route(paragraph)
+        if not translation._need_translate(paragraph):
+            return
+        prefix, text = translation._resume(paragraph)
+        result = translation._translate_text(paragraph, text)
+        translation._set_translation(
+            paragraph, translation._complete(paragraph, prefix, text, result))
+
+    def translate_paragraph_async(self, paragraph):
+        """Return an awaitable of translate_paragraph which awaits the engine
+        instead of blocking a thread. It is only available on Python 3.7+.
+        """
+        from .async_handler import translate_paragraph
+        return translate_paragraph(self, paragraph)
+
+    def pack_paragraphs(self, paragraphs):
+        """Pack the paragraphs into batches within the limits of the engine
+        on the segments and bytes of a request."""
+        batch_size = self.translator.batch_size
+        batch_bytes = self.translator.batch_bytes
+        batches = []
+        batch = None
+        for paragraph in paragraphs:
+            if paragraph.translation and not self.fresh:
+                if batch is None:
+                    batch = ParagraphBatch()
+                    batches.append(batch)
+                batch.add(paragraph)
+                continue
+            size = len(paragraph.original.encode('utf-8'))
+            if batch is None or batch.count >= batch_size or (
+                    batch_bytes > 0 and batch.count > 0
+                    and batch.size + size > batch_bytes):
+                batch = ParagraphBatch()
+                batches.append(batch)
+            batch.add(paragraph, size)
+        return batches
+
+    def _duplicate_key(self, paragraph, engine_name, target_lang):
+        return (engine_name, target_lang, normalize(paragraph.original))
+
+    def deduplicate(self, paragraphs):
+        """Return the paragraphs to translate, leaving out those identical to
+        one translated before or in the same job, which are given its
+        translation once it is processed.
+        """
+        self.duplicates = {}
+        engine_name = self.translator.name
+        target_lang = self.translator.get_target_lang()
+        translations = {}
+        for paragraph in paragraphs:
+            if paragraph.translation and not self.fresh:
+                key = self._duplicate_key(
+                    paragraph, paragraph.engine_name, paragraph.target_lang)
+                translations.setdefault(key, paragraph)
+        leaders = {}
+        unique = []
+        for paragraph in paragraphs:
+            if paragraph.translation and not self.fresh:
+                unique.append(paragraph)
+                continue
+            key = self._duplicate_key(paragraph, engine_name, target_lang)
+            translated = translations.get(key)
+            if translated is not None:
+                self._copy_translation(translated, paragraph)
+                unique.append(paragraph)
+                continue
+            leader = leaders.get(key)
+            if leader is None:
+                leaders[key] = paragraph
+                unique.append(paragraph)
+                continue
+            self.duplicates.setdefault(id(leader), []).append(paragraph)
+        return unique
+
+    def recall(self, paragraphs):
+        """Give the paragraphs to translate the translations of the same
+        originals in the translation memory, or of similar ones if allowed,
+        returning how many of each were found.
+        """
+        paragraphs = [paragraph for paragraph in paragraphs
+                      if not paragraph.translation]
+        if self.memory is None or self.fresh or not paragraphs:
+            return 0, 0
+        engine_name = self.translator.name
+        source_lang = self.translator.source_lang
+        target_lang = self.translator.get_target_lang()
+        translations = self.memory.recall(
+            engine_name, source_lang, target_lang,
+            [paragraph.original for paragraph in paragraphs])
+        count = similar = 0
+        for paragraph, translation in zip(paragraphs, translations):
+            if translation is None and self.reuse_score > 0:
+                match = self.memory.search(
+                    engine_name, source_lang, target_lang,
+                    paragraph.original, self.reuse_score)
+                if match is not None:
+                    translation = match[2]
+                    similar += 1
+            if translation is None:
+                continue
+            paragraph.translation = translation
+            paragraph.engine_name = engine_name
+            paragraph.target_lang = target_lang
+            count += 1
+        return count - similar, similar
+
+    def _memorize(self, paragraph):
+        if self.memory is None or not paragraph.translation:
+            return
+        self.memorized.append((
+            self.translator.name, self.translator.source_lang,
+            self.translator.get_target_lang(), paragraph.original,
+            paragraph.translation))
+
+    def _write_memory(self):
+        """Write the translations of the job to the memory, in a single
+        transaction for each engine and languages."""
+        if self.memory is None or not self.memorized:
+            return
+        # The engines of the chain share the list.
+        items = self.memorized[:]
+        del self.memorized[:]
+        groups = {}
+        for engine_name, source_lang, target_lang, text, translation \
+                in items:
+            groups.setdefault((engine_name, source_lang, target_lang), []) \
+                .append((text, translation))
+        for (engine_name, source_lang, target_lang), group in groups.items():
+            self.memory.memorize_many(
+                engine_name, source_lang, target_lang, group)
+
+    def close(self):
+        """Release the translation memory once the job is over."""
+        self._write_memory()
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    def _copy_translation(self, source, paragraph):
+        paragraph.translation = source.translation
+        paragraph.engine_name = source.engine_name
+        paragraph.target_lang = source.target_lang
+        paragraph.error = source.error
+        paragraph.partial = None
+
+    def _count_pending(self, paragraphs):
+        return len([paragraph for paragraph in paragraphs
+                    if not paragraph.translation or self.fresh])
+
+    def _count_requests(self, paragraphs):
+        if self.translator.is_batch_supported():
+            return len([batch for batch in self.pack_paragraphs(paragraphs)
+                        if batch.count > 0])
+        return self._count_pending(paragraphs)
+
+    def _filter_paragraphs(self, batch):
+        return [p for p in batch.paragraphs if self._need_translate(p)]
+
+    def translate_paragraphs(self, batch):
+        translation = self._route(batch)
+        paragraphs = translation._filter_paragraphs(batch)
+        if not paragraphs:
+            return
+        results = translation._translate_texts(
+            batch, [p.original for p in paragraphs])
+        for paragraph, result in zip(paragraphs, results):
+            translation._set_translation(paragraph, result)
+
+    def translate_paragraphs_async(self, batch):
+        from .async_handler import translate_paragraphs
+        return translate_paragraphs(self, batch)
+
+    def _set_translation(self, paragraph, translation):
         # Process streaming text
         if isinstance(translation, GeneratorType):
             if self.total == 1:
@@ -197,6 +672,8 @@ class Translation:
         paragraph.target_lang = self.translator.get_target_lang()
         paragraph.seperator = self.translator.separator
         paragraph.is_cache = False
+        paragraph.partial = None
+        self._memorize(paragraph)
 
     def process_translation(self, paragraph):
         self.progress(
@@ -219,6 +696,48 @@ class Translation:
                 message = _('Translation (Cached): {}')
             self.log(message.format(paragraph.translation.strip()))
 
+        for duplicate in self.duplicates.pop(id(paragraph), []):
+            self._copy_translation(paragraph, duplicate)
+            duplicate.is_cache = paragraph.is_cache
+            self.process_translation(duplicate)
+
+    def process_translations(self, batch):
+        for paragraph in batch.paragraphs:
+            paragraph.error = batch.error
+            self.process_translation(paragraph)
+
+    def prepare(self, translation):
+        """Set up the engine for the job handled by the translation, which
+        is the first of the chain."""
+        for name in ('fresh', 'batch', 'progress', 'log', 'streaming',
+                     'callback', 'checkpoint', 'cancel_request', 'memory',
+                     'memorized', 'metrics', 'total'):
+            setattr(self, name, getattr(translation, name))
+        self.translator.set_metrics(self.metrics)
+        self.rate_limiter = self.translator.get_rate_limiter()
+        self.retry_policy = self.translator.get_retry_policy()
+        self.api_key_pool = self.translator.get_api_key_pool()
+        if self.api_key_pool is not None:
+            self.log(_('API key count: {}').format(
+                self.api_key_pool.available()))
+        self.hedging = self.translator.get_hedge_policy()
+
+    def log_metrics(self):
+        """Summarize the requests of the job to each engine and write the
+        metrics out."""
+        for engine, stats in sorted(self.metrics.summary().items()):
+            self.log(_('Requests to {}: {} ({} failed, {} throttled, {} '
+                       'retried), {} KB sent, {} KB received').format(
+                engine, stats.requests, stats.failures, stats.throttled,
+                stats.retries, size_by_unit(stats.bytes_sent),
+                size_by_unit(stats.bytes_received)))
+            self.log(_('Latency of {}: p50 {:.2f}s, p90 {:.2f}s, p99 {:.2f}s, '
+                       'first byte p50 {:.2f}s').format(
+                engine, stats.latency.quantile(0.5),
+                stats.latency.quantile(0.9), stats.latency.quantile(0.99),
+                stats.ttfb.quantile(0.5)))
+        self.metrics.flush()
+
     def handle(self, paragraphs=[]):
         start_time = time.time()
         char_count = 0
@@ -235,24 +754,89 @@ class Translation:
         if self.total < 1:
             raise Exception(_('There is no content need to translate.'))
         self.progress_bar.load(self.total)
+        self.concurrency = self.translator.get_concurrency_controller()
+        if len(self.chain) > 1:
+            self.log(_('Engine chain: {}').format(' → '.join(
+                translation.translator.name for translation in self.chain)))
+        for translation in self.chain:
+            translation.prepare(self)
+        if self.concurrency is not None:
+            self.log(_('Concurrency limit: {} (adaptive up to {})').format(
+                self.concurrency.current, self.concurrency.maximum))
+
+        if self.total > 1:
+            pending = self._count_pending(paragraphs)
+            requests = self._count_requests(paragraphs)
+            paragraphs = self.deduplicate(paragraphs)
+            duplicates = pending - self._count_pending(paragraphs)
+            if duplicates > 0:
+                self.log(_('Duplicate paragraphs: {} ({} requests saved)')
+                         .format(duplicates, requests - self._count_requests(
+                             paragraphs)))
+        if self.memory is not None and not self.fresh:
+            pending = self._count_pending(paragraphs)
+            found, similar = self.recall(paragraphs)
+            stats = self.memory.get_stats()
+            self.log(_('Translation memory: {} of {} paragraphs found, {} '
+                       'entries, {:.0%} hit rate overall').format(
+                found, pending, stats.get('entries'), stats.get('hit_rate')))
+            if similar > 0:
+                self.log(_('Translation memory: {} paragraphs similar to '
+                           'those found').format(similar))
+
+        translate_paragraph = self.translate_paragraph
+        translate_paragraph_async = self.translate_paragraph_async
+        process_translation = self.process_translation
+        if self.total > 1 and self.translator.is_batch_supported():
+            paragraphs = self.pack_paragraphs(paragraphs)
+            self.log(_('Request count: {}').format(
+                len([batch for batch in paragraphs if batch.count > 0])))
+            translate_paragraph = self.translate_paragraphs
+            translate_paragraph_async = self.translate_paragraphs_async
+            process_translation = self.process_translations
 
         if sys.version_info >= (3, 7, 0):
             from .async_handler import AsyncHandler
+            # A single translation is streamed to the user as it arrives,
+            # which the non-blocking client does not do.
+            native_async = self.total > 1 and \
+                self.translator.is_async_supported()
             handler = AsyncHandler(
                 paragraphs, self.translator.concurrency_limit,
-                self.translate_paragraph, self.process_translation,
-                self.translator.request_interval)
-            handler.handle()
+                translate_paragraph, process_translation,
+                translate_paragraph_async if native_async else None,
+                self.concurrency)
         else:
             from .thread_handler import ThreadHandler
             handler = ThreadHandler(
                 paragraphs, self.translator.concurrency_limit,
-                self.translate_paragraph, self.process_translation,
-                self.translator.request_interval)
+                translate_paragraph, process_translation, self.concurrency)
+        try:
             handler.handle()
+        finally:
+            self._write_memory()
 
         self.log(sep())
-        if self.batch and self.need_stop():
+        if self.concurrency is not None:
+            limits = [limit for _time, limit in self.concurrency.history]
+            self.log(_('Concurrency limit: {} (ranged from {} to {})').format(
+                self.concurrency.current, min(limits), max(limits)))
+        for translation in self.chain:
+            if translation.hedging is not None:
+                self.log(_('Hedged requests: {} of {} ({} answered first)')
+                         .format(translation.hedging.hedges,
+                                 translation.hedging.requests,
+                                 translation.hedging.wins))
+            if translation.api_key_pool is None:
+                continue
+            for key in translation.api_key_pool.keys:
+                self.log(_('API key {}: {} requests, {} failures, {} '
+                           'characters{}').format(
+                    key.masked(), key.requests, key.failures, key.chars,
+                    _(' (disabled)') if key.disabled else ''))
+        if self.metrics is not None:
+            self.log_metrics()
+        if self.batch and self.chain[-1].need_stop():
             raise Exception(_('Translation failed.'))
         consuming = round((time.time() - start_time) / 60, 2)
         self.log(_('Time consuming: {} minutes').format(consuming))
@@ -289,12 +873,52 @@ def get_translator(engine_class=None):
     return translator
 
 
+def get_failover_translators(translator):
+    """The translators of the failover engines supporting the languages of
+    the translator, in the order of preference."""
+    config = get_config()
+    engine_names = [engine.name for engine in builtin_engines]
+    custom_engines = config.get('custom_engines')
+    engine_classes = [translator.__class__]
+    translators = []
+    for engine_name in config.get('failover_engines'):
+        if engine_name in custom_engines:
+            # Custom engines share the class, so only one can be used.
+            if CustomTranslate in engine_classes:
+                continue
+        elif engine_name not in engine_names:
+            continue
+        engine_class = get_engine_class(engine_name)
+        if engine_class in engine_classes:
+            continue
+        failover = get_translator(engine_class)
+        failover.set_source_lang(translator.source_lang)
+        failover.set_target_lang(translator.target_lang)
+        if failover._get_source_code() is None or \
+                failover._get_target_code() is None:
+            continue
+        engine_classes.append(engine_class)
+        translators.append(failover)
+    return translators
+
+
 def get_translation(translator, log=None):
     config = get_config()
-    glossary = Glossary(translator.placeholder)
-    if config.get('glossary_enabled'):
-        glossary.load_from_file(config.get('glossary_path'))
-    translation = Translation(translator, glossary)
+
+    def create_translation(translator):
+        glossary = Glossary(translator.placeholder)
+        if config.get('glossary_enabled'):
+            glossary.load_from_file(config.get('glossary_path'))
+        return Translation(translator, glossary)
+
+    translation = create_translation(translator)
+    if config.get('memory_enabled'):
+        translation.set_memory(get_memory())
+        translation.set_reuse_score(config.get('memory_reuse_score'))
+    if config.get('metrics_enabled'):
+        translation.set_metrics(get_metrics())
+    for failover in get_failover_translators(translator):
+        translation.add_failover(create_translation(failover))
     if get_config().get('log_translation'):
         translation.set_logging(log)
     return translation
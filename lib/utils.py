@@ -44,6 +44,15 @@ def uid(*args):
     return md5.hexdigest()
 
 
+def file_digest(file_path, chunk_size=1 << 20):
+    """The digest of the content of the file, read in chunks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def trim(text):
     # Replace \xa0 with whitespace to be compatible with Python 2.x.
     text = re.sub(u'\u00a0|\u3000', ' ', text)
@@ -102,6 +111,12 @@ def is_proxy_availiable(host, port, timeout=1):
     return True
 
 
+def mask(key):
+    """Hide all but the ends of the key."""
+    return '%s...%s' % (key[:4], key[-4:]) if len(key) > 12 \
+        else '*' * len(key)
+
+
 def size_by_unit(number, unit='KB'):
     unit = unit.upper()
     multiple = {'KB': 1, 'MB': 2}
@@ -135,5 +150,15 @@ def traceback_error():
         return traceback.format_exc().strip()
 
 
+def error_chain(error):
+    """Yield the error and the errors it was raised from or while handling."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = getattr(error, '__cause__', None) or \
+            getattr(error, '__context__', None)
+
+
 def dummy(*args, **kwargs):
     pass
@@ -274,8 +274,10 @@ class TranslationSetting(QDialog):
         cache_group = QGroupBox(_('Cache'))
         cache_layout = QHBoxLayout(cache_group)
         cache_enabled = QCheckBox(_('Enable'))
+        memory_enabled = QCheckBox(_('Share between books'))
         cache_manage = QLabel(_('Manage'))
         cache_layout.addWidget(cache_enabled)
+        cache_layout.addWidget(memory_enabled)
         cache_layout.addStretch(1)
         cache_layout.addWidget(cache_manage)
         misc_layout.addWidget(cache_group, 1)
@@ -289,6 +291,9 @@ class TranslationSetting(QDialog):
         cache_enabled.setChecked(self.config.get('cache_enabled'))
         cache_enabled.toggled.connect(
             lambda checked: self.config.update(cache_enabled=checked))
+        memory_enabled.setChecked(self.config.get('memory_enabled'))
+        memory_enabled.toggled.connect(
+            lambda checked: self.config.update(memory_enabled=checked))
 
         # Job Log
         log_group = QGroupBox(_('Job Log'))
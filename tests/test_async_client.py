@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+from unittest.mock import patch, Mock
+
+from mechanize import HTTPError
+
+from ..lib.async_client import AsyncClient, AsyncResponse
+
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncClient()
+        self.client._send = Mock()
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def mock_send(self, *responses):
+        async def send(*args):
+            return responses[min(self.client._send.call_count - 1,
+                                 len(responses) - 1)]
+        self.client._send.side_effect = send
+
+    def request(self, *args, **kwargs):
+        return self.loop.run_until_complete(
+            self.client.request(*args, **kwargs))
+
+    def test_request_get(self):
+        self.mock_send((200, 'OK', {}, b'{"text": "a"}'))
+        response = self.request(
+            'GET', 'https://example.com/api?a=1', {'q': '你好'})
+        self.client._send.assert_called_once_with(
+            'GET', 'https://example.com/api?a=1&q=%E4%BD%A0%E5%A5%BD', None,
+            {}, False, None)
+        self.assertIsInstance(response, AsyncResponse)
+        self.assertEqual(b'{"text": "a"}', response.read())
+
+    def test_request_post(self):
+        self.mock_send((200, 'OK', {}, b'line 1\nline 2'))
+        response = self.request('POST', 'https://example.com', {'q': 'a'})
+        self.client._send.assert_called_once_with(
+            'POST', 'https://example.com', b'q=a',
+            {'Content-Type': 'application/x-www-form-urlencoded'}, False, None)
+        self.assertEqual(b'line 1\n', response.readline())
+        self.assertEqual(b'line 2', response.readline())
+
+        self.client._send.reset_mock()
+        self.request(
+            'POST', 'https://example.com', '{"q": "a"}',
+            {'Content-Type': 'application/json'})
+        self.client._send.assert_called_once_with(
+            'POST', 'https://example.com', b'{"q": "a"}',
+            {'Content-Type': 'application/json'}, False, None)
+
+    def test_request_redirect(self):
+        self.mock_send(
+            (302, 'Found', {'location': '/new'}, b''),
+            (200, 'OK', {}, b'done'))
+        response = self.request('POST', 'https://example.com/old', 'a')
+        self.assertEqual(2, self.client._send.call_count)
+        self.client._send.assert_called_with(
+            'GET', 'https://example.com/new', None,
+            {'Content-Type': 'application/x-www-form-urlencoded'}, False, None)
+        self.assertEqual('https://example.com/new', response.geturl())
+
+    def test_request_error(self):
+        self.mock_send((429, 'Too Many Requests', {}, b'{"error": "a"}'))
+        with self.assertRaises(HTTPError) as cm:
+            self.request('GET', 'https://example.com')
+        self.assertEqual(429, cm.exception.code)
+        self.assertEqual(b'{"error": "a"}', cm.exception.read())
+
+    @patch('calibre_plugins.ebook_translator.lib.async_client.zlib')
+    def test_decode(self, mock_zlib):
+        self.assertEqual(b'abc', self.client._decode(b'abc', {}))
+        self.client._decode(b'abc', {'content-encoding': 'gzip'})
+        mock_zlib.decompress.assert_called_once_with(
+            b'abc', 16 + mock_zlib.MAX_WBITS)
+
+    def read_body(self, data, headers, partial=False):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return self.loop.run_until_complete(
+            self.client._read_body(reader, headers, partial))
+
+    def test_read_body(self):
+        headers = {'transfer-encoding': 'chunked'}
+        self.assertEqual(
+            (b'data: a\n\n', True),
+            self.read_body(b'9\r\ndata: a\n\n\r\n0\r\n\r\n', headers))
+        self.assertRaises(
+            ConnectionResetError, self.read_body, b'9\r\ndata: a\n\n\r\n',
+            headers)
+
+    def test_read_body_timeout(self):
+        headers = {'transfer-encoding': 'chunked'}
+
+        async def read(gap):
+            reader = asyncio.StreamReader()
+
+            async def feed():
+                for _ in range(5):
+                    await asyncio.sleep(gap)
+                    reader.feed_data(b'9\r\ndata: a\n\n\r\n')
+                reader.feed_data(b'0\r\n\r\n')
+                reader.feed_eof()
+            task = asyncio.ensure_future(feed())
+            try:
+                return await self.client._read_body(
+                    reader, headers, timeout=0.1)
+            finally:
+                task.cancel()
+
+        # The timeout applies to each read, not to the whole stream.
+        self.assertEqual(
+            (b'data: a\n\n' * 5, True),
+            self.loop.run_until_complete(read(0.04)))
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(read(0.2))
+
+    def test_read_body_partial(self):
+        headers = {'transfer-encoding': 'chunked'}
+        self.assertEqual(
+            (b'data: a\n\ndata', False),
+            self.read_body(
+                b'9\r\ndata: a\n\n\r\n9\r\ndata', headers, True))
+        self.assertEqual(
+            (b'data', False),
+            self.read_body(b'data', {'content-length': '9'}, True))
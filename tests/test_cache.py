@@ -1,6 +1,13 @@
+import time
+import shutil
+import sqlite3
+import os.path
+import tempfile
 import unittest
+from unittest.mock import patch
 
-from ..lib.cache import Paragraph
+from ..lib.utils import uid
+from ..lib.cache import Paragraph, TranslationCache, get_cache, cache_uid
 
 
 class TestParagraph(unittest.TestCase):
@@ -24,3 +31,276 @@ class TestParagraph(unittest.TestCase):
         self.paragraph.original = 'a\n\nb\n\nc'
         self.paragraph.translation = 'A\n\nB\nC\n\n'
         self.assertFalse(self.paragraph.is_alignment('\n\n'))
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        patcher = patch.multiple(
+            TranslationCache, dir_path=self.dir_path,
+            cache_path=os.path.join(self.dir_path, 'cache'),
+            temp_path=os.path.join(self.dir_path, 'temp'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.cache = TranslationCache('test')
+        self.addCleanup(self.cache.close)
+        self.cache.save([(0, 'a', 'a', 'A\n\nB\n\n'), (1, 'b', 'b', 'C')])
+
+    def test_partial(self):
+        paragraph = self.cache.paragraph(0)
+        self.assertIsNone(paragraph.partial)
+        paragraph.partial = '甲\n\n'
+        self.cache.checkpoint_paragraph(paragraph)
+        self.assertEqual(
+            ['甲\n\n', None],
+            [p.partial for p in self.cache.all_paragraphs()])
+
+        # The partial translation is gone with the translation.
+        paragraph.translation, paragraph.partial = '甲\n\n乙', None
+        self.cache.update_paragraph(paragraph)
+        self.assertEqual({}, self.cache.get_partials())
+        self.assertIsNone(self.cache.get_paragraphs([0])[0].partial)
+
+    def test_checkpoint_paragraph_none(self):
+        self.cache.save_partial(1, '丙')
+        paragraph = self.cache.paragraph(1)
+        self.assertEqual('丙', paragraph.partial)
+        paragraph.partial = None
+        self.cache.checkpoint_paragraph(paragraph)
+        self.assertEqual({}, self.cache.get_partials())
+
+    def read(self, query):
+        """Read the rows committed, as another process would."""
+        connection = sqlite3.connect(self.cache.file_path)
+        try:
+            return [row[0] for row in connection.execute(query)]
+        finally:
+            connection.close()
+
+    def read_translations(self):
+        return self.read('SELECT translation FROM cache ORDER BY id')
+
+    @patch.object(TranslationCache, 'flush_interval', 60)
+    def test_update_write_behind(self):
+        self.cache.update(0, translation='甲')
+        self.assertEqual([None, None], self.read_translations())
+        # Reading the cache writes the updates first.
+        self.assertEqual('甲', self.cache.paragraph(0).translation)
+        self.assertEqual(['甲', None], self.read_translations())
+
+        self.cache.update([0, 1], translation='乙')
+        self.cache.update(1, translation='丙', engine_name='DeepL')
+        self.cache.flush()
+        self.assertEqual(['乙', '丙'], self.read_translations())
+
+    @patch.object(TranslationCache, 'flush_size', 2)
+    @patch.object(TranslationCache, 'flush_interval', 60)
+    def test_update_flush_size(self):
+        self.cache.update(0, translation='甲')
+        self.assertEqual([None, None], self.read_translations())
+        self.cache.update(1, translation='乙')
+        self.assertEqual(['甲', '乙'], self.read_translations())
+        self.assertIsNone(self.cache.timer)
+
+    @patch.object(TranslationCache, 'flush_interval', 0.01)
+    def test_update_flush_interval(self):
+        self.cache.update(0, translation='甲')
+        self.cache.timer.join()
+        self.assertEqual(['甲', None], self.read_translations())
+
+    def test_update_paragraph_partial(self):
+        self.cache.save_partial(0, '甲')
+        paragraph = self.cache.paragraph(0)
+        paragraph.translation = '甲乙'
+        self.cache.update_paragraph(paragraph)
+        # The partial translation is deleted along with the update.
+        self.assertEqual(['甲'], self.read('SELECT translation FROM partial'))
+        self.cache.done()
+        self.assertEqual([], self.read('SELECT translation FROM partial'))
+        self.assertEqual(['甲乙', None], self.read_translations())
+
+    def test_save(self):
+        # The indexes are built after loading the originals.
+        self.assertTrue(self.cache.indexed)
+        self.assertEqual(
+            ['cache_id', 'cache_md5'], self.read(
+                "SELECT name FROM sqlite_master WHERE type='index' AND "
+                "tbl_name='cache' ORDER BY name"))
+        self.assertEqual(
+            (1, 'b', 'b', 'C', 0, None, None, None, None, None),
+            self.cache.first(id=1))
+
+        # A cache is loaded again if it was left incomplete.
+        self.cache.fresh = True
+        self.assertEqual(1, self.cache.save(
+            [(1, 'b', 'b', 'C'), (2, 'c', 'c', 'D', True, '{}', 'p.html')]))
+        self.assertEqual(3, len(self.read('SELECT id FROM cache')))
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.cache.cursor.execute(
+                "INSERT INTO cache (id, md5) VALUES (3, 'a')")
+
+    def test_save_older_cache(self):
+        file_path = os.path.join(self.dir_path, 'cache', 'older.db')
+        connection = sqlite3.connect(file_path)
+        connection.execute(
+            'CREATE TABLE cache(id UNIQUE, md5 UNIQUE, raw, original, '
+            'ignored, attributes DEFAULT NULL, page DEFAULT NULL,'
+            'translation DEFAULT NULL, engine_name DEFAULT NULL, '
+            'target_lang DEFAULT NULL)')
+        connection.close()
+        cache = TranslationCache('older')
+        self.addCleanup(cache.close)
+        self.assertTrue(cache.indexed)
+        self.assertEqual(
+            1, cache.save([(0, 'a', 'a', 'A'), (0, 'a', 'a', 'A')]))
+
+
+class TestCacheCatalog(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        patcher = patch.multiple(
+            TranslationCache, dir_path=self.dir_path,
+            cache_path=os.path.join(self.dir_path, 'cache'),
+            temp_path=os.path.join(self.dir_path, 'temp'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.dir_path)
+
+    def create(self, name, title):
+        cache = TranslationCache(name)
+        cache.set_info('title', title)
+        cache.set_info('engine_name', 'DeepL')
+        cache.set_info('target_lang', 'German')
+        cache.set_info('merge_length', '2000')
+        cache.save([(0, 'a', 'a', 'A'), (1, 'b', 'b', 'B'),
+                    (2, 'c', 'c', 'C', True)])
+        cache.update(0, translation='甲')
+        return cache
+
+    def test_get_list(self):
+        self.create('a', 'Book A').close()
+        cache = self.create('b', 'Book B')
+        cache.done()
+
+        with patch.object(TranslationCache, 'summary') as summary:
+            caches = TranslationCache.get_list()
+        # The caches done with are listed from the catalog only.
+        summary.assert_not_called()
+        self.assertEqual(
+            [('Book A', 'DeepL', 'German', 2000, '1/2'),
+             ('Book B', 'DeepL', 'German', 2000, '1/2')],
+            [item[:5] for item in caches])
+        self.assertEqual(['a.db', 'b.db'], [item[-1] for item in caches])
+
+        # The cache changed since is rebuilt.
+        cache.update(1, translation='乙')
+        cache.close()
+        self.assertEqual('2/2', TranslationCache.get_list()[1][4])
+
+    def test_get_list_stale(self):
+        cache = self.create('a', 'Book A')
+        cache.flush()
+        # The cache still in use is read from its database.
+        self.assertEqual('1/2', TranslationCache.get_list()[0][4])
+        cache.set_info('title', 'Book B')
+        self.assertEqual('Book B', TranslationCache.get_list()[0][0])
+        cache.close()
+
+        # A cache not in the catalog is added to it.
+        catalog = TranslationCache.get_catalog()
+        catalog.clear()
+        catalog.close()
+        self.assertEqual(['a.db'], [
+            item[-1] for item in TranslationCache.get_list()])
+
+    def test_remove(self):
+        self.create('a', 'Book A').close()
+        self.create('b', 'Book B').close()
+        TranslationCache.remove('a.db')
+        self.assertEqual(['b.db'], [
+            item[-1] for item in TranslationCache.get_list()])
+
+        # A cache deleted otherwise is dropped from the catalog.
+        os.remove(os.path.join(self.dir_path, 'cache', 'b.db'))
+        self.assertEqual([], TranslationCache.get_list())
+        catalog = TranslationCache.get_catalog()
+        self.addCleanup(catalog.close)
+        self.assertEqual({}, catalog.stats())
+
+    def touch(self, filename, accessed):
+        catalog = TranslationCache.get_catalog()
+        catalog.touch(filename, accessed)
+        catalog.close()
+
+    def test_evict_count(self):
+        for name in 'abcd':
+            self.create(name, name).close()
+            self.touch(name + '.db', 1000 + ord(name))
+        TranslationCache.pin('a.db')
+        in_use = self.create('e', 'e')
+        in_use.flush()
+        self.addCleanup(in_use.close)
+        self.touch('e.db', 1)
+
+        # The least recently used ones go, but the pinned and the one in use.
+        self.assertEqual(
+            ['b.db', 'c.db'], TranslationCache.evict(max_count=3))
+        caches = TranslationCache.get_list()
+        self.assertEqual(['a.db', 'd.db', 'e.db'],
+                         [item[-1] for item in caches])
+        self.assertEqual('Yes', caches[0][7])
+
+    def test_evict_age_and_size(self):
+        for name in 'abc':
+            self.create(name, name).close()
+        self.touch('a.db', time.time() - 31 * 86400)
+        self.assertEqual([], TranslationCache.evict())
+        self.assertEqual(['a.db'], TranslationCache.evict(max_age=30))
+
+        size = os.path.getsize(os.path.join(self.dir_path, 'cache', 'b.db'))
+        self.touch('c.db', time.time() - 60)
+        self.assertEqual(['c.db'], TranslationCache.evict(
+            max_size=size * 1.5 / 1024 / 1024))
+
+    def test_compact(self):
+        cache = self.create('a', 'Book A')
+        cache.save([(id, str(id), 'x' * 1000, 'x' * 1000)
+                    for id in range(3, 300)])
+        self.assertFalse(cache.compact())
+        cache.delete_paragraphs(cache.get_paragraphs(list(range(3, 300))))
+        pages = cache.cursor.execute('PRAGMA page_count').fetchone()[0]
+        cache.close()
+        connection = sqlite3.connect(cache.file_path)
+        self.addCleanup(connection.close)
+        self.assertLess(connection.execute(
+            'PRAGMA page_count').fetchone()[0], pages / 2)
+        # The summary is recorded after compacting the cache.
+        self.assertEqual('1/2', TranslationCache.get_list()[0][4])
+
+    def test_resolve(self):
+        book_path = os.path.join(self.dir_path, 'book.epub')
+        with open(book_path, 'w') as file:
+            file.write('book')
+        identity, legacy = cache_uid(book_path, 'DeepL', 'German', '2000')
+        self.assertEqual(uid(book_path + 'DeepL' + 'German' + '2000'), legacy)
+        self.create(legacy, 'Book A').close()
+
+        # The cache from the path is used for the content from now on.
+        with patch('calibre_plugins.ebook_translator.lib.cache.get_config',
+                   return_value={'cache_enabled': True}):
+            cache = get_cache(identity, legacy)
+        self.assertEqual(legacy, cache.identity)
+        self.assertEqual('Book A', cache.get_info('title'))
+        cache.close()
+
+        # So it is found once the book is moved.
+        moved_path = os.path.join(self.dir_path, 'moved.epub')
+        os.rename(book_path, moved_path)
+        moved, moved_legacy = cache_uid(moved_path, 'DeepL', 'German', '2000')
+        self.assertEqual(identity, moved)
+        self.assertEqual(legacy, TranslationCache.resolve(moved, moved_legacy))
+
+        # Not once the cache is removed.
+        TranslationCache.remove(legacy + '.db')
+        self.assertEqual(identity, TranslationCache.resolve(identity, legacy))
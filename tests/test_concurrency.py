@@ -0,0 +1,88 @@
+import socket
+import unittest
+from unittest.mock import patch
+
+from mechanize import HTTPError
+
+from ..lib.concurrency import is_overloaded, ConcurrencyController
+
+
+module_name = 'calibre_plugins.ebook_translator.lib.concurrency'
+
+
+class TestFunction(unittest.TestCase):
+    def test_is_overloaded(self):
+        for code in (429, 500, 503):
+            with self.subTest(code=code):
+                self.assertTrue(is_overloaded(
+                    HTTPError('https://example.com', code, '', {}, None)))
+        self.assertFalse(is_overloaded(
+            HTTPError('https://example.com', 401, '', {}, None)))
+        self.assertTrue(is_overloaded(socket.timeout()))
+        self.assertFalse(is_overloaded(Exception('any error')))
+
+    def test_is_overloaded_wrapped(self):
+        try:
+            try:
+                raise HTTPError('https://example.com', 429, '', {}, None)
+            except Exception:
+                raise Exception('Can not parse returned response.')
+        except Exception as e:
+            self.assertTrue(is_overloaded(e))
+
+
+@patch(module_name + '.time')
+class TestConcurrencyController(unittest.TestCase):
+    def test_created(self, mock_time):
+        controller = ConcurrencyController(100, 1, 8)
+        self.assertEqual(8, controller.current)
+        controller = ConcurrencyController(0, 1, 8)
+        self.assertEqual(1, controller.current)
+
+    def test_additive_increase(self, mock_time):
+        mock_time.time.return_value = 100.0
+        controller = ConcurrencyController(2, 1, 4)
+        controller.in_flight = 4
+        # One more for every limit's worth of successes.
+        self.assertIsNone(controller.on_success(1.0))
+        self.assertIsNone(controller.on_success(1.0))
+        self.assertEqual(3, controller.on_success(1.0))
+        for _ in range(20):
+            controller.on_success(1.0)
+        self.assertEqual(4, controller.current)
+        self.assertEqual([2, 3, 4], [i[1] for i in controller.history])
+
+    def test_hold_on_unused_limit(self, mock_time):
+        controller = ConcurrencyController(2, 1, 64)
+        controller.enter()
+        for _ in range(5):
+            controller.on_success(1.0)
+        self.assertEqual(2.0, controller.limit)
+        controller.enter()
+        self.assertFalse(controller.is_available())
+        controller.leave()
+        self.assertTrue(controller.is_available())
+
+    def test_hold_on_latency(self, mock_time):
+        mock_time.time.return_value = 100.0
+        controller = ConcurrencyController(2, 1, 64)
+        controller.in_flight = 64
+        controller.on_success(1.0)
+        limit = controller.limit
+        for _ in range(5):
+            controller.on_success(10.0)
+        self.assertEqual(limit, controller.limit)
+
+    def test_multiplicative_decrease(self, mock_time):
+        mock_time.time.return_value = 100.0
+        controller = ConcurrencyController(16, 1, 64)
+        controller.on_success(1.0)
+        self.assertEqual(8, controller.on_failure())
+        # Only once within a round trip.
+        self.assertIsNone(controller.on_failure())
+        mock_time.time.return_value = 102.0
+        self.assertEqual(4, controller.on_failure())
+        for seconds in range(103, 110):
+            mock_time.time.return_value = float(seconds)
+            controller.on_failure()
+        self.assertEqual(1, controller.current)
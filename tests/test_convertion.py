@@ -1,8 +1,12 @@
+import os
+import shutil
 import unittest
+import tempfile
 from typing import Callable
 from unittest.mock import call, patch, Mock
 
-from ..lib.conversion import ConversionWorker
+from ..lib.conversion import ConversionWorker, output_pgn
+from ..lib.element import get_pgn_elements
 from ..lib.ebook import Ebooks
 
 
@@ -302,3 +306,25 @@ class TestConversionWorker(unittest.TestCase):
         arguments = self.worker.gui.proceed_question.mock_calls[0].kwargs
         self.assertEqual(True, arguments.get('log_is_file'))
         self.assertIs(self.icon, arguments.get('icon'))
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.directory, 'input.pgn')
+        self.output_path = os.path.join(self.directory, 'output.pgn')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_output_pgn(self):
+        with open(self.input_path, 'w', encoding='utf-8') as file:
+            file.write('1. e4 {a b} e5 {c d} 2. Nf3 {a b} *')
+        elements = get_pgn_elements(self.input_path, 'utf-8')
+        for element, translation in zip(elements, ('{c d}', None, 'B A')):
+            element.set_position('only')
+            element.add_translation(translation)
+        output_pgn(elements, self.input_path, self.output_path, 'utf-8')
+        with open(self.output_path, encoding='utf-8') as file:
+            self.assertEqual('1. e4 {{c d}} e5 {c d} 2. Nf3 {B A} *',
+                             file.read())
@@ -4,13 +4,14 @@ import unittest
 from types import GeneratorType
 from unittest.mock import patch, Mock
 
-from ..engines.base import Base
+from ..engines.base import Base, DeferredRequest
 from ..engines.deepl import DeeplTranslate
 from ..engines.openai import ChatgptTranslate
 from ..engines.microsoft import AzureChatgptTranslate
 from ..engines.anthropic import ClaudeTranslate
 from ..engines.custom import (
-    create_engine_template, load_engine_data, CustomTranslate)
+    create_engine_template, load_engine_data, RequestTemplate,
+    ResponseParser, CustomTranslate)
 
 
 load_translations()
@@ -53,6 +54,35 @@ class TestBase(unittest.TestCase):
         self.assertIsNone(
             self.translator.get_external_program('/path/to/fake'))
 
+    def test_defer_translate(self):
+        def translate(text):
+            return self.translator.get_result(
+                'https://example.com', {'q': text}, method='POST',
+                callback=str)
+        self.translator.translate = translate
+
+        request = self.translator.defer_translate('Hello World!')
+        self.assertIsInstance(request, DeferredRequest)
+        self.assertEqual('https://example.com', request.url)
+        self.assertEqual({'q': 'Hello World!'}, request.data)
+        self.assertEqual('POST', request.method)
+        self.assertIs(str, request.callback)
+        self.assertFalse(self.translator.local.deferred)
+
+    def test_pack_texts(self):
+        self.assertEqual(
+            {'1': 'Hello', '2': '世界'},
+            json.loads(self.translator.pack_texts(['Hello', '世界'])))
+
+    def test_unpack_texts(self):
+        unpack = self.translator.unpack_texts
+        self.assertEqual(
+            ['你好', None, None],
+            unpack('Sure: {"1": "你好", "2": " ", "3": 3}', 3))
+        self.assertEqual([None, None], unpack('{"1": "你好"', 2))
+        self.assertEqual([None], unpack('["你好"]', 1))
+        self.assertEqual([None], unpack('你好', 1))
+
 
 @patch(moudle_name + '.base.Browser')
 class TestDeepl(unittest.TestCase):
@@ -94,6 +124,51 @@ class TestDeepl(unittest.TestCase):
         with self.assertRaisesRegex(Exception, error):
             self.translator.translate('Hello World!')
 
+    def test_translate_batch(self, mock_browser):
+        result = mock_browser.return_value.response.return_value.read \
+            .return_value.decode.return_value.strip
+        result.return_value = '{"translations":[' \
+            '{"detected_source_language":"EN","text":"你好！"},' \
+            '{"detected_source_language":"EN","text":"世界！"}]}'
+
+        self.assertEqual(
+            ['你好！', '世界！'],
+            self.translator.translate_batch(['Hello!', 'World!']))
+        request = mock_browser.return_value.open.call_args[0][0]
+        self.assertEqual(
+            {'text': ['Hello!', 'World!'], 'target_lang': 'ZH',
+             'source_lang': 'EN'},
+            json.loads(request.data))
+
+    def test_get_api_key_pool(self, mock_browser):
+        result = mock_browser.return_value.response.return_value.read \
+            .return_value.decode.return_value.strip
+        result.side_effect = [
+            '{"character_count": 30, "character_limit": 100}',
+            '{"character_count": 100, "character_limit": 100}',
+            '<dummy info>']
+
+        pool = self.translator.get_api_key_pool()
+
+        self.assertEqual(['a', 'b', 'c'], [key.key for key in pool.keys])
+        self.assertEqual(
+            [0.7, 0.0, None], [key.remaining for key in pool.keys])
+        self.assertEqual(2, pool.available())
+        headers = [
+            call[0][0].headers for call
+            in mock_browser.return_value.open.call_args_list]
+        self.assertEqual(
+            ['DeepL-Auth-Key a', 'DeepL-Auth-Key b', 'DeepL-Auth-Key c'],
+            [header.get('Authorization') for header in headers])
+        # The key of the current thread falls back to the key in use.
+        self.assertEqual('a', self.translator.api_key)
+        self.translator.set_request_api_key('b')
+        self.assertEqual('b', self.translator.api_key)
+
+    def test_get_api_key_pool_single_key(self, mock_browser):
+        self.translator.api_keys = []
+        self.assertIsNone(self.translator.get_api_key_pool())
+
 
 class TestChatgptTranslate(unittest.TestCase):
     def setUp(self):
@@ -134,9 +209,9 @@ class TestChatgptTranslate(unittest.TestCase):
 
         template = b'data: {"choices":[{"delta":{"content":"%b"}}]}'
         mock_response = Mock()
-        mock_response.readline.side_effect = [
-            template % i.encode() for i in '你好世界！'] \
-            + ['data: [DONE]'.encode()]
+        mock_response.read.side_effect = [
+            template % i.encode() + b'\n\n' for i in '你好世界！'] \
+            + [b'data: [DONE]\n\n', b'']
         mock_browser.return_value.response.return_value = mock_response
         result = self.translator.translate('Hello World!')
 
@@ -155,6 +230,27 @@ class TestChatgptTranslate(unittest.TestCase):
 
         self.assertEqual('你好世界！', result)
 
+    @patch(moudle_name + '.base.Browser')
+    def test_translate_batch(self, mock_browser):
+        template = b'data: {"choices":[{"delta":{"content":%b}}]}'
+        content = '```json\n{"1": "你好！", "3": ""}\n```'
+        mock_response = Mock()
+        mock_response.read.side_effect = [
+            template % json.dumps(i).encode() + b'\n\n' for i in content] \
+            + [b'data: [DONE]\n\n', b'']
+        mock_browser.return_value.response.return_value = mock_response
+
+        self.assertEqual(
+            ['你好！', None, None],
+            self.translator.translate_batch(['Hello!', 'World!', 'Hi!']))
+        request = mock_browser.return_value.open.call_args[0][0]
+        messages = json.loads(request.data)['messages']
+        self.assertTrue(
+            messages[0]['content'].endswith(self.translator.batch_prompt))
+        self.assertEqual(
+            {'1': 'Hello!', '2': 'World!', '3': 'Hi!'},
+            json.loads(messages[1]['content']))
+
 
 class TestAzureChatgptTranslate(unittest.TestCase):
     def setUp(self):
@@ -190,9 +286,9 @@ class TestAzureChatgptTranslate(unittest.TestCase):
 
         template = b'data: {"choices":[{"delta":{"content":"%b"}}]}'
         mock_response = Mock()
-        mock_response.readline.side_effect = [
-            template % i.encode() for i in '你好世界！'] \
-            + ['data: [DONE]'.encode()]
+        mock_response.read.side_effect = [
+            template % i.encode() + b'\n\n' for i in '你好世界！'] \
+            + [b'data: [DONE]\n\n', b'']
         mock_browser.return_value.response.return_value = mock_response
         url = ('https://docs-test-001.openai.azure.com/openai/deployments/'
                'gpt-35-turbo/chat/completions?api-version=2023-05-15')
@@ -332,7 +428,11 @@ event: message_stop
 data: {"type":"message_stop"}
 """
         mock_response = Mock()
-        mock_response.readline.side_effect = data_sample.encode().splitlines()
+        data_sample = data_sample.encode()
+        # The chunks end anywhere, even in the middle of a character.
+        mock_response.read.side_effect = [
+            data_sample[i:i + 7] for i in range(0, len(data_sample), 7)] \
+            + [b'']
         mock_browser.return_value.response.return_value = mock_response
         url = 'https://api.anthropic.com/v1/messages'
         self.translator.endpoint = url
@@ -436,6 +536,25 @@ class TestFunction(unittest.TestCase):
             '"response":"response"}')
         self.assertEqual(
             (True, json.loads(json_data)), load_engine_data(json_data))
+        self.assertEqual(
+            (False, _('Invalid expression to parse response: {}').format(
+                _('Unknown response type: {}').format('html'))),
+            load_engine_data(json_data.replace(
+                '"response":"response"',
+                '"response":"response","response_type":"html"')))
+        self.assertEqual(
+            (False, _('Placeholder <texts> is required in batch data.')),
+            load_engine_data(json_data.replace(
+                '"response":"response"',
+                '"response":"response","batch":{"data":{"q":"<text>"}}')))
+        json_data = json_data.replace(
+            '"response":"response"',
+            '"response":"$.text","batch":{"data":{"q":"<texts>"},'
+            '"response":"$.texts[*]"}')
+        self.assertEqual(
+            (True, json.loads(json_data)), load_engine_data(json_data))
+        self.assertFalse(load_engine_data(
+            json_data.replace('$.texts[*]', '$.texts[*'))[0])
 
 
 class TestCustom(unittest.TestCase):
@@ -487,10 +606,12 @@ class TestCustom(unittest.TestCase):
             method='POST')
         # XML response
         translator.engine_data.update({'response': 'response.text'})
+        CustomTranslate.set_engine_data(translator.engine_data)
         request.return_value = '<test>你好世界</test>'
         self.assertEqual('你好世界', translator.translate('Hello World'))
         # Plain response
         translator.engine_data.update({'response': 'response'})
+        CustomTranslate.set_engine_data(translator.engine_data)
         request.return_value = '你好世界'
         self.assertEqual('你好世界', translator.translate('Hello World'))
 
@@ -499,9 +620,102 @@ class TestCustom(unittest.TestCase):
         translator = CustomTranslate()
         # Mock content type: application/x-www-form-urlencoded
         del translator.engine_data['request']['headers']
+        CustomTranslate.set_engine_data(translator.engine_data)
         translator.set_source_lang('English')
         translator.set_target_lang('Chinese')
         mock_browser.return_value.response.return_value.read.return_value \
             .decode.return_value = '{"text": "\\"你好\\"\\n世界"}'
         self.assertEqual(
             '\"你好\"\n世界', translator.translate('\"Hello\"\nWorld'))
+
+    @patch('calibre_plugins.ebook_translator.engines.base.Browser')
+    def test_translate_stream(self, mock_browser):
+        translator = CustomTranslate()
+        translator.engine_data['request']['data']['stream'] = True
+        translator.engine_data.update(
+            {'response': "response['choices'][0]['delta']['content']"})
+        CustomTranslate.set_engine_data(translator.engine_data)
+        translator.set_source_lang('English')
+        translator.set_target_lang('Chinese')
+        template = b'data: {"choices":[{"delta":{"content":"%b"}}]}\n\n'
+        mock_response = Mock()
+        mock_response.read.side_effect = [
+            template % i.encode() for i in '你好世界'] \
+            + [b'data: {"choices":[{"delta":{}}]}\n\n',
+               b'data: [DONE]\n\n', b'']
+        mock_browser.return_value.response.return_value = mock_response
+        result = translator.translate('Hello World')
+        self.assertIsInstance(result, GeneratorType)
+        self.assertEqual('你好世界', ''.join(result))
+
+    @patch('calibre_plugins.ebook_translator.engines.base.Request')
+    @patch('calibre_plugins.ebook_translator.engines.base.Browser')
+    def test_translate_batch(self, mock_browser, mock_request):
+        translator = CustomTranslate()
+        self.assertFalse(translator.is_batch_supported())
+        translator.engine_data.update({
+            'response': '$.text',
+            'batch': {
+                'size': 10,
+                'data': {'target': '<target>', 'texts': '<texts>'},
+                'response': '$.translations[*].text'}})
+        CustomTranslate.set_engine_data(translator.engine_data)
+        translator = CustomTranslate()
+        translator.set_source_lang('English')
+        translator.set_target_lang('Chinese')
+        self.assertTrue(translator.is_batch_supported())
+        self.assertEqual(10, translator.batch_size)
+        request = mock_browser.return_value.response.return_value.read. \
+            return_value.decode
+        request.return_value = '{"translations": [{"text": "你好"}]}'
+        self.assertEqual(
+            ['你好', None], translator.translate_batch(['Hello', '"World"']))
+        mock_request.assert_called_with(
+            'https://example.api',
+            b'{"target": "zh", "texts": ["Hello", "\\"World\\""]}',
+            headers={'Content-Type': 'application/json'},
+            timeout=10.0,
+            method='POST')
+
+
+class TestRequestTemplate(unittest.TestCase):
+    def test_fill(self):
+        template = RequestTemplate(
+            {'q': 'Translate to <target>: <text>', 'all': '<texts>'})
+        self.assertEqual(
+            ['<target>', '<text>', '"<texts>"'], template.slots)
+        self.assertEqual(
+            '{"q": "Translate to zh: a", "all": ["a"]}',
+            template.fill({
+                '<target>': 'zh', '<text>': 'a', '"<texts>"': '["a"]'}))
+
+
+class TestResponseParser(unittest.TestCase):
+    def test_parse_json(self):
+        parser = ResponseParser('$.data[0].text')
+        self.assertEqual('json', parser.response_type)
+        self.assertEqual('a', parser.parse('{"data": [{"text": "a"}]}'))
+        with self.assertRaises(Exception):
+            parser.parse('{"data": []}')
+
+    def test_parse_xml(self):
+        parser = ResponseParser('//text')
+        self.assertEqual('xml', parser.response_type)
+        self.assertEqual('a b', parser.parse('<r><text>a <b>b</b></text></r>'))
+        self.assertEqual(
+            ['a', 'b', None], ResponseParser('//text/text()').parse_batch(
+                '<r><text>a</text><text>b</text></r>', 3))
+
+    def test_parse_type(self):
+        parser = ResponseParser('response', 'text')
+        self.assertEqual('{"a": 1}', parser.parse('{"a": 1}'))
+        with self.assertRaises(ValueError):
+            ResponseParser('$.a', 'xml')
+
+    def test_parse_batch(self):
+        parser = ResponseParser('$.texts')
+        self.assertEqual(
+            ['a', None], parser.parse_batch('{"texts": ["a", 1, "c"]}', 2))
+        parser = ResponseParser("[i['text'] for i in response]")
+        self.assertEqual(
+            ['a', 'b'], parser.parse_batch('[{"text":"a"},{"text":"b"}]', 2))
@@ -0,0 +1,47 @@
+import unittest
+
+from ..lib.fuzzy import shingles, similarity, MinHash
+
+
+class TestFuzzy(unittest.TestCase):
+    def test_shingles(self):
+        self.assertEqual({'ab'}, shingles(' AB '))
+        self.assertEqual({'a b', ' b ', 'b c'}, shingles('A  b\nc'))
+
+    def test_similarity(self):
+        self.assertEqual(1.0, similarity(shingles('abcd'), shingles('ABCD')))
+        self.assertEqual(0.5, similarity({'a', 'b'}, {'a', 'b', 'c', 'd'}))
+        self.assertEqual(0.0, similarity(set(), {'a'}))
+
+
+class TestMinHash(unittest.TestCase):
+    def setUp(self):
+        self.minhash = MinHash()
+        self.text = (
+            'It was the best of times, it was the worst of times, it was the '
+            'age of wisdom, it was the age of foolishness.')
+
+    def buckets(self, text, namespace=''):
+        return self.minhash.buckets(
+            self.minhash.signature(shingles(text)), namespace)
+
+    def test_signature(self):
+        signature = self.minhash.signature(shingles('a'))
+        self.assertEqual(32, len(signature))
+        # The empty bins are filled from the one on the right.
+        self.assertEqual(
+            1, len(set(value & 0xFFFFFFFF for value in signature)))
+
+    def test_buckets(self):
+        buckets = self.buckets(self.text)
+        self.assertEqual(8, len(buckets))
+        self.assertEqual(list(range(8)), [bucket >> 56 for bucket in buckets])
+        self.assertEqual(buckets, self.buckets(self.text))
+        self.assertFalse(set(buckets) & set(self.buckets(self.text, 'a')))
+
+    def test_buckets_similar(self):
+        buckets = set(self.buckets(self.text))
+        similar = self.text.replace('times,', 'times;', 1)
+        self.assertTrue(buckets & set(self.buckets(similar)))
+        different = 'A completely different sentence about something else.'
+        self.assertFalse(buckets & set(self.buckets(different)))
@@ -0,0 +1,40 @@
+import unittest
+
+from ..lib.hedging import HedgePolicy
+
+
+class TestHedgePolicy(unittest.TestCase):
+    def test_get_delay(self):
+        policy = HedgePolicy(percentile=0.9, min_samples=5)
+        for latency in (5, 1, 4, 2):
+            policy.record(latency)
+        self.assertIsNone(policy.get_delay())
+        policy.record(3)
+        self.assertEqual(5, policy.get_delay())
+        for latency in range(6, 11):
+            policy.record(latency)
+        self.assertEqual(9, policy.get_delay())
+        self.assertEqual(3, policy.requests)
+
+    def test_window(self):
+        policy = HedgePolicy(percentile=1.0, min_samples=1, window=2)
+        for latency in (9, 1, 2):
+            policy.record(latency)
+        self.assertEqual(2, policy.get_delay())
+
+    def test_allow(self):
+        policy = HedgePolicy(budget=0.1)
+        self.assertFalse(policy.allow())
+        for _ in range(10):
+            policy.get_delay()
+        self.assertTrue(policy.allow())
+        self.assertFalse(policy.allow())
+        for _ in range(10):
+            policy.get_delay()
+        self.assertTrue(policy.allow())
+        self.assertEqual(2, policy.hedges)
+
+    def test_win(self):
+        policy = HedgePolicy()
+        policy.win()
+        self.assertEqual(1, policy.wins)
@@ -0,0 +1,36 @@
+import unittest
+
+from ..lib.jsonpath import JSONPath
+
+
+load_translations()
+
+
+class TestJSONPath(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'translations': [
+                {'text': 'a', 'lang': 'de'}, {'text': 'b', 'lang': 'fr'}],
+            'odd key': {'a.b': 1}}
+
+    def test_find(self):
+        self.assertEqual([self.data], JSONPath('$').find(self.data))
+        self.assertEqual(
+            ['a'], JSONPath('$.translations[0].text').find(self.data))
+        self.assertEqual(
+            ['b'], JSONPath("$['translations'][-1]['text']").find(self.data))
+        self.assertEqual(
+            ['a', 'b'], JSONPath('$.translations[*].text').find(self.data))
+        self.assertEqual(
+            ['a', 'de'], JSONPath('$.translations[0].*').find(self.data))
+        self.assertEqual([1], JSONPath('$["odd key"]["a.b"]').find(self.data))
+
+    def test_find_missing(self):
+        self.assertEqual([], JSONPath('$.missing.text').find(self.data))
+        self.assertEqual([], JSONPath('$.translations[2]').find(self.data))
+        self.assertEqual([], JSONPath('$.translations.text').find(self.data))
+
+    def test_invalid(self):
+        for expression in ('translations', '$.translations[', '$[a]'):
+            with self.subTest(expression=expression):
+                self.assertRaises(ValueError, JSONPath, expression)
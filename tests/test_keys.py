@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch, Mock
+
+from ..lib.keys import ApiKey, ApiKeyPool
+from ..lib.exception import NoAvailableApiKey
+
+
+module_name = 'calibre_plugins.ebook_translator.lib.keys'
+
+
+class TestApiKey(unittest.TestCase):
+    def test_remaining(self):
+        key = ApiKey('a')
+        self.assertIsNone(key.remaining)
+        key.used, key.limit = 25, 100
+        self.assertEqual(0.75, key.remaining)
+        key.used = 120
+        self.assertEqual(0.0, key.remaining)
+
+    def test_masked(self):
+        self.assertEqual('***', ApiKey('abc').masked())
+        self.assertEqual(
+            'sk-1...wxyz', ApiKey('sk-123456789wxyz').masked())
+
+
+@patch(module_name + '.time')
+class TestApiKeyPool(unittest.TestCase):
+    def test_spread_requests(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b', 'c'])
+        keys = [pool.acquire()[0].key for _ in range(6)]
+        self.assertEqual(['a', 'b', 'c', 'a', 'b', 'c'], keys)
+        self.assertEqual([2, 2, 2], [key.in_flight for key in pool.keys])
+
+    def test_least_busy(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'])
+        a, _delay = pool.acquire()
+        b, _delay = pool.acquire()
+        pool.release(b)
+        self.assertIs(b, pool.acquire()[0])
+        self.assertEqual((1, 1), (a.in_flight, b.in_flight))
+        self.assertEqual(1, b.requests)
+
+    @patch('calibre_plugins.ebook_translator.lib.limiter.time')
+    def test_request_rate(self, mock_limiter_time, mock_time):
+        mock_time.time.return_value = 100.0
+        mock_limiter_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'], request_rate=0.5)
+        self.assertEqual(0.0, pool.acquire()[1])
+        self.assertEqual(0.0, pool.acquire()[1])
+        # Both keys have spent their budget, the earliest to be ready wins.
+        key, delay = pool.acquire()
+        self.assertEqual(('a', 2.0), (key.key, delay))
+        key, delay = pool.acquire()
+        self.assertEqual(('b', 2.0), (key.key, delay))
+
+    def test_max_in_flight(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'], max_in_flight=1)
+        a, _delay = pool.acquire()
+        pool.acquire()
+        self.assertEqual((None, 0.1), pool.acquire())
+        pool.release(a)
+        self.assertIs(a, pool.acquire()[0])
+
+    def test_cooldown(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'], cooldown=30)
+        a, _delay = pool.acquire()
+        b, _delay = pool.acquire()
+        pool.release(a, Mock(code=429))
+        pool.release(b, Mock(code=429), hint=5)
+        self.assertEqual((130.0, 105.0), (a.cooldown_until, b.cooldown_until))
+        self.assertEqual((None, 5.0), pool.acquire())
+        mock_time.time.return_value = 105.0
+        self.assertIs(b, pool.acquire()[0])
+        self.assertEqual(1, a.failures)
+
+    def test_no_cooldown_for_other_errors(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'])
+        a, _delay = pool.acquire()
+        pool.release(a, Exception('error'))
+        self.assertEqual(0.0, a.cooldown_until)
+        self.assertEqual(1, a.failures)
+
+    def test_disable(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'])
+        pool.disable(pool.keys[0])
+        self.assertEqual(1, pool.available())
+        self.assertEqual('b', pool.acquire()[0].key)
+        pool.disable(pool.keys[1])
+        self.assertRaises(NoAvailableApiKey, pool.acquire)
+
+    def test_quota(self, mock_time):
+        mock_time.time.return_value = 100.0
+        pool = ApiKeyPool(['a', 'b'])
+        a, b = pool.keys
+        pool.set_quota(a, 75, 100)
+        pool.set_quota(b, 0, 100)
+        # The key with a quarter of its quota left gets a quarter of the
+        # requests in flight of the other.
+        self.assertEqual(
+            ['b'] * 3, [pool.acquire()[0].key for _ in range(3)])
+        self.assertIs(a, pool.acquire()[0])
+        pool.release(a, chars=25)
+        self.assertEqual(25, a.chars)
+        self.assertTrue(a.disabled)
+        pool.set_quota(b, 100, 100)
+        self.assertTrue(b.disabled)
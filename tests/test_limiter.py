@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import patch
+
+from ..lib.limiter import TokenBucket, RateLimiter, get_rate_limiter
+
+
+module_name = 'calibre_plugins.ebook_translator.lib.limiter'
+
+
+class TestTokenBucket(unittest.TestCase):
+    @patch(module_name + '.time')
+    def test_reserve(self, mock_time):
+        mock_time.time.return_value = 100.0
+        bucket = TokenBucket(2.0, 2)
+        self.assertEqual(0.0, bucket.reserve(1, 100.0))
+        self.assertEqual(0.0, bucket.reserve(1, 100.0))
+        self.assertEqual(0.5, bucket.reserve(1, 100.0))
+        self.assertEqual(1.0, bucket.reserve(1, 100.0))
+        # Refilled for 2 seconds, which pays off the debt only.
+        self.assertEqual(0.0, bucket.reserve(0, 102.0))
+        self.assertEqual(0.0, bucket.reserve(2, 103.0))
+        # Never refilled beyond the capacity.
+        self.assertEqual(0.5, bucket.reserve(3, 110.0))
+
+
+@patch(module_name + '.time')
+class TestRateLimiter(unittest.TestCase):
+    def test_no_limit(self, mock_time):
+        mock_time.time.return_value = 100.0
+        limiter = RateLimiter()
+        for _ in range(10):
+            self.assertEqual(0.0, limiter.reserve(1, 1000, 1000))
+
+    def test_request_rate(self, mock_time):
+        mock_time.time.return_value = 100.0
+        limiter = RateLimiter(request_rate=0.5)
+        self.assertEqual(0.0, limiter.reserve())
+        self.assertEqual(2.0, limiter.reserve())
+        self.assertEqual(4.0, limiter.reserve())
+
+    def test_char_and_token_rate(self, mock_time):
+        mock_time.time.return_value = 100.0
+        limiter = RateLimiter(char_rate=100, token_rate=60)
+        self.assertEqual(0.0, limiter.reserve(1, 100, 10))
+        self.assertEqual(1.0, limiter.reserve(1, 100, 10))
+        # The token budget is the longer wait.
+        self.assertEqual(50.0, limiter.reserve(1, 0, 90))
+
+    def test_pause(self, mock_time):
+        mock_time.time.return_value = 100.0
+        limiter = RateLimiter()
+        limiter.pause(5)
+        limiter.pause(2)
+        self.assertEqual(5.0, limiter.reserve())
+        mock_time.time.return_value = 106.0
+        self.assertEqual(0.0, limiter.reserve())
+
+    def test_configure(self, mock_time):
+        mock_time.time.return_value = 100.0
+        limiter = RateLimiter(request_rate=1)
+        limiter.reserve()
+        buckets = limiter.buckets
+        limiter.configure(1, None, None)
+        self.assertIs(buckets, limiter.buckets)
+        limiter.configure(request_rate=0)
+        self.assertEqual((None, None, None), limiter.buckets)
+
+    def test_acquire(self, mock_time):
+        mock_time.time.return_value = 100.0
+        limiter = RateLimiter(request_rate=1)
+        limiter.acquire()
+        mock_time.sleep.assert_not_called()
+        limiter.acquire()
+        mock_time.sleep.assert_called_once_with(1.0)
+
+    def test_get_rate_limiter(self, mock_time):
+        limiter = get_rate_limiter('Test', 1, 0, 0)
+        self.assertIs(limiter, get_rate_limiter('Test', 2, 0, 0))
+        self.assertEqual((2.0, 0.0, 0.0), limiter.rates)
+        self.assertIsNot(limiter, get_rate_limiter('Other'))
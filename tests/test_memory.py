@@ -0,0 +1,115 @@
+import shutil
+import os.path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ..lib.memory import normalize, TranslationMemory
+
+
+class TestTranslationMemory(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.memory = TranslationMemory(
+            os.path.join(self.dir_path, 'memory.db'))
+        self.addCleanup(self.memory.close)
+
+    def test_normalize(self):
+        self.assertEqual('a b\n\nc', normalize(' a   b\n\nc\n'))
+
+    def test_recall(self):
+        self.memory.memorize('DeepL', 'English', 'German', 'a  b', 'A B')
+        self.assertEqual(
+            ['A B', None, None], self.memory.recall(
+                'DeepL', 'English', 'German', [' a b ', 'a\n\nb', 'c']))
+        self.assertEqual(
+            [None], self.memory.recall('Google', 'English', 'German', ['a b']))
+        self.assertEqual(
+            [None], self.memory.recall('DeepL', 'English', 'French', ['a b']))
+
+        stats = self.memory.get_stats()
+        self.assertEqual(
+            (1, 1, 4), (stats['entries'], stats['hits'], stats['misses']))
+        self.assertAlmostEqual(0.2, stats['hit_rate'])
+
+    def test_memorize_replace(self):
+        self.memory.memorize('DeepL', 'English', 'German', 'a', 'A')
+        self.memory.memorize('DeepL', 'English', 'German', 'a', 'AA')
+        self.assertEqual(
+            ['AA'], self.memory.recall('DeepL', 'English', 'German', ['a']))
+        self.assertEqual((1, 3), (self.memory.count, self.memory.size))
+
+    @patch('calibre_plugins.ebook_translator.lib.memory.time')
+    def test_evict_least_recently_used(self, mock_time):
+        self.memory.max_entries = 10
+        for number in range(10):
+            mock_time.time.return_value = number
+            self.memory.memorize(
+                'DeepL', 'English', 'German', str(number), str(number))
+        mock_time.time.return_value = 10
+        self.memory.recall('DeepL', 'English', 'German', ['0'])
+
+        mock_time.time.return_value = 11
+        self.memory.memorize('DeepL', 'English', 'German', 'a', 'A')
+
+        # Down to nine tenths of the limit, keeping the recent ones.
+        self.assertEqual(9, self.memory.count)
+        translations = self.memory.recall(
+            'DeepL', 'English', 'German', [str(n) for n in range(10)])
+        self.assertEqual(['0', None, None, '3'], translations[:4])
+
+    @patch('calibre_plugins.ebook_translator.lib.memory.time')
+    def test_evict_size(self, mock_time):
+        self.memory.max_size = 10
+        for number, text in enumerate(('ab', 'cd', 'ef')):
+            mock_time.time.return_value = number
+            self.memory.memorize('DeepL', 'English', 'German', text, text)
+        self.assertEqual((2, 8), (self.memory.count, self.memory.size))
+        self.assertEqual(
+            [None, 'cd', 'ef'], self.memory.recall(
+                'DeepL', 'English', 'German', ['ab', 'cd', 'ef']))
+
+    def test_clear(self):
+        self.memory.memorize('DeepL', 'English', 'German', 'a', 'A')
+        self.memory.clear()
+        self.assertEqual(
+            [None], self.memory.recall('DeepL', 'English', 'German', ['a']))
+        self.assertEqual(0, self.memory.get_stats()['entries'])
+
+    def test_search(self):
+        text = 'It was the best of times, it was the worst of times.'
+        self.memory.memorize('DeepL', 'English', 'German', text, '甲')
+        self.memory.memorize('DeepL', 'English', 'German', 'Other text.', '乙')
+
+        similarity, original, translation = self.memory.search(
+            'DeepL', 'English', 'German', text.replace(',', ';'), 0.8)
+        self.assertEqual((original, translation), (text, '甲'))
+        self.assertTrue(0.8 <= similarity < 1.0)
+        self.assertIsNone(self.memory.search(
+            'DeepL', 'English', 'German', text.replace(',', ';'), 0.99))
+        self.assertIsNone(self.memory.search(
+            'DeepL', 'English', 'French', text, 0.8))
+        self.assertIsNone(self.memory.search(
+            'DeepL', 'English', 'German', 'Nothing alike at all.', 0.5))
+
+    @patch('calibre_plugins.ebook_translator.lib.memory.time')
+    def test_search_evicted(self, mock_time):
+        self.memory.max_entries = 2
+        for number, text in enumerate(('abcdef', 'ghijkl', 'uvwxyz')):
+            mock_time.time.return_value = number
+            self.memory.memorize('DeepL', 'English', 'German', text, text)
+        self.assertIsNone(self.memory.search(
+            'DeepL', 'English', 'German', 'abcdef', 0.5))
+        self.assertEqual(
+            [(8,)], self.memory.cursor.execute(
+                'SELECT COUNT(*) FROM fuzzy').fetchall())
+
+    def test_index_existing(self):
+        self.memory.memorize('DeepL', 'English', 'German', 'abcdef', 'A')
+        self.memory.cursor.execute('DROP TABLE fuzzy')
+        self.memory.connection.commit()
+        memory = TranslationMemory(self.memory.file_path)
+        self.addCleanup(memory.close)
+        self.assertEqual(
+            'A', memory.search('DeepL', 'English', 'German', 'abcdef', 1)[2])
@@ -0,0 +1,109 @@
+import io
+import json
+import shutil
+import os.path
+import tempfile
+import unittest
+from unittest.mock import patch, Mock
+
+from mechanize import HTTPError
+
+from ..lib.metrics import (
+    data_size, Histogram, Metrics, MemorySink, JsonLinesSink,
+    PrometheusSink)
+
+
+module_name = 'calibre_plugins.ebook_translator.lib.metrics'
+
+
+class TestFunction(unittest.TestCase):
+    def test_data_size(self):
+        self.assertEqual(0, data_size(None))
+        self.assertEqual(6, data_size('你好'))
+        self.assertEqual(3, data_size(b'abc'))
+        self.assertEqual(5, data_size({'a': 'b c'}))
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantile(self):
+        histogram = Histogram((1.0, 2.0, 4.0))
+        self.assertEqual(0.0, histogram.quantile(0.5))
+        for value in (0.5, 1.0, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual([2, 1, 1, 0], histogram.counts)
+        self.assertEqual(6.0, histogram.sum)
+        self.assertAlmostEqual(1.0, histogram.quantile(0.5))
+        self.assertAlmostEqual(3.0, histogram.quantile(0.875))
+        histogram.observe(10.0)
+        self.assertEqual(4.0, histogram.quantile(1.0))
+
+
+@patch(module_name + '.time')
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.jsonl_path = os.path.join(self.dir_path, 'metrics.jsonl')
+        self.prometheus_path = os.path.join(self.dir_path, 'metrics.prom')
+        self.metrics = Metrics([
+            JsonLinesSink(self.jsonl_path),
+            PrometheusSink(self.prometheus_path)])
+
+    def test_record(self, mock_time):
+        mock_time.time.side_effect = [10.0, 10.0, 10.2, 10.5]
+        metric = self.metrics.start('DeepL', 'sk-1...wxyz', 0, b'abc')
+        metric.begin()
+        metric.respond(Mock(getcode=Mock(return_value=200)))
+        metric.receive(10)
+        metric.finish()
+
+        mock_time.time.side_effect = [11.0, 12.0]
+        error = HTTPError('url', 429, 'Too Many Requests', {}, io.BytesIO())
+        self.metrics.start('DeepL', retry=1).finish(error)
+
+        stats = self.metrics.summary()['DeepL']
+        self.assertEqual(
+            (2, 1, 1, 1, 3, 10),
+            (stats.requests, stats.failures, stats.throttled, stats.retries,
+             stats.bytes_sent, stats.bytes_received))
+        self.assertEqual({200: 1, 429: 1}, dict(stats.statuses))
+        self.assertEqual(2, stats.latency.count)
+        self.assertEqual(1, stats.ttfb.count)
+
+        with open(self.jsonl_path) as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(
+            {'time': 10.0, 'engine': 'DeepL', 'key': 'sk-1...wxyz',
+             'status': 200, 'retry': 0, 'bytes_sent': 3,
+             'bytes_received': 10, 'ttfb': 0.2, 'latency': 0.5,
+             'throttled': False, 'error': None}, lines[0])
+        self.assertEqual(
+            (429, True, 'HTTPError'),
+            (lines[1]['status'], lines[1]['throttled'], lines[1]['error']))
+
+        self.assertFalse(os.path.exists(self.prometheus_path))
+        self.metrics.flush()
+        with open(self.prometheus_path) as file:
+            content = file.read()
+        for line in (
+                'ebook_translator_requests_total{engine="DeepL",status="200"} '
+                '1',
+                'ebook_translator_throttled_total{engine="DeepL"} 1',
+                'ebook_translator_latency_seconds_bucket{engine="DeepL",'
+                'le="0.5"} 1',
+                'ebook_translator_latency_seconds_bucket{engine="DeepL",'
+                'le="+Inf"} 2',
+                'ebook_translator_latency_seconds_count{engine="DeepL"} 2'):
+            self.assertIn(line + '\n', content)
+
+    def test_label(self, mock_time):
+        sink = PrometheusSink(self.prometheus_path)
+        self.assertEqual(r'a\"b\\c\n', sink._label('a"b\\c\n'))
+
+    def test_memory_sink(self, mock_time):
+        mock_time.time.return_value = 0
+        sink = MemorySink()
+        metrics = Metrics([sink])
+        metrics.start('Google').finish()
+        metrics.start('DeepL').finish()
+        self.assertEqual(['DeepL', 'Google'], sorted(sink.engines))
@@ -0,0 +1,151 @@
+import shutil
+import os.path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mechanize import HTTPError
+
+from ..benchmarks.mock_server import MockServer, mark
+from ..lib.tokens import TokenCache
+from ..lib.cache import Paragraph
+from ..lib.metrics import Metrics
+from ..lib.translation import Glossary, Translation
+from ..engines import builtin_engines
+from ..engines.base import Base
+from ..engines.openai import ChatgptTranslate
+from ..engines.anthropic import ClaudeTranslate
+from ..engines.deepl import DeeplTranslate
+from ..engines.google import GoogleFreeTranslate
+from ..engines.microsoft import MicrosoftEdgeTranslate
+
+
+class TestMockServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockServer(secure=False).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__()
+
+    def setUp(self):
+        dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_path)
+        patcher = patch(
+            'calibre_plugins.ebook_translator.engines.microsoft.'
+            'get_token_cache', return_value=TokenCache(
+                os.path.join(dir_path, 'tokens.json')))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server.errors = {}
+        self.server.quotas = {'limited': 10}
+        for counter in ('usage', 'requests', 'statuses'):
+            getattr(self.server, counter).clear()
+
+    def create_translator(self, engine_class, **config):
+        api_key = 'id|secret' if engine_class.api_key_pattern else 'key'
+        engine_class.set_config(dict({'api_keys': [api_key]}, **config))
+        translator = self.server.point(engine_class())
+        lang_codes = engine_class.lang_codes
+        translator.set_source_lang(list(lang_codes.get('source'))[-1])
+        translator.set_target_lang(list(lang_codes.get('target'))[-1])
+        return translator
+
+    def test_mark(self):
+        self.assertEqual(
+            ' [mock] a b\n\n[mock] {{id_1}}\n', mark(' a b\n\n{{id_1}}\n'))
+
+    def test_builtin_engines(self):
+        for engine_class in builtin_engines:
+            for stream in (True, False):
+                with self.subTest(engine=engine_class.name, stream=stream):
+                    translator = self.create_translator(
+                        engine_class, stream=stream)
+                    translation = translator.translate('Hello\n\nWorld!')
+                    self.assertEqual(
+                        '[mock] Hello\n\n[mock] World!',
+                        ''.join(translation))
+                    if engine_class.translate_batch is not \
+                            Base.translate_batch:
+                        self.assertEqual(
+                            ['[mock] a', '[mock] b'],
+                            translator.translate_batch(['a', 'b']))
+
+    def test_metrics(self):
+        metrics = Metrics()
+        translator = self.create_translator(DeeplTranslate)
+        translator.set_metrics(metrics)
+        translator.translate('Hello')
+        self.server.errors = {429: 1.0}
+        with self.assertRaises(Exception):
+            translator.translate('Hello')
+        stats = metrics.summary()[DeeplTranslate.name]
+        self.assertEqual(
+            (2, 1, 1), (stats.requests, stats.failures, stats.throttled))
+        self.assertEqual({200: 1, 429: 1}, dict(stats.statuses))
+        self.assertGreater(stats.bytes_sent, 0)
+        self.assertGreater(stats.bytes_received, 0)
+        self.assertEqual(1, stats.ttfb.count)
+
+    def test_quota(self):
+        translator = self.create_translator(DeeplTranslate)
+        translator.api_key = 'limited'
+        self.assertEqual((0, 10), translator.get_quota())
+        translator.translate('Hello')
+        self.assertEqual((5, 10), translator.get_quota())
+        with self.assertRaises(Exception) as cm:
+            translator.translate('World!')
+        self.assertIn('456', str(cm.exception))
+        self.assertEqual(5, self.server.usage['limited'])
+
+    def test_errors(self):
+        self.server.errors = {429: 1.0}
+        self.server.retry_after = 3
+        translator = self.create_translator(ChatgptTranslate, stream=False)
+        with self.assertRaises(Exception) as cm:
+            translator.translate('Hello')
+        error = cm.exception.__context__
+        self.assertIsInstance(error, HTTPError)
+        self.assertEqual((429, '3'), (error.code, error.hdrs['Retry-After']))
+        self.assertEqual(1, self.server.statuses[429])
+
+    def test_broken_stream(self):
+        self.server.errors = {'break': 1.0}
+        translator = self.create_translator(ClaudeTranslate)
+        translation = translator.translate('Hello World!')
+        with self.assertRaises(Exception) as cm:
+            ''.join(translation)
+        self.assertEqual('The stream ended unexpectedly.', str(cm.exception))
+
+    def test_edge_token(self):
+        translator = self.create_translator(MicrosoftEdgeTranslate)
+        translator.translate('Hello')
+        self.assertEqual(1, self.server.requests['edge_auth'])
+        self.assertTrue(
+            self.server.is_valid_token(translator.access_info['Token']))
+        self.assertFalse(self.server.is_valid_token('a.e30.b'))
+
+        # The job of another book reuses the token.
+        translator = self.create_translator(MicrosoftEdgeTranslate)
+        translator.translate('World!')
+        self.assertEqual(1, self.server.requests['edge_auth'])
+
+    def test_failover_async(self):
+        # The batches of DeepL fail over to an engine without batches.
+        translator = self.create_translator(
+            DeeplTranslate, request_attempt=0, max_error_count=1)
+        self.server.quotas = {translator.api_key: 0}
+        failover = self.create_translator(GoogleFreeTranslate)
+        translation = Translation(translator, Glossary(translator.placeholder))
+        translation.add_failover(
+            Translation(failover, Glossary(failover.placeholder)))
+        paragraphs = [Paragraph(id, None, None, text) for id, text in
+                      enumerate(['Hello', 'World', 'Hello World'])]
+        translation.handle(paragraphs)
+        self.assertEqual(
+            ['[mock] Hello', '[mock] World', '[mock] Hello World'],
+            [paragraph.translation for paragraph in paragraphs])
+        self.assertEqual(
+            [failover.name] * 3,
+            [paragraph.engine_name for paragraph in paragraphs])
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch, Mock
+
+from ..lib.pool import ConnectionPool, PooledResponse
+
+
+module_name = 'calibre_plugins.ebook_translator.lib.pool'
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(pool_size=2, per_host=0, idle_timeout=60)
+
+    def test_acquire_and_reuse(self):
+        connection = Mock()
+        self.assertEqual(
+            (connection, False), self.pool.acquire('a', lambda: connection))
+        self.pool.release('a', connection)
+        self.assertEqual(1, self.pool.idle_count())
+        self.assertEqual(
+            (connection, True), self.pool.acquire('a', Mock))
+        self.assertEqual(0, self.pool.idle_count())
+        self.assertEqual(1, self.pool.created)
+        self.assertEqual(1, self.pool.reused)
+
+    def test_release_not_reusable(self):
+        connection, _reused = self.pool.acquire('a', Mock)
+        self.pool.release('a', connection, False)
+        connection.close.assert_called_once()
+        self.assertEqual(0, self.pool.idle_count())
+
+    def test_pool_size(self):
+        connections = [self.pool.acquire('a', Mock)[0] for _ in range(3)]
+        for connection in connections:
+            self.pool.release('a', connection)
+        self.assertEqual(2, self.pool.idle_count())
+        connections[0].close.assert_called_once()
+        connections[1].close.assert_not_called()
+
+    @patch(module_name + '.time')
+    def test_idle_timeout(self, mock_time):
+        mock_time.time.return_value = 100
+        connection = self.pool.acquire('a', Mock)[0]
+        self.pool.release('a', connection)
+        mock_time.time.return_value = 200
+        self.pool.evict()
+        connection.close.assert_called_once()
+        self.assertEqual(0, self.pool.idle_count())
+
+    def test_per_host(self):
+        self.pool.configure(per_host=1)
+        connection = self.pool.acquire('a', Mock)[0]
+        with self.assertRaises(OSError):
+            self.pool.acquire('a', Mock, timeout=0.01)
+        self.pool.acquire('b', Mock)
+        self.pool.release('a', connection)
+        self.assertEqual(connection, self.pool.acquire('a', Mock)[0])
+
+
+class TestPooledResponse(unittest.TestCase):
+    def test_release_after_consumed(self):
+        response = Mock(will_close=False)
+        release = Mock()
+        response.isclosed.return_value = False
+        pooled_response = PooledResponse(response, release)
+        pooled_response.read(10)
+        release.assert_not_called()
+        response.isclosed.return_value = True
+        pooled_response.read()
+        pooled_response.read()
+        release.assert_called_once_with(True)
+
+    def test_discard_if_dropped(self):
+        release = Mock()
+        response = Mock()
+        response.isclosed.return_value = False
+        pooled_response = PooledResponse(response, release)
+        del pooled_response
+        release.assert_called_once_with(False)
@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import patch
+
+from mechanize import HTTPError
+
+from ..lib.retry import (
+    RetryPolicy, parse_retry_after, parse_duration, parse_reset)
+
+
+module_name = 'calibre_plugins.ebook_translator.lib.retry'
+
+
+def http_error(code, headers={}):
+    return HTTPError('https://example.com', code, '', headers, None)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(2.0, 60.0)
+
+    @patch(module_name + '.random')
+    def test_get_delay_backoff(self, mock_random):
+        mock_random.uniform.side_effect = lambda low, high: high
+        self.assertEqual(2.0, self.policy.get_delay(1))
+        self.assertEqual(4.0, self.policy.get_delay(2))
+        self.assertEqual(16.0, self.policy.get_delay(4, Exception()))
+        self.assertEqual(60.0, self.policy.get_delay(10))
+        mock_random.uniform.assert_called_with(0, 60.0)
+
+    def test_get_delay_jitter(self):
+        for _ in range(100):
+            self.assertTrue(0 <= self.policy.get_delay(3) <= 8.0)
+
+    def test_get_delay_hint(self):
+        error = http_error(429, {'retry-after': '7'})
+        self.assertEqual(7.0, self.policy.get_delay(1, error))
+        error = http_error(429, {'retry-after': '3600'})
+        self.assertEqual(60.0, self.policy.get_delay(1, error))
+
+    def test_get_hint(self):
+        self.assertIsNone(self.policy.get_hint(Exception()))
+        self.assertIsNone(self.policy.get_hint(http_error(500)))
+        self.assertEqual(0.5, self.policy.get_hint(
+            http_error(429, {'retry-after-ms': '500'})))
+        self.assertEqual(6.0, self.policy.get_hint(http_error(429, {
+            'x-ratelimit-reset-requests': '6s',
+            'x-ratelimit-reset-tokens': '20ms'})))
+        self.assertIsNone(self.policy.get_hint(
+            http_error(429, {'retry-after': 'invalid'})))
+        self.assertEqual(3.0, self.policy.get_hint(
+            http_error(503, {'retry-after': '3'})))
+
+    @patch(module_name + '.random')
+    def test_get_hint_not_throttled(self, mock_random):
+        # The reset headers sent with any response do not delay the others.
+        error = http_error(400, {
+            'x-ratelimit-reset-requests': '6s', 'retry-after': '7'})
+        self.assertIsNone(self.policy.get_hint(error))
+        mock_random.uniform.return_value = 1.5
+        self.assertEqual(1.5, self.policy.get_delay(1, error))
+        mock_random.uniform.assert_called_once_with(0, 2.0)
+
+    def test_get_hint_wrapped(self):
+        try:
+            try:
+                raise http_error(429, {'retry-after': '5'})
+            except Exception:
+                raise Exception('Can not parse returned response.')
+        except Exception as e:
+            self.assertEqual(5.0, self.policy.get_hint(e))
+
+
+@patch(module_name + '.time')
+class TestFunction(unittest.TestCase):
+    def test_parse_retry_after(self, mock_time):
+        mock_time.time.return_value = 1445412480.0
+        self.assertEqual(120.0, parse_retry_after('120'))
+        self.assertEqual(
+            10.0, parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT'))
+
+    def test_parse_duration(self, mock_time):
+        self.assertEqual(1.0, parse_duration('1s'))
+        self.assertEqual(360.0, parse_duration('6m0s'))
+        self.assertEqual(0.02, parse_duration('20ms'))
+        self.assertEqual(3661.5, parse_duration('1h1m1.5s'))
+        self.assertEqual(3.0, parse_duration('3'))
+
+    def test_parse_reset(self, mock_time):
+        mock_time.time.return_value = 1700000000.0
+        self.assertEqual(30.0, parse_reset('30'))
+        self.assertEqual(15.0, parse_reset('1700000015'))
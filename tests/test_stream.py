@@ -0,0 +1,108 @@
+import io
+import unittest
+from unittest.mock import patch, Mock
+
+from ..engines.stream import get_reader, EventParser, iter_events
+
+
+try:
+    from http.client import IncompleteRead
+except ImportError:
+    from httplib import IncompleteRead
+
+module_name = 'calibre_plugins.ebook_translator.engines.stream'
+
+
+class Wrapper:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def read(self, size=-1):
+        return b''
+
+
+class Unbuffered(Wrapper):
+    def read1(self, size=-1):
+        return b''
+
+
+class TestGetReader(unittest.TestCase):
+    def test_unbuffered_reader(self):
+        fp = Unbuffered()
+        raw = Wrapper(_sock=fp)
+        raw.readable = lambda: True
+        response = Wrapper(wrapped=Wrapper(fp=io.BufferedReader(raw)))
+        self.assertEqual(fp.read1, get_reader(response))
+
+    def test_fallback(self):
+        response = Wrapper(fp=Wrapper())
+        self.assertEqual(response.read, get_reader(response))
+
+
+class TestEventParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = EventParser()
+
+    def test_feed(self):
+        self.assertEqual(
+            [(None, 'a'), (None, 'b')],
+            self.parser.feed(b'data: a\n\ndata: b\n\n'))
+
+    def test_feed_split(self):
+        self.assertEqual([], self.parser.feed(b'da'))
+        self.assertEqual([], self.parser.feed(b'ta: \xe4\xbd'))
+        self.assertEqual([], self.parser.feed(b'\xa0\n'))
+        self.assertEqual([(None, '你')], self.parser.feed(b'\n'))
+
+    def test_feed_crlf(self):
+        self.assertEqual(
+            [(None, 'a')], self.parser.feed(b'data: a\r\n\r\n'))
+
+    def test_feed_multiline(self):
+        self.assertEqual(
+            [(None, 'a\nb')], self.parser.feed(b'data: a\ndata:b\n\n'))
+
+    def test_feed_event(self):
+        self.assertEqual(
+            [('ping', '{}'), (None, 'a')],
+            self.parser.feed(b'event: ping\ndata: {}\n\ndata: a\n\n'))
+
+    def test_feed_comment(self):
+        self.assertEqual(
+            [], self.parser.feed(b': keep-alive\n\nid: 1\nretry: 5\n\n'))
+
+    def test_flush(self):
+        self.assertEqual([], self.parser.feed(b'data: a\ndata: b'))
+        self.assertEqual([(None, 'a\nb')], self.parser.flush())
+        self.assertEqual([], self.parser.flush())
+
+
+class TestIterEvents(unittest.TestCase):
+    def test_iter_events(self):
+        response = Mock(spec=['read'])
+        response.read.side_effect = [b'data: a\n\nda', b'ta: b\n\n', b'']
+        self.assertEqual(
+            [(None, 'a'), (None, 'b')], list(iter_events(response)))
+        response.read.assert_called_with(8192)
+
+    def test_incomplete_read(self):
+        response = Mock(spec=['read'])
+        response.read.side_effect = [
+            b'data: a\n\n', IncompleteRead(b'data: b\n\ndata: c')]
+        self.assertEqual(
+            [(None, 'a'), (None, 'b'), (None, 'c')],
+            list(iter_events(response)))
+
+    @patch(module_name + '.time')
+    def test_stall_timeout(self, mock_time):
+        mock_time.time.side_effect = [0, 1, 5, 12]
+        response = Mock(spec=['read'])
+        response.read.side_effect = [
+            b'data: a\n\n', b': keep-alive\n\n', b': keep-alive\n\n']
+        events = iter_events(response, stall_timeout=10)
+        self.assertEqual((None, 'a'), next(events))
+        with self.assertRaises(Exception) as cm:
+            next(events)
+        self.assertEqual(
+            'The stream stalled for more than 10 seconds.',
+            str(cm.exception))
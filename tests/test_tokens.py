@@ -0,0 +1,66 @@
+import json
+import time
+import shutil
+import os.path
+import tempfile
+import unittest
+import threading
+from unittest.mock import Mock
+
+from ..lib.tokens import TokenCache
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.file_path = os.path.join(self.dir_path, 'tokens.json')
+        self.cache = TokenCache(self.file_path)
+
+    def test_fetch(self):
+        expires = time.time() + 600
+        renew = Mock(return_value=('a', expires))
+        self.assertEqual(('a', expires), self.cache.fetch('google', renew))
+        self.assertEqual(('a', expires), self.cache.fetch('google', renew))
+        renew.assert_called_once_with()
+
+        # Another process reads the file.
+        other = TokenCache(self.file_path)
+        self.assertEqual(('a', expires), other.get('google'))
+        self.assertIsNone(other.get('edge'))
+
+    def test_fetch_expired(self):
+        self.cache.fetch('google', lambda: ('a', time.time() + 30))
+        self.cache.fetch('edge', lambda: ('b', time.time() - 1))
+        renew = Mock(return_value=('c', time.time() + 600))
+        self.assertEqual('c', self.cache.fetch('google', renew)[0])
+        renew.assert_called_once_with()
+        # The expired tokens are dropped from the file.
+        with open(self.file_path) as file:
+            self.assertEqual(['google'], list(json.load(file)))
+
+    def test_fetch_broken_file(self):
+        with open(self.file_path, 'w') as file:
+            file.write('{"google": ')
+        token, _expires = self.cache.fetch(
+            'google', lambda: ('a', time.time() + 600))
+        self.assertEqual('a', token)
+
+    def test_fetch_concurrently(self):
+        calls = []
+
+        def renew():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'a', time.time() + 600
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            TokenCache(self.file_path).fetch('google', renew)[0]))
+            for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['a'] * 4, results)
+        self.assertEqual(1, len(calls))
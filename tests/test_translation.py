@@ -1,9 +1,18 @@
+import asyncio
 import unittest
-from unittest.mock import patch, Mock, call
+from unittest.mock import patch, Mock, AsyncMock, call
+
+from mechanize import HTTPError
 
 from ..lib.utils import dummy
-from ..lib.translation import Glossary, ProgressBar, Translation
-from ..lib.exception import TranslationCanceled
+from ..lib.cache import Paragraph
+from ..lib.translation import (
+    Glossary, ProgressBar, ParagraphBatch, Translation)
+from ..lib.keys import ApiKeyPool
+from ..lib.hedging import HedgePolicy
+from ..lib.metrics import Metrics
+from ..lib.exception import (
+    TranslationCanceled, TranslationFailed, TranslationDeferred)
 from ..engines.base import Base
 from ..engines.deepl import DeeplTranslate
 
@@ -79,6 +88,7 @@ class TestTranslation(unittest.TestCase):
         self.translator = Mock()
         self.glossary = Mock()
         self.paragraph = Mock()
+        self.paragraph.partial = None
         self.streaming = Mock()
         self.cancel_request = Mock()
         self.translation = Translation(self.translator, self.glossary)
@@ -243,3 +253,527 @@ class TestTranslation(unittest.TestCase):
         mock_time.sleep.assert_not_called()
 
         self.assertEqual('你好呀世界', self.paragraph.translation)
+
+    @patch('calibre_plugins.ebook_translator.lib.translation.time')
+    def test_translate_paragraph_resume(self, mock_time):
+        mock_time.time.return_value = 100.0
+        mock_checkpoint = Mock()
+        self.translation.set_checkpoint(mock_checkpoint)
+        self.translation.retry_policy = Mock()
+        self.translation.retry_policy.get_delay.return_value = 1.0
+        self.paragraph.row = 1
+        self.paragraph.retry = 0
+        self.paragraph.translation = None
+        self.paragraph.original = 'A\n\nB\n\nC\n\n'
+        self.glossary.replace.side_effect = lambda text: text
+        self.glossary.restore.side_effect = lambda text: text
+        self.translator.separator = '\n\n'
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+        self.translator.need_change_api_key.return_value = False
+
+        def broken_stream():
+            yield '甲\n\n乙'
+            raise Exception('The stream ended unexpectedly.')
+        self.translator.translate.return_value = broken_stream()
+        self.assertRaises(
+            TranslationDeferred, self.translation.translate_paragraph,
+            self.paragraph)
+        self.assertEqual('甲\n\n乙', self.paragraph.partial)
+        mock_checkpoint.assert_called_once_with(self.paragraph)
+        self.assertEqual(1, self.paragraph.retry)
+
+        # Only the segments not completed are requested again.
+        self.translator.translate.return_value = (i for i in ['乙\n\n丙'])
+        self.translation.translate_paragraph(self.paragraph)
+        self.translator.translate.assert_called_with('B\n\nC\n\n')
+        self.assertEqual('甲\n\n乙\n\n丙', self.paragraph.translation)
+        self.assertIsNone(self.paragraph.partial)
+
+    def test_resume(self):
+        self.translator.separator = '\n\n'
+        self.paragraph.original = 'A\n\nB\n\nC\n\n'
+        for partial in (None, '', '甲', '\n\n乙', '甲\n\n乙\n\n丙\n\n'):
+            self.paragraph.partial = partial
+            self.assertEqual(
+                ('', 'A\n\nB\n\nC\n\n'),
+                self.translation._resume(self.paragraph))
+        self.paragraph.partial = '甲\n\n\n\n乙\n\n'
+        self.assertEqual(
+            ('甲\n\n\n\n乙\n\n', 'C\n\n'),
+            self.translation._resume(self.paragraph))
+
+    @patch('calibre_plugins.ebook_translator.lib.translation.time')
+    def test_translate_paragraph_async(self, mock_time):
+        mock_time.time.return_value = 100.0
+        self.translation.set_fresh(True)
+        self.translation.retry_policy = Mock()
+        self.translation.retry_policy.get_delay.return_value = 1.5
+        self.paragraph.row = 1
+        self.paragraph.retry = 0
+        self.paragraph.original = 'Hello World'
+        self.glossary.replace.return_value = 'Hello World'
+        self.glossary.restore.side_effect = lambda text: text
+        error = Exception('error')
+        self.translator.translate_async = AsyncMock(
+            side_effect=[error, '你好世界'])
+        self.translator.need_change_api_key.return_value = False
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+        self.translator.name = 'Google'
+
+        loop = asyncio.new_event_loop()
+        # The failed paragraph is deferred instead of waiting for the retry.
+        with self.assertRaises(TranslationDeferred):
+            loop.run_until_complete(
+                self.translation.translate_paragraph_async(self.paragraph))
+        self.translation.retry_policy.get_delay.assert_called_once_with(
+            1, error)
+        self.assertEqual(1, self.paragraph.retry)
+        self.assertEqual(101.5, self.paragraph.not_before)
+
+        loop.run_until_complete(
+            self.translation.translate_paragraph_async(self.paragraph))
+        loop.close()
+
+        self.translator.translate_async.assert_called_with('Hello World')
+        self.assertEqual('你好世界', self.paragraph.translation)
+        self.assertEqual('Google', self.paragraph.engine_name)
+        self.assertFalse(self.paragraph.is_cache)
+
+    def test_translate_paragraph_failed(self):
+        self.translation.set_fresh(True)
+        self.paragraph.retry = 3
+        self.translator.translate.side_effect = Exception('error')
+        self.translator.need_change_api_key.return_value = False
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+
+        with self.assertRaisesRegex(TranslationFailed, 'error'):
+            self.translation.translate_paragraph(self.paragraph)
+
+    def test_pack_paragraphs(self):
+        self.translator.batch_size = 2
+        self.translator.batch_bytes = 10
+        paragraphs = []
+        for original, translation in [
+                ('a', None), ('b', '乙'), ('c', None), ('d', None),
+                ('0123456789', None), ('e', None)]:
+            paragraph = Mock(original=original, translation=translation)
+            paragraphs.append(paragraph)
+
+        batches = self.translation.pack_paragraphs(paragraphs)
+        self.assertEqual(
+            [['a', 'b', 'c'], ['d'], ['0123456789'], ['e']],
+            [[p.original for p in batch.paragraphs] for batch in batches])
+        self.assertEqual([2, 1, 1, 1], [batch.count for batch in batches])
+
+        self.translation.set_fresh(True)
+        batches = self.translation.pack_paragraphs(paragraphs)
+        self.assertEqual(
+            [['a', 'b'], ['c', 'd'], ['0123456789'], ['e']],
+            [[p.original for p in batch.paragraphs] for batch in batches])
+
+    def test_translate_paragraphs(self):
+        paragraphs = [
+            Mock(row=1, original='a', translation=None),
+            Mock(row=2, original='b', translation='乙'),
+            Mock(row=3, original='c', translation=None)]
+        batch = ParagraphBatch()
+        for paragraph in paragraphs:
+            batch.add(paragraph)
+        self.glossary.replace.side_effect = lambda text: text
+        self.glossary.restore.side_effect = lambda text: text
+        self.translator.translate_batch.return_value = ['甲', '丙']
+        self.translator.name = 'DeepL'
+
+        self.translation.translate_paragraphs(batch)
+
+        self.translator.translate_batch.assert_called_once_with(['a', 'c'])
+        self.assertEqual(
+            ['甲', '乙', '丙'], [p.translation for p in paragraphs])
+        self.assertEqual(
+            [False, True, False], [p.is_cache for p in paragraphs])
+
+    def test_translate_paragraphs_mismatch(self):
+        paragraph = Mock(row=1, original='a', translation=None)
+        batch = ParagraphBatch()
+        batch.add(paragraph)
+        self.glossary.replace.side_effect = lambda text: text
+        self.translator.translate_batch.return_value = ['甲', '乙']
+        self.translator.need_change_api_key.return_value = False
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+
+        self.assertRaises(
+            TranslationDeferred, self.translation.translate_paragraphs, batch)
+        self.assertEqual(1, batch.retry)
+
+    @patch('calibre_plugins.ebook_translator.lib.translation.time')
+    def test_translate_paragraph_rate_limited(self, mock_time):
+        self.translation.set_fresh(True)
+        self.translation.rate_limiter = Mock()
+        self.translation.rate_limiter.reserve.return_value = 2.0
+        self.paragraph.row = 1
+        self.paragraph.original = 'Hello World'
+        self.glossary.replace.return_value = 'Hello World'
+        self.glossary.restore.return_value = '你好世界'
+        self.translator.translate.return_value = '你好世界'
+        self.translator.count_tokens.return_value = 3
+
+        self.translation.translate_paragraph(self.paragraph)
+
+        self.translation.rate_limiter.reserve.assert_called_once_with(
+            1, 11, 3)
+        mock_time.sleep.assert_called_once_with(2.0)
+        self.assertEqual('你好世界', self.paragraph.translation)
+
+    @patch('calibre_plugins.ebook_translator.lib.translation.time')
+    def test_translate_paragraph_rate_limit_hint(self, mock_time):
+        mock_time.time.return_value = 100.0
+        self.translation.set_fresh(True)
+        self.translation.rate_limiter = Mock()
+        self.translation.rate_limiter.reserve.return_value = 0
+        self.paragraph.row = 1
+        self.paragraph.retry = 0
+        self.translator.count_tokens.return_value = 3
+        self.paragraph.original = 'Hello World'
+        self.glossary.replace.return_value = 'Hello World'
+        self.translator.need_change_api_key.return_value = False
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+        headers = {'x-ratelimit-reset-requests': '30s'}
+
+        # The reset headers of any response do not pause the other requests.
+        self.translator.translate.side_effect = HTTPError(
+            'https://example.com', 400, '', headers, None)
+        self.assertRaises(
+            TranslationDeferred, self.translation.translate_paragraph,
+            self.paragraph)
+        self.translation.rate_limiter.pause.assert_not_called()
+        self.assertLessEqual(self.paragraph.not_before, 102.0)
+
+        self.translator.translate.side_effect = HTTPError(
+            'https://example.com', 429, '', headers, None)
+        self.assertRaises(
+            TranslationDeferred, self.translation.translate_paragraph,
+            self.paragraph)
+        self.translation.rate_limiter.pause.assert_called_once_with(30.0)
+        self.assertEqual(130.0, self.paragraph.not_before)
+
+    @patch('calibre_plugins.ebook_translator.lib.translation.time')
+    def test_translate_paragraph_api_key_pool(self, mock_time):
+        mock_time.time.return_value = 100.0
+        self.translation.set_fresh(True)
+        self.translation.api_key_pool = ApiKeyPool(['a', 'b'])
+        self.paragraph.row = 1
+        self.paragraph.original = 'Hello World'
+        self.glossary.replace.return_value = 'Hello World'
+        self.glossary.restore.return_value = '你好世界'
+        self.translator.translate.side_effect = [
+            Exception('HTTP Error 401'), '你好世界']
+        self.translator.is_api_key_error.side_effect = \
+            lambda message: '401' in message
+        self.translator.max_error_count = 10
+
+        self.translation.translate_paragraph(self.paragraph)
+
+        # The rejected key is left out and the request is sent again at once.
+        a, b = self.translation.api_key_pool.keys
+        self.assertTrue(a.disabled)
+        self.assertEqual((1, 1), (a.failures, a.requests))
+        self.assertEqual((0, 1, 11), (b.failures, b.requests, b.chars))
+        self.translator.set_request_api_key.assert_has_calls([
+            call('a'), call(None), call('b'), call(None)])
+        self.translator.need_change_api_key.assert_not_called()
+        self.assertEqual('你好世界', self.paragraph.translation)
+
+    def test_translate_paragraph_failover(self):
+        self.translation.set_fresh(True)
+        self.paragraph.row = 1
+        self.paragraph.retry = 3
+        self.paragraph.failover = 0
+        self.paragraph.original = 'Hello World'
+        self.glossary.replace.return_value = 'Hello World'
+        self.translator.translate.side_effect = Exception('error')
+        self.translator.need_change_api_key.return_value = False
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+        self.translator.name = 'DeepL(Pro)'
+        failover_translator = Mock()
+        failover_translator.name = 'Google(Free)'
+        failover_translator.translate.return_value = '你好世界'
+        failover_glossary = Mock()
+        failover_glossary.replace.return_value = 'Hello World'
+        failover_glossary.restore.return_value = '你好世界'
+        failover = Translation(failover_translator, failover_glossary)
+        failover.set_fresh(True)
+        self.translation.add_failover(failover)
+        self.assertIs(failover, self.translation.get_failover())
+        self.assertIsNone(failover.get_failover())
+
+        # The paragraph spills over to the next engine to be retried.
+        self.assertRaises(
+            TranslationDeferred, self.translation.translate_paragraph,
+            self.paragraph)
+        self.assertEqual(
+            (1, 0), (self.paragraph.failover, self.paragraph.retry))
+        self.translation.translate_paragraph(self.paragraph)
+        failover_translator.translate.assert_called_once_with('Hello World')
+        self.assertEqual('你好世界', self.paragraph.translation)
+        self.assertEqual('Google(Free)', self.paragraph.engine_name)
+
+    def test_route(self):
+        failover = Translation(Mock(), Mock())
+        self.translation.add_failover(failover)
+        self.translator.max_error_count = 2
+        paragraph = Mock(failover=0)
+        self.assertIs(self.translation, self.translation._route(paragraph))
+        # Skip the engine with too many errors.
+        self.translation.abort_count = 2
+        self.assertIs(failover, self.translation._route(paragraph))
+        self.assertEqual(1, paragraph.failover)
+        # The last engine is not skipped.
+        failover.translator.max_error_count = 2
+        failover.abort_count = 2
+        self.assertIs(failover, self.translation._route(paragraph))
+
+    def test_split_texts(self):
+        failover = Translation(Mock(), Mock())
+        self.translation.add_failover(failover)
+        texts = ['a', 'b', 'c', '0123456789']
+        self.assertEqual([texts], self.translation._split_texts(texts))
+        failover.translator.is_batch_supported.return_value = True
+        failover.translator.batch_size = 2
+        failover.translator.batch_bytes = 10
+        self.assertEqual(
+            [['a', 'b'], ['c'], ['0123456789']],
+            failover._split_texts(texts))
+        failover.translator.is_batch_supported.return_value = False
+        self.assertEqual(
+            [['a'], ['b'], ['c'], ['0123456789']],
+            failover._split_texts(texts))
+
+    def test_translate_paragraph_hedged(self):
+        self.translation.set_fresh(True)
+        self.translation.hedging = HedgePolicy(budget=1.0, min_samples=1)
+        self.translation.hedging.record(0.01)
+        self.paragraph.original = 'Hello World'
+        self.glossary.replace.return_value = 'Hello World'
+        self.glossary.restore.side_effect = lambda text: text
+        self.translator.is_async_supported.return_value = True
+        calls = []
+
+        async def translate_async(text):
+            calls.append(text)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    calls.append('canceled')
+                    raise
+            return '你好世界 %s' % len(calls)
+        self.translator.translate_async = translate_async
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(
+            self.translation.translate_paragraph_async(self.paragraph))
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+
+        # The duplicate answered first and the slow request was canceled.
+        self.assertEqual('你好世界 2', self.paragraph.translation)
+        self.assertEqual(['Hello World', 'Hello World', 'canceled'], calls)
+        self.assertEqual(
+            (1, 1, 1), (self.translation.hedging.requests,
+                        self.translation.hedging.hedges,
+                        self.translation.hedging.wins))
+
+    def test_translate_paragraphs_missing(self):
+        paragraphs = [
+            Mock(row=1, original='a', translation=None),
+            Mock(row=2, original='b', translation=None),
+            Mock(row=3, original='c', translation=None)]
+        batch = ParagraphBatch()
+        for paragraph in paragraphs:
+            batch.add(paragraph)
+        self.translation.set_fresh(True)
+        self.glossary.replace.side_effect = lambda text: text
+        self.glossary.restore.side_effect = lambda text: text
+        self.translator.translate_batch.side_effect = [
+            ['甲', None, None], [None, '丙'], ['乙']]
+
+        self.translation.translate_paragraphs(batch)
+
+        # Only the missing translations are requested again.
+        self.translator.translate_batch.assert_has_calls([
+            call(['a', 'b', 'c']), call(['b', 'c']), call(['b'])])
+        self.assertEqual(
+            ['甲', '乙', '丙'], [p.translation for p in paragraphs])
+
+    def test_translate_paragraphs_missing_again(self):
+        batch = ParagraphBatch()
+        for original in ('a', 'b'):
+            batch.add(Mock(row=1, original=original, translation=None))
+        self.translation.set_fresh(True)
+        self.glossary.replace.side_effect = lambda text: text
+        self.translator.translate_batch.side_effect = [
+            ['甲', None], [None]]
+        self.translator.need_change_api_key.return_value = False
+        self.translator.request_attempt = 3
+        self.translator.max_error_count = 10
+
+        self.assertRaises(
+            TranslationDeferred, self.translation.translate_paragraphs, batch)
+        self.assertEqual(2, self.translator.translate_batch.call_count)
+
+    def test_deduplicate(self):
+        self.translator.name = 'DeepL'
+        self.translator.get_target_lang.return_value = 'German'
+        paragraphs = [
+            Mock(original='a  b', translation=None),
+            Mock(original='c', translation='丙', engine_name='DeepL',
+                 target_lang='German'),
+            Mock(original='d', translation='丁', engine_name='Google',
+                 target_lang='German'),
+            Mock(original=' a b\n', translation=None),
+            Mock(original='c', translation=None),
+            Mock(original='d', translation=None),
+            Mock(original='a\n\nb', translation=None)]
+
+        unique = self.translation.deduplicate(paragraphs)
+
+        self.assertEqual(
+            [0, 1, 2, 4, 5, 6], [paragraphs.index(p) for p in unique])
+        self.assertEqual('丙', paragraphs[4].translation)
+        self.assertIsNone(paragraphs[5].translation)
+        self.assertEqual(
+            {id(paragraphs[0]): [paragraphs[3]]}, self.translation.duplicates)
+
+        self.translation.set_fresh(True)
+        unique = self.translation.deduplicate(paragraphs)
+        self.assertEqual(
+            [0, 1, 2, 6], [paragraphs.index(p) for p in unique])
+
+    def test_process_translation_duplicates(self):
+        callback = Mock()
+        self.translation.set_callback(callback)
+        self.translation.progress_bar.load(2)
+        leader = Mock(row=1, original='a', translation='甲', error=None,
+                      engine_name='DeepL', target_lang='German',
+                      is_cache=False)
+        duplicate = Mock(row=2, original='a', translation=None)
+        self.translation.duplicates = {id(leader): [duplicate]}
+
+        self.translation.process_translation(leader)
+
+        self.assertEqual('甲', duplicate.translation)
+        self.assertEqual('DeepL', duplicate.engine_name)
+        self.assertIsNone(duplicate.error)
+        callback.assert_has_calls([call(leader), call(duplicate)])
+        self.assertEqual({}, self.translation.duplicates)
+
+    def test_recall(self):
+        memory = Mock()
+        memory.recall.return_value = ['甲', None]
+        self.translation.set_memory(memory)
+        self.translator.name = 'DeepL'
+        self.translator.source_lang = 'English'
+        self.translator.get_target_lang.return_value = 'German'
+        paragraphs = [
+            Mock(original='a', translation=None),
+            Mock(original='b', translation='乙'),
+            Mock(original='c', translation=None)]
+
+        self.assertEqual((1, 0), self.translation.recall(paragraphs))
+        memory.recall.assert_called_once_with(
+            'DeepL', 'English', 'German', ['a', 'c'])
+        self.assertEqual(
+            ['甲', '乙', None], [p.translation for p in paragraphs])
+        self.assertEqual('DeepL', paragraphs[0].engine_name)
+
+        self.translation.set_fresh(True)
+        self.assertEqual((0, 0), self.translation.recall(paragraphs))
+
+    def test_log_metrics(self):
+        metrics = Metrics()
+        metrics.flush = Mock()
+        for status in (200, 429):
+            metric = metrics.start('DeepL', data='abc')
+            metric.status = status
+            metric.finish()
+        self.translation.set_metrics(metrics)
+        self.translation.log = Mock()
+        self.translation.log_metrics()
+        message = self.translation.log.mock_calls[0].args[0]
+        self.assertTrue(message.startswith('Requests to DeepL: 2 (0 failed'))
+        self.assertIn('0.01 KB sent', message)
+        metrics.flush.assert_called_once_with()
+
+    def test_recall_similar(self):
+        memory = Mock()
+        memory.recall.return_value = [None, None]
+        memory.search.side_effect = [(0.9, 'a.', '甲'), None]
+        self.translation.set_memory(memory)
+        self.translation.set_reuse_score(0.85)
+        self.translator.name = 'DeepL'
+        self.translator.source_lang = 'English'
+        self.translator.get_target_lang.return_value = 'German'
+        paragraphs = [
+            Mock(original='a', translation=None),
+            Mock(original='b', translation=None)]
+
+        self.assertEqual((0, 1), self.translation.recall(paragraphs))
+        memory.search.assert_has_calls([
+            call('DeepL', 'English', 'German', 'a', 0.85),
+            call('DeepL', 'English', 'German', 'b', 0.85)])
+        self.assertEqual(['甲', None], [p.translation for p in paragraphs])
+
+    def test_set_translation_memorize(self):
+        memory = Mock()
+        self.translation.set_memory(memory)
+        self.translator.name = 'DeepL'
+        self.translator.source_lang = 'English'
+        self.translator.get_target_lang.return_value = 'German'
+        self.glossary.restore.side_effect = lambda text: text
+        paragraph = Mock(original='a')
+
+        self.translation._set_translation(paragraph, ' 甲 ')
+        self.translation._set_translation(Mock(original='b'), '乙')
+        # The translations are written at once when the job is over.
+        memory.memorize_many.assert_not_called()
+        self.translation.close()
+        memory.memorize_many.assert_called_once_with(
+            'DeepL', 'English', 'German', [('a', '甲'), ('b', '乙')])
+        memory.close.assert_called_once_with()
+        self.assertIsNone(self.translation.memory)
+        self.translation.close()
+
+    def test_handle_write_memory(self):
+        memory = Mock()
+        self.translation.set_memory(memory)
+        self.translation.set_fresh(True)
+        self.translator.name = 'DeepL'
+        self.translator.source_lang = 'English'
+        self.translator.get_target_lang.return_value = 'German'
+        self.translator.concurrency_limit = 1
+        self.translator.get_concurrency_controller.return_value = None
+        self.translator.is_async_supported.return_value = False
+        self.translator.is_batch_supported.return_value = False
+        self.translator.get_rate_limiter.return_value = None
+        self.translator.get_api_key_pool.return_value = None
+        self.translator.get_hedge_policy.return_value = None
+        self.translator.translate.side_effect = ['甲', Exception('error')]
+        self.translator.request_attempt = 0
+        self.translator.max_error_count = 0
+        self.glossary.replace.side_effect = lambda text: text
+        self.glossary.restore.side_effect = lambda text: text
+        paragraphs = [
+            Paragraph(0, 'a', 'a', 'a'), Paragraph(1, 'b', 'b', 'b')]
+
+        # The translations are written even if the job fails.
+        self.translation.set_batch(True)
+        with self.assertRaises(Exception):
+            self.translation.handle(paragraphs)
+        memory.memorize_many.assert_called_once_with(
+            'DeepL', 'English', 'German', [('a', '甲')])
@@ -1,7 +1,9 @@
+import os
+import tempfile
 import unittest
 from types import GeneratorType
 
-from ..lib.utils import uid, trim, chunk, group
+from ..lib.utils import uid, trim, chunk, group, file_digest
 
 
 class TestUtils(unittest.TestCase):
@@ -10,6 +12,16 @@ class TestUtils(unittest.TestCase):
         self.assertEqual('202cb962ac59075b964b07152d234b70', uid(b'123'))
         self.assertEqual('e10adc3949ba59abbe56e057f20f883e', uid('123', '456'))
 
+    def test_file_digest(self):
+        descriptor, file_path = tempfile.mkstemp()
+        self.addCleanup(os.remove, file_path)
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(b'abc' * 1000)
+        self.assertEqual(
+            '5423cbd09c14ddc44315a8f90ac8c133', file_digest(file_path))
+        self.assertEqual(
+            file_digest(file_path), file_digest(file_path, chunk_size=7))
+
     def test_trim(self):
         self.assertEqual('abc', trim('   abc   '))
         self.assertEqual('a b c', trim(' a b c '))
@@ -1,8 +1,11 @@
+from threading import Thread
+
 from calibre.gui2.actions import InterfaceAction
 
 from . import EbookTranslator
 from .lib.utils import uid
 from .lib.ebook import Ebooks
+from .lib.cache import evict_caches
 from .lib.config import get_config, upgrade_config
 from .lib.conversion import ConversionWorker
 from .batch import BatchTranslation
@@ -67,6 +70,8 @@ class EbookTranslatorGui(InterfaceAction):
             self.gui.bookfere_ebook_translator = self.Status()
 
         upgrade_config()
+        # Keep the caches within their limits, without holding up calibre.
+        Thread(target=evict_caches, daemon=True).start()
 
     def advanced_translation_window(self, ebook):
         name = 'advanced_' + uid(ebook.get_input_path())